@@ -0,0 +1,121 @@
+import os
+import tempfile
+import zipfile
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from docx_writer import RawZipWriter, archive_member
+
+# Archives smaller than this stay in memory; larger ones roll over to disk
+SPOOL_MAX_MEMORY = 16 * 1024 * 1024
+
+# Deflate level for members that aren't already compressed
+DEFAULT_COMPRESSLEVEL = 6
+
+# Threads compressing members while letters are rendered (none on one CPU)
+DEFAULT_COMPRESS_THREADS = min(4, os.cpu_count() or 1)
+
+
+def unique_name(name, used):
+    """Return name, or name with a _2, _3... suffix if it is already in used"""
+    if name not in used:
+        used.add(name)
+        return name
+
+    stem, ext = os.path.splitext(name)
+    counter = 2
+    while f"{stem}_{counter}{ext}" in used:
+        counter += 1
+    name = f"{stem}_{counter}{ext}"
+    used.add(name)
+    return name
+
+
+class LetterArchive:
+    """ZIP archive that generated letters are streamed into as they are rendered.
+
+    The archive lives in a spooled temporary file, so nothing is written to the
+    working directory and large batches spill to disk instead of RAM. Entry
+    names are made unique so customers with the same name don't overwrite
+    each other.
+
+    Members already in a compressed format (.docx letters, images...) are
+    stored as they are; others are deflated at compresslevel. With threads,
+    members are compressed on a thread pool while the caller renders the
+    next letters, and written in the order they were added.
+    """
+
+    def __init__(self, compression=zipfile.ZIP_DEFLATED, max_memory=SPOOL_MAX_MEMORY,
+                 compresslevel=DEFAULT_COMPRESSLEVEL, threads=DEFAULT_COMPRESS_THREADS):
+        self.file = tempfile.SpooledTemporaryFile(max_size=max_memory, suffix='.zip')
+        self._writer = RawZipWriter(self.file)
+        self.compresslevel = compresslevel if compression == zipfile.ZIP_DEFLATED else 0
+        self._executor = ThreadPoolExecutor(threads, thread_name_prefix='zip') if threads > 1 else None
+        # Compressed members waiting to be written; bounded so memory stays flat
+        self._pending = deque()
+        self._max_pending = 4 * threads
+        self._reader = None
+        self._names = set()
+        self.names = []
+
+    def _write_ready(self, wait=False):
+        while self._pending and (wait or self._pending[0].done() or len(self._pending) > self._max_pending):
+            self._writer.add(self._pending.popleft().result())
+
+    def add(self, name, data):
+        """Add one letter and return the entry name it was stored under"""
+        name = unique_name(name, self._names)
+        if self._executor is None:
+            self._writer.add(archive_member(name, data, self.compresslevel))
+        else:
+            self._pending.append(self._executor.submit(archive_member, name, data, self.compresslevel))
+            self._write_ready()
+        self.names.append(name)
+        return name
+
+    def __len__(self):
+        return len(self.names)
+
+    def close(self):
+        """Finish the ZIP (write its central directory)"""
+        if self._writer is not None:
+            self._write_ready(wait=True)
+            self._writer.close()
+            self._writer = None
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+    def size(self):
+        self.file.seek(0, os.SEEK_END)
+        return self.file.tell()
+
+    def read(self):
+        """Return the finished archive as bytes"""
+        self.close()
+        self.file.seek(0)
+        return self.file.read()
+
+    def read_member(self, name):
+        """Return the bytes of one stored letter (finishes the archive first)"""
+        self.close()
+        if self._reader is None:
+            self._reader = zipfile.ZipFile(self.file)
+        return self._reader.read(name)
+
+    def discard(self):
+        """Drop the archive (finished or not) and delete its backing file"""
+        if self._executor is not None:
+            self._executor.shutdown(cancel_futures=True)
+            self._executor = None
+        self._pending.clear()
+        self._writer = None
+        if self._reader is not None:
+            self._reader.close()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
@@ -0,0 +1,425 @@
+import argparse
+import hashlib
+import io
+import os
+import shutil
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from archive import DEFAULT_COMPRESS_THREADS, DEFAULT_COMPRESSLEVEL, unique_name
+from checkpoint import CheckpointManifest
+from docx_writer import RawZipReader, RawZipWriter, archive_member, read_raw_members
+from generation import generate_template_letters, template_columns
+from instrumentation import Metrics, report_metrics
+from parallel import DEFAULT_CHUNK_SIZE
+from row_sources import open_row_source
+from sharding import SHARD_BY, parse_shard, shard_rows
+from template_engine import compile_template
+from validation import ERROR_REPORT_NAME, FILENAME_ERRNOS, error_report_csv, preflight
+
+DEFAULT_CHECKPOINT_ROWS = 1000
+MANIFEST_NAME = 'manifest.jsonl'
+PREVIOUS_MANIFEST_NAME = 'manifest.previous.jsonl'
+
+
+def file_hash(path):
+    """SHA-256 of a file's content"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _write_atomic(path, data):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+class FolderOutput:
+    """Writes each letter as its own file in a folder"""
+
+    def __init__(self, folder):
+        self.folder = folder
+        self.manifest_path = os.path.join(folder, MANIFEST_NAME)
+        self.previous_manifest_path = os.path.join(folder, PREVIOUS_MANIFEST_NAME)
+        self.errors_path = os.path.join(folder, ERROR_REPORT_NAME)
+        os.makedirs(folder, exist_ok=True)
+
+    def reset(self):
+        pass
+
+    def has_previous(self, name):
+        return os.path.exists(os.path.join(self.folder, name))
+
+    def write_checkpoint(self, number, letters):
+        """Write the letters; returns {name: error} for those whose file name was refused"""
+        failed = {}
+        # data is None for letters kept unchanged from the previous run
+        for name, data in letters:
+            if data is not None:
+                try:
+                    _write_atomic(os.path.join(self.folder, name), data)
+                except OSError as e:
+                    if e.errno not in FILENAME_ERRNOS:
+                        raise
+                    failed[name] = f"{type(e).__name__}: {e.strerror}"
+        return failed
+
+    def remove_stale(self, names):
+        for name in names:
+            path = os.path.join(self.folder, name)
+            if os.path.exists(path):
+                os.remove(path)
+
+    def finish(self):
+        pass
+
+    def cleanup(self):
+        pass
+
+
+class ZipOutput:
+    """Writes letters into one ZIP, staged as one part file per checkpoint.
+
+    A part only counts once it is fully written and logged in the manifest,
+    so a killed run never leaves a half-written archive behind. finish()
+    splices the parts' compressed entries into the final ZIP. Letters kept
+    from the previous run are copied from the old ZIP without recompressing.
+    .docx letters are stored as they are (they are compressed already); any
+    other member is deflated at compresslevel, on threads when there are
+    several CPUs.
+    """
+
+    def __init__(self, zip_path, compresslevel=DEFAULT_COMPRESSLEVEL, threads=DEFAULT_COMPRESS_THREADS):
+        self.zip_path = zip_path
+        self.compresslevel = compresslevel
+        self.threads = threads
+        self.work_dir = f"{zip_path}.parts"
+        self.manifest_path = f"{zip_path}.{MANIFEST_NAME}"
+        self.previous_manifest_path = f"{zip_path}.{PREVIOUS_MANIFEST_NAME}"
+        self.errors_path = f"{zip_path}.{ERROR_REPORT_NAME}"
+        self._previous_file = None
+        self._previous = None
+        os.makedirs(self.work_dir, exist_ok=True)
+
+    def _previous_zip(self):
+        if self._previous_file is None and os.path.exists(self.zip_path):
+            self._previous_file = open(self.zip_path, 'rb')
+            self._previous = RawZipReader(self._previous_file)
+        return self._previous
+
+    def has_previous(self, name):
+        previous = self._previous_zip()
+        return previous is not None and name in previous
+
+    def reset(self):
+        self.cleanup()
+        os.makedirs(self.work_dir)
+
+    def _part_path(self, number):
+        return os.path.join(self.work_dir, f"part-{number:06d}.zip")
+
+    def write_checkpoint(self, number, letters):
+        tmp_path = f"{self._part_path(number)}.tmp"
+        new = [(name, data) for name, data in letters if data is not None]
+        if self.threads > 1 and len(new) > 1:
+            with ThreadPoolExecutor(self.threads) as executor:
+                members = list(executor.map(
+                    lambda letter: archive_member(*letter, self.compresslevel), new
+                ))
+        else:
+            members = [archive_member(name, data, self.compresslevel) for name, data in new]
+        members = iter(members)
+        with open(tmp_path, 'wb') as f:
+            part = RawZipWriter(f)
+            for name, data in letters:
+                if data is None:
+                    part.add(self._previous_zip().member(name))
+                else:
+                    part.add(next(members))
+            part.close()
+        os.replace(tmp_path, self._part_path(number))
+        # Any name fits in a ZIP entry
+        return {}
+
+    def remove_stale(self, names):
+        # The final ZIP is rebuilt from the parts, so dropped letters just aren't copied
+        pass
+
+    def finish(self):
+        if self._previous_file is not None:
+            self._previous_file.close()
+            self._previous_file = self._previous = None
+        tmp_path = f"{self.zip_path}.tmp"
+        with open(tmp_path, 'wb') as f:
+            writer = RawZipWriter(f)
+            number = 0
+            while os.path.exists(self._part_path(number)):
+                with open(self._part_path(number), 'rb') as part:
+                    for member in read_raw_members(part.read()):
+                        writer.add(member)
+                number += 1
+            writer.close()
+        os.replace(tmp_path, self.zip_path)
+
+    def cleanup(self):
+        shutil.rmtree(self.work_dir, ignore_errors=True)
+
+
+def run_batch(excel_file, template_file, output, letter_date_str, start_row=1, end_row=None,
+              workers=1, chunk_size=DEFAULT_CHUNK_SIZE, checkpoint_rows=DEFAULT_CHECKPOINT_ROWS,
+              restart=False, incremental=False, metrics=None, shard=None, shard_by='row',
+              zip_level=DEFAULT_COMPRESSLEVEL, query=None, check=False, log=print):
+    """Generate template letters for a row range, resuming from the last checkpoint.
+
+    output is an output_letters-style folder, or a path ending in .zip for a
+    single archive (zip_level sets the deflate level of members that aren't
+    already compressed). Returns the manifest.
+
+    With incremental, a finished earlier run into the same output is used as
+    an index: rows whose content, template and date hash the same as last
+    time keep their existing file (or ZIP member) and are not rendered.
+    An instrumentation.Metrics given as metrics collects per-stage timings.
+
+    shard ('K/N') generates only this machine's share of the rows: the K-th
+    contiguous block with shard_by 'row', or the rows whose billing account
+    hashes to K with shard_by 'account'. Shard outputs are combined with
+    merge_shards.py.
+
+    excel_file can also be a CSV, Parquet or SQLite file (see
+    row_sources.open_row_source; query selects the rows of a database).
+    Only the columns the template uses are read.
+
+    Rows that fail to render are quarantined: the run carries on, and they
+    are listed in the manifest and in errors.csv (next to the ZIP for .zip
+    output). With check, the rows are first checked with
+    validation.preflight and the report is logged.
+    """
+    with open(template_file, 'rb') as f:
+        template_bytes = f.read()
+    source = open_row_source(excel_file, query=query)
+    placeholders = compile_template(io.BytesIO(template_bytes)).placeholders
+    source = source.select(template_columns(source.columns, placeholders))
+    total_rows = source.count_rows()
+    end_row = min(end_row or total_rows, total_rows)
+
+    if check:
+        report = preflight(source.columns, source.iter_chunks(chunk_size, start_row, end_row), placeholders)
+        for line in report.lines():
+            log(line)
+
+    if output.lower().endswith('.zip'):
+        target = ZipOutput(output, zip_level)
+    else:
+        target = FolderOutput(output)
+
+    params = {
+        'excel_sha256': file_hash(excel_file),
+        'template_sha256': file_hash(template_file),
+        'date': letter_date_str,
+        'start_row': start_row,
+        'end_row': end_row,
+        'checkpoint_rows': checkpoint_rows,
+    }
+    if query is not None:
+        params['query'] = query
+    # Only rows from first_row to last_row are read by this run
+    range_start, range_end = start_row, end_row
+    account_shard = None
+    if shard:
+        index, count = parse_shard(shard)
+        params['shard'] = f"{index}/{count}"
+        params['shard_by'] = shard_by
+        if shard_by == 'row':
+            range_start, range_end = shard_rows(start_row, end_row, index, count)
+        else:
+            account_shard = (index, count)
+
+    # A finished run with other inputs becomes the index for this one
+    if incremental and not restart and os.path.exists(target.manifest_path):
+        last = CheckpointManifest(target.manifest_path)
+        if last.complete and last.params != params:
+            os.replace(target.manifest_path, target.previous_manifest_path)
+
+    # A fresh run (or --restart) must not pick up leftovers from an older one
+    if restart or not os.path.exists(target.manifest_path):
+        if os.path.exists(target.manifest_path):
+            os.remove(target.manifest_path)
+        target.reset()
+
+    previous = {}
+    if incremental and os.path.exists(target.previous_manifest_path):
+        previous = {
+            entry['key']: entry
+            for entry in CheckpointManifest(target.previous_manifest_path).entries
+            if 'key' in entry and target.has_previous(entry['file'])
+        }
+
+    manifest = CheckpointManifest(target.manifest_path, params)
+    if manifest.complete:
+        target.cleanup()
+        log(f"Nothing to do: {output} is already complete")
+        return manifest
+
+    first_row = range_start + manifest.rows_done
+    total = max(range_end - range_start + 1, 0)
+    if manifest.rows_done:
+        log(f"Resuming at row {first_row} ({manifest.rows_done}/{total} rows already done)")
+    elif shard:
+        log(f"Generating shard {params['shard']} by {shard_by} (rows {range_start}-{range_end})...")
+    else:
+        log(f"Generating {total} letters (rows {start_row}-{end_row})...")
+
+    # New letters must not take a name still held by a letter from the previous run
+    used_names = manifest.names | {entry['file'] for entry in previous.values()}
+    checkpoint_number = manifest.checkpoints
+    pending = []
+    pending_errors = []
+    reused = 0
+    last_row = first_row - 1
+
+    def flush():
+        nonlocal checkpoint_number
+        # A checkpoint covers every row read up to its last letter or
+        # quarantined row, including rows that belong to other shards
+        last = [entry['row'] for entry, _ in pending[-1:]] + [error['row'] for error in pending_errors[-1:]]
+        rows = max(last) - (range_start + manifest.rows_done) + 1
+        letters = [(entry['file'], data) for entry, data in pending]
+        if metrics is None:
+            failed = target.write_checkpoint(checkpoint_number, letters)
+        else:
+            with metrics.stage('write_output'):
+                failed = target.write_checkpoint(checkpoint_number, letters)
+            metrics.count('bytes_written', sum(len(data) for _, data in letters if data is not None))
+        # Letters whose file couldn't be created are quarantined like render failures
+        for entry, _ in pending:
+            if entry['file'] in failed:
+                log(f"✗ Row {entry['row']} quarantined: {failed[entry['file']]}")
+                pending_errors.append({'row': entry['row'], 'file': entry['file'], 'error': failed[entry['file']]})
+        pending_errors.sort(key=lambda error: error['row'])
+        manifest.record([entry for entry, _ in pending if entry['file'] not in failed], rows, pending_errors)
+        checkpoint_number += 1
+        pending.clear()
+        pending_errors.clear()
+        log(f"  Progress: {manifest.rows_done}/{total} rows")
+
+    def track(chunks):
+        nonlocal last_row
+        for frame in chunks:
+            last_row = int(frame.index[-1]) + 1
+            yield frame
+
+    if first_row <= range_end:
+        chunks = track(source.iter_chunks(chunk_size, first_row, range_end))
+        letters = generate_template_letters(
+            template_bytes, source.columns, chunks, letter_date_str, workers=workers,
+            previous={key: entry.get('hash') for key, entry in previous.items()},
+            metrics=metrics, shard=account_shard,
+        )
+        for letter in letters:
+            if letter.error is not None:
+                log(f"✗ Row {letter.row} quarantined: {letter.error}")
+                pending_errors.append({'row': letter.row, 'file': letter.filename, 'error': letter.error})
+                continue
+            if letter.key in previous:
+                # Same row as last time: keep (or overwrite) its old file
+                name = previous[letter.key]['file']
+            else:
+                name = unique_name(letter.filename, used_names)
+            if letter.data is None:
+                reused += 1
+            entry = {'row': letter.row, 'file': name, 'name': letter.filename,
+                     'key': letter.key, 'hash': letter.digest}
+            pending.append((entry, letter.data))
+            if len(pending) >= checkpoint_rows:
+                flush()
+        if pending or pending_errors:
+            flush()
+
+    target.remove_stale(
+        {entry['file'] for entry in previous.values()} - manifest.names
+    )
+    if metrics is None:
+        target.finish()
+    else:
+        with metrics.stage('finish_output'):
+            target.finish()
+    # The last row this run read, none at all for a shard without rows
+    last_row = min(max(last_row, range_start + manifest.rows_done - 1), range_end)
+    manifest.mark_complete(last_row=last_row if last_row >= range_start else None)
+    target.cleanup()
+    if os.path.exists(target.previous_manifest_path):
+        os.remove(target.previous_manifest_path)
+    if reused:
+        log(f"  {reused} unchanged letters kept from the previous run")
+    if manifest.errors:
+        with open(target.errors_path, 'w', encoding='utf-8', newline='') as f:
+            f.write(error_report_csv(manifest.errors))
+        log(f"  {len(manifest.errors)} rows failed and were left out (see {target.errors_path})")
+    elif os.path.exists(target.errors_path):
+        os.remove(target.errors_path)
+    log(f"\n✓ All {len(manifest.entries)} letters generated in '{output}'")
+    return manifest
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Generate letters from a customer data file and a Word template without the UI"
+    )
+    parser.add_argument('excel_file', help="Customer data: Excel, CSV, Parquet or SQLite (.db) file")
+    parser.add_argument('template', help="Word template (.docx) with {PLACEHOLDERS}")
+    parser.add_argument('-o', '--output', default='output_letters',
+                        help="Output folder, or a .zip file for a single archive")
+    parser.add_argument('--date', help="Letter date as YYYY-MM-DD (default: today)")
+    parser.add_argument('--start-row', type=int, default=1, help="First row to generate (1-based)")
+    parser.add_argument('--end-row', type=int, help="Last row to generate (default: last row)")
+    parser.add_argument('--workers', type=int, default=1, help="Number of worker processes")
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE,
+                        help="Rows sent to a worker at a time")
+    parser.add_argument('--checkpoint-rows', type=int, default=DEFAULT_CHECKPOINT_ROWS,
+                        help="Rows between checkpoints")
+    parser.add_argument('--restart', action='store_true',
+                        help="Ignore an existing checkpoint and start from the first row")
+    parser.add_argument('--incremental', action='store_true',
+                        help="Only re-render rows that changed since the last finished run")
+    parser.add_argument('--metrics', nargs='?', const='', metavar='JSON_FILE',
+                        help="Print per-stage timings (and write them as JSON to JSON_FILE)")
+    parser.add_argument('--profile', metavar='PROF_FILE', help="Profile the run with cProfile")
+    parser.add_argument('--zip-level', type=int, choices=range(10), default=DEFAULT_COMPRESSLEVEL,
+                        metavar='0-9', help="Deflate level for ZIP members that aren't already compressed")
+    parser.add_argument('--shard', metavar='K/N',
+                        help="Generate only shard K of N (combine the shards with merge_shards.py)")
+    parser.add_argument('--shard-by', choices=SHARD_BY, default='row',
+                        help="Split rows into contiguous blocks or by Billing Account hash")
+    parser.add_argument('--query', help="SQL query for the rows of a SQLite file (default: its first table)")
+    parser.add_argument('--check', action='store_true',
+                        help="Check the rows for blank values, unreadable amounts and dates and clashing "
+                             "file names before generating")
+    args = parser.parse_args(argv)
+    if args.shard:
+        try:
+            parse_shard(args.shard)
+        except ValueError as e:
+            parser.error(str(e))
+
+    metrics = None
+    if args.metrics is not None or args.profile:
+        metrics = Metrics(profile=bool(args.profile))
+
+    letter_date = datetime.strptime(args.date, '%Y-%m-%d') if args.date else datetime.now()
+    run_batch(
+        args.excel_file, args.template, args.output, letter_date.strftime('%B %d, %Y'),
+        start_row=args.start_row, end_row=args.end_row, workers=args.workers,
+        chunk_size=args.chunk_size, checkpoint_rows=args.checkpoint_rows, restart=args.restart,
+        incremental=args.incremental, metrics=metrics, shard=args.shard, shard_by=args.shard_by,
+        zip_level=args.zip_level, query=args.query, check=args.check,
+    )
+    if metrics is not None:
+        report_metrics(metrics, args.metrics, args.profile)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,363 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+from openpyxl import Workbook
+from docx import Document
+from docx.shared import Inches
+
+from parallel import DEFAULT_CHUNK_SIZE
+from row_sources import ExcelRowSource
+
+# The columns create_sample_data.py writes; the wide variant pads these to 80
+BASE_COLUMNS = [
+    'SSA', 'Billing Account', 'CUSTOMER NAME', 'Accot Subtype', 'Department',
+    'Address', 'Status(Active/Inactive)', 'Outstanding amount in Rs', 'CLOSURE DATE',
+]
+WIDE_COLUMNS = 80
+
+# Template size -> (extra paragraphs, table rows, images)
+TEMPLATE_SIZES = {
+    'small': (0, 6, 0),
+    'medium': (40, 30, 1),
+    'large': (300, 200, 4),
+}
+
+DEFAULT_ROWS = [1000, 10000]
+ALL_ROWS = [1000, 10000, 100000, 500000]
+
+# Median cold start (launch until the Home page has rendered) the
+# `app.spec --fast-start` build should stay under
+STARTUP_TARGET_SECONDS = 2.0
+
+
+def workbook_columns(width):
+    columns = list(BASE_COLUMNS)
+    if width == 'wide':
+        columns += [f"Extra Field {n}" for n in range(1, WIDE_COLUMNS - len(columns) + 1)]
+    return columns
+
+
+def make_workbook(path, rows, width='narrow', seed=0):
+    """Write a synthetic customer workbook (streamed, so 500k rows stay cheap)"""
+    rng = random.Random(seed)
+    columns = workbook_columns(width)
+    extra = len(columns) - len(BASE_COLUMNS)
+    departments = ['Sales', 'Support', 'Billing', 'Operations']
+
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet()
+    sheet.append(columns)
+    for n in range(1, rows + 1):
+        row = [
+            f"SSA-{n % 97:03d}",
+            f"ACC-{n:07d}",
+            f"Customer {rng.choice(['Anil', 'Priya', 'John', 'Mary', 'Ravi'])} {n}",
+            rng.choice(['Premium', 'Standard']),
+            rng.choice(departments),
+            f"{rng.randint(1, 999)} Main Street, City {n % 50}",
+            rng.choice(['Active', 'Inactive']),
+            round(rng.uniform(0, 100000), 2),
+            datetime(2026, rng.randint(1, 12), rng.randint(1, 28)),
+        ]
+        row += [f"value {n}-{k}" for k in range(extra)]
+        sheet.append(row)
+    workbook.save(path)
+
+
+def _image_bytes(rng, size=(240, 180)):
+    from PIL import Image
+
+    # Noise doesn't compress, like the photos and scans real templates carry
+    image = Image.frombytes('RGB', size, rng.randbytes(size[0] * size[1] * 3))
+    buffer = io.BytesIO()
+    image.save(buffer, format='PNG')
+    buffer.seek(0)
+    return buffer
+
+
+def make_template(path, size='small', seed=0):
+    """Write a template in the layout of create_template.py, grown to the given size"""
+    paragraphs, table_rows, images = TEMPLATE_SIZES[size]
+    rng = random.Random(seed)
+
+    doc = Document()
+    doc.add_heading('PAYMENT REMINDER NOTICE', 0)
+    doc.add_paragraph('To,')
+    doc.add_paragraph('{CUSTOMER NAME}')
+    doc.add_paragraph('{Address}')
+    date_para = doc.add_paragraph()
+    date_para.add_run('Date: ').bold = True
+    date_para.add_run('{DATE}')
+    doc.add_paragraph('Dear {SALUTATION},')
+
+    for n in range(paragraphs):
+        doc.add_paragraph(
+            f"Clause {n + 1}: account {{Billing Account}} in {{Department}} shows "
+            f"Rs. {{Outstanding amount in Rs}} outstanding. Please settle it promptly."
+        )
+
+    placeholders = ['{Billing Account}', '{CUSTOMER NAME}', '{Outstanding amount in Rs}',
+                    '{Department}', '{Status(Active/Inactive)}', '{CLOSURE DATE}']
+    table = doc.add_table(rows=table_rows, cols=2)
+    for n, row in enumerate(table.rows):
+        row.cells[0].text = f"Item {n + 1}"
+        row.cells[1].text = placeholders[n % len(placeholders)]
+
+    for _ in range(images):
+        doc.add_picture(_image_bytes(rng), width=Inches(4))
+
+    doc.add_paragraph('Regards,')
+    doc.save(path)
+
+
+def _percentile(values, fraction):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+def _peak_rss_mb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in KB on Linux and bytes on macOS
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+
+@contextlib.contextmanager
+def _timed_calls(owner, name, durations):
+    """Append the duration of every owner.name() call to durations while active"""
+    method = getattr(owner, name)
+
+    def timed(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return method(*args, **kwargs)
+        finally:
+            durations.append(time.perf_counter() - started)
+
+    setattr(owner, name, timed)
+    try:
+        yield
+    finally:
+        setattr(owner, name, method)
+
+
+def _run_app_path(excel_file, template_file, chunk_size, latencies):
+    """The Streamlit template path: generate_template_letters -> LetterArchive"""
+    from archive import LetterArchive
+    from generation import generate_template_letters, template_columns
+    from template_engine import CompiledTemplate, compile_template
+
+    with open(template_file, 'rb') as f:
+        template_bytes = f.read()
+    source = ExcelRowSource(excel_file)
+    # Only the columns the template uses are read, as in the app
+    placeholders = compile_template(io.BytesIO(template_bytes)).placeholders
+    source = source.select(template_columns(source.columns, placeholders))
+
+    archive = LetterArchive()
+    # Letters render in this process, so every template.render() call is one letter's latency
+    with _timed_calls(CompiledTemplate, 'render', latencies):
+        letters = generate_template_letters(
+            template_bytes, source.columns, source.iter_chunks(chunk_size), 'March 01, 2026'
+        )
+        for letter in letters:
+            archive.add(letter.filename, letter.data)
+    archive.close()
+    output_bytes = archive.size()
+    archive.discard()
+    return output_bytes
+
+
+def _run_generate_letters_path(excel_file, chunk_size, latencies):
+    """The generate_letters.py built-in letter path, writing files to a temp folder"""
+    from docx_writer import DocxPackageWriter
+    from generate_letters import LetterSkeletons, create_customer_letters
+
+    # A letter is its document.xml built from the skeletons plus its package
+    built, packaged = [], []
+    with tempfile.TemporaryDirectory() as folder:
+        with _timed_calls(LetterSkeletons, 'render', built), \
+                _timed_calls(DocxPackageWriter, 'render', packaged), \
+                open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            create_customer_letters(excel_file, folder, chunk_size=chunk_size, letter_date_str='March 01, 2026')
+        output_bytes = sum(entry.stat().st_size for entry in os.scandir(folder) if entry.name.endswith('.docx'))
+    latencies.extend(build + package for build, package in zip(built, packaged))
+    return output_bytes
+
+
+def run_case(case):
+    """Run one benchmark case in this process and return its result dict.
+
+    Latency is timed around each letter's render (substitution and
+    packaging), not the reading or writing around it.
+    """
+    latencies = []
+    started = time.perf_counter()
+    if case['path'] == 'app':
+        output_bytes = _run_app_path(case['excel_file'], case['template_file'], case['chunk_size'], latencies)
+    else:
+        output_bytes = _run_generate_letters_path(case['excel_file'], case['chunk_size'], latencies)
+    seconds = time.perf_counter() - started
+
+    result = {key: value for key, value in case.items() if not key.endswith('_file')}
+    result.update({
+        'letters': len(latencies),
+        'seconds': round(seconds, 3),
+        'letters_per_sec': round(len(latencies) / seconds, 1) if seconds else None,
+        'p50_ms': round(_percentile(latencies, 0.50) * 1000, 3) if latencies else None,
+        'p99_ms': round(_percentile(latencies, 0.99) * 1000, 3) if latencies else None,
+        'peak_rss_mb': _peak_rss_mb(),
+        'output_bytes': output_bytes,
+    })
+    return result
+
+
+def _run_case_subprocess(case):
+    # A fresh process per case, so peak RSS belongs to that case alone
+    completed = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), '--case', json.dumps(case)],
+        capture_output=True, text=True, check=True,
+    )
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+def prepare_inputs(data_dir, rows_list, widths, templates, log=print):
+    """Create (or reuse) the synthetic workbooks and templates; returns their paths"""
+    os.makedirs(data_dir, exist_ok=True)
+    workbooks = {}
+    for rows in rows_list:
+        for width in widths:
+            path = os.path.join(data_dir, f"customers_{width}_{rows}.xlsx")
+            if not os.path.exists(path):
+                log(f"Creating {path}...")
+                make_workbook(path, rows, width)
+            workbooks[rows, width] = path
+
+    template_paths = {}
+    for size in templates:
+        path = os.path.join(data_dir, f"template_{size}.docx")
+        if not os.path.exists(path):
+            log(f"Creating {path}...")
+            make_template(path, size)
+        template_paths[size] = path
+    return workbooks, template_paths
+
+
+def run_benchmarks(rows_list, widths, templates, paths, data_dir, chunk_size=DEFAULT_CHUNK_SIZE, log=print):
+    workbooks, template_paths = prepare_inputs(data_dir, rows_list, widths, templates, log)
+
+    cases = []
+    for (rows, width), excel_file in workbooks.items():
+        if 'generate_letters' in paths:
+            cases.append({'path': 'generate_letters', 'rows': rows, 'width': width,
+                          'template': 'built-in', 'chunk_size': chunk_size, 'excel_file': excel_file})
+        if 'app' in paths:
+            for size, template_file in template_paths.items():
+                cases.append({'path': 'app', 'rows': rows, 'width': width, 'template': size,
+                              'chunk_size': chunk_size, 'excel_file': excel_file,
+                              'template_file': template_file})
+
+    results = []
+    for case in cases:
+        log(f"Running {case['path']} / {case['rows']} rows / {case['width']} / {case['template']}...")
+        result = _run_case_subprocess(case)
+        log(f"  {result['letters_per_sec']} letters/sec, p50 {result['p50_ms']} ms, "
+            f"p99 {result['p99_ms']} ms, peak RSS {result['peak_rss_mb']} MB")
+        results.append(result)
+    return results
+
+
+def measure_startup(command, runs=5):
+    """Time runs fresh launches of the app; returns a result dict like the other cases.
+
+    Started outside `streamlit run` (as the EXE is), the app renders its Home
+    page in bare mode and exits, so the time covers unpacking, imports and
+    the first page.
+    """
+    env = dict(os.environ, STREAMLIT_BROWSER_GATHER_USAGE_STATS='false')
+    seconds = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        subprocess.run(command, env=env, capture_output=True, check=True)
+        seconds.append(time.perf_counter() - started)
+    median = _percentile(seconds, 0.50)
+    return {
+        'path': 'startup',
+        'command': command,
+        'runs': runs,
+        'first_seconds': round(seconds[0], 3),
+        'median_seconds': round(median, 3),
+        'max_seconds': round(max(seconds), 3),
+        'target_seconds': STARTUP_TARGET_SECONDS,
+        'within_target': median <= STARTUP_TARGET_SECONDS,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark letter generation on synthetic data")
+    parser.add_argument('--rows', type=int, nargs='+', default=DEFAULT_ROWS,
+                        help=f"Workbook sizes (default: {DEFAULT_ROWS}; full scale: {ALL_ROWS})")
+    parser.add_argument('--widths', nargs='+', choices=['narrow', 'wide'], default=['narrow', 'wide'])
+    parser.add_argument('--templates', nargs='+', choices=list(TEMPLATE_SIZES), default=list(TEMPLATE_SIZES))
+    parser.add_argument('--paths', nargs='+', choices=['app', 'generate_letters'],
+                        default=['app', 'generate_letters'])
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE)
+    parser.add_argument('--data-dir', default='benchmark_data', help="Where synthetic inputs are cached")
+    parser.add_argument('-o', '--output', help="Write the JSON results to this file (default: stdout)")
+    parser.add_argument('--startup', nargs='?', const='app.py', metavar='EXECUTABLE',
+                        help="Time cold starts of a built app (default: app.py from source) instead")
+    parser.add_argument('--startup-runs', type=int, default=5)
+    parser.add_argument('--case', help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.case:
+        with contextlib.redirect_stdout(sys.stderr):
+            result = run_case(json.loads(args.case))
+        print(json.dumps(result))
+        return
+
+    log = (lambda message: print(message, file=sys.stderr))
+    if args.startup:
+        command = [sys.executable, args.startup] if args.startup.endswith('.py') else [args.startup]
+        log(f"Launching {' '.join(command)} {args.startup_runs} times...")
+        result = measure_startup(command, args.startup_runs)
+        log(f"  median {result['median_seconds']}s (first {result['first_seconds']}s), "
+            f"target {STARTUP_TARGET_SECONDS}s: {'✅ met' if result['within_target'] else '❌ missed'}")
+        results = [result]
+    else:
+        results = run_benchmarks(args.rows, args.widths, args.templates, args.paths, args.data_dir,
+                                 args.chunk_size, log)
+    report = {
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'python': sys.version.split()[0],
+        'platform': sys.platform,
+        'cpu_count': os.cpu_count(),
+        'results': results,
+    }
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        log(f"✅ Results written to {args.output}")
+    else:
+        print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
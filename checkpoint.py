@@ -0,0 +1,84 @@
+import json
+import os
+
+
+class CheckpointManifest:
+    """Append-only JSON-lines log of what a batch run has finished.
+
+    The first line records the run parameters; each following line is one
+    checkpoint with the rows it covered, the files it produced and the rows
+    it quarantined because they failed to render. A run that is killed can
+    be started again with the same parameters and carries on after the last
+    recorded checkpoint. With params None an existing manifest
+    is opened as-is, whatever run it was written for.
+    """
+
+    def __init__(self, path, params=None):
+        self.path = path
+        self.params = params
+        self.rows_done = 0
+        self.checkpoints = 0
+        self.entries = []
+        self.errors = []
+        self.complete = False
+        self.last_row = None
+
+        if os.path.exists(path):
+            self._load()
+        else:
+            self._append({'params': params})
+
+    def _load(self):
+        with open(self.path, encoding='utf-8') as f:
+            lines = [json.loads(line) for line in f if line.strip()]
+
+        if lines and self.params is None:
+            self.params = lines[0].get('params')
+        if not lines or lines[0].get('params') != self.params:
+            raise ValueError(
+                f"Checkpoint {self.path} was written for a different run; "
+                "use --restart to start over"
+            )
+
+        for record in lines[1:]:
+            if record.get('complete'):
+                self.complete = True
+                self.last_row = record.get('last_row')
+                continue
+            self.rows_done += record['rows']
+            self.checkpoints += 1
+            self.entries.extend(record['letters'])
+            self.errors.extend(record.get('errors', []))
+
+    def _append(self, record):
+        with open(self.path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(record) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+
+    @property
+    def names(self):
+        return {entry['file'] for entry in self.entries}
+
+    def record(self, letters, rows, errors=()):
+        """Log a finished checkpoint (a list of {'row', 'file', ...} dicts covering rows rows).
+
+        errors lists the {'row', 'file', 'error'} dicts of quarantined rows.
+        """
+        record = {'rows': rows, 'letters': letters}
+        if errors:
+            record['errors'] = list(errors)
+        self._append(record)
+        self.rows_done += rows
+        self.checkpoints += 1
+        self.entries.extend(letters)
+        self.errors.extend(errors)
+
+    def mark_complete(self, last_row=None):
+        """Log that the run finished; last_row is the last data row it read"""
+        record = {'complete': True}
+        if last_row is not None:
+            record['last_row'] = last_row
+        self._append(record)
+        self.complete = True
+        self.last_row = last_row
@@ -0,0 +1,63 @@
+import pandas as pd
+import pytest
+from docx import Document
+from openpyxl import Workbook
+from openpyxl.styles import Font
+
+
+@pytest.fixture
+def template_file(tmp_path):
+    """A small letter template with a placeholder split across runs and one in a table"""
+    doc = Document()
+    doc.add_paragraph("Date: {DATE}")
+    paragraph = doc.add_paragraph("Dear ")
+    paragraph.add_run("{CUSTOMER")
+    paragraph.add_run(" NAME},")
+    paragraph = doc.add_paragraph("Your account ")
+    paragraph.add_run("{Billing Account}").bold = True
+    paragraph.add_run(" owes Rs. {Outstanding amount in Rs}.")
+    table = doc.add_table(rows=1, cols=2)
+    table.cell(0, 0).text = "Address"
+    table.cell(0, 1).text = "{Address}"
+    path = tmp_path / 'template.docx'
+    doc.save(path)
+    return str(path)
+
+
+def customer_rows(count, start=1):
+    """Customer data rows like create_sample_data's"""
+    return [
+        {
+            'CUSTOMER NAME': f"Customer {number}",
+            'Billing Account': f"BA{number:05d}",
+            'Address': f"{number} Main Street",
+            'Outstanding amount in Rs': number * 100.5,
+        }
+        for number in range(start, start + count)
+    ]
+
+
+@pytest.fixture
+def make_data(tmp_path):
+    """Write customer rows to a CSV file and return its path"""
+    def make_data(rows, name='data.csv'):
+        path = tmp_path / name
+        pd.DataFrame(rows).to_csv(path, index=False)
+        return str(path)
+    return make_data
+
+
+@pytest.fixture
+def formatted_sheet(tmp_path):
+    """A workbook with 5 customer rows and formatting on the rows below them, down to row 199"""
+    workbook = Workbook()
+    sheet = workbook.active
+    rows = customer_rows(5)
+    sheet.append(list(rows[0]))
+    for row in rows:
+        sheet.append(list(row.values()))
+    for number in range(len(rows) + 2, 200):
+        sheet.cell(row=number, column=1).font = Font(bold=True)
+    path = tmp_path / 'formatted.xlsx'
+    workbook.save(path)
+    return str(path)
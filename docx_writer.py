@@ -0,0 +1,258 @@
+import io
+import struct
+import time
+import zipfile
+import zlib
+
+# ZIP record layouts (see APPNOTE.TXT sections 4.3.7, 4.3.12 and 4.3.16)
+_LOCAL_HEADER = struct.Struct('<4s5H3L2H')
+_CENTRAL_HEADER = struct.Struct('<4s6H3L5H2L')
+_END_RECORD = struct.Struct('<4s4H2LH')
+_ZIP64_END_RECORD = struct.Struct('<4sQ2H2L4Q')
+_ZIP64_END_LOCATOR = struct.Struct('<4sLQL')
+_ZIP64_OFFSET_EXTRA = struct.Struct('<2HQ')
+
+_ZIP64_LIMIT = 0xFFFFFFFF
+_ZIP64_COUNT_LIMIT = 0xFFFF
+
+_UTF8_FLAG = 0x800
+
+# Formats that are compressed already; deflating them again costs CPU for next to no gain
+COMPRESSED_EXTENSIONS = ('.docx', '.xlsx', '.pptx', '.zip', '.png', '.jpg', '.jpeg', '.gif', '.pdf')
+
+
+def _dos_datetime(date_time):
+    year, month, day, hour, minute, second = date_time
+    dos_date = (year - 1980) << 9 | month << 5 | day
+    dos_time = hour << 11 | minute << 5 | second // 2
+    return dos_time, dos_date
+
+
+def deflate(data, level=zlib.Z_DEFAULT_COMPRESSION):
+    """Raw-deflate bytes the way zipfile stores ZIP_DEFLATED members"""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, -15)
+    return compressor.compress(data) + compressor.flush()
+
+
+class ZipMember:
+    """One archive member kept as ready-to-write compressed bytes"""
+
+    def __init__(self, name, date_time, compress_type, crc, file_size, data, flag_bits=0):
+        self.name = name
+        self.date_time = date_time
+        self.compress_type = compress_type
+        self.crc = crc
+        self.file_size = file_size
+        self.data = data
+        self.flag_bits = flag_bits
+
+
+def compress_member(name, data, level=zlib.Z_DEFAULT_COMPRESSION, date_time=None, flag_bits=0):
+    """Deflate uncompressed bytes into a ZipMember ready for RawZipWriter"""
+    return ZipMember(
+        name,
+        date_time or time.localtime()[:6],
+        zipfile.ZIP_DEFLATED,
+        zlib.crc32(data),
+        len(data),
+        deflate(data, level),
+        flag_bits,
+    )
+
+
+def store_member(name, data, date_time=None, flag_bits=0):
+    """Wrap uncompressed bytes as a stored ZipMember ready for RawZipWriter"""
+    return ZipMember(
+        name,
+        date_time or time.localtime()[:6],
+        zipfile.ZIP_STORED,
+        zlib.crc32(data),
+        len(data),
+        data,
+        flag_bits,
+    )
+
+
+def archive_member(name, data, level=zlib.Z_DEFAULT_COMPRESSION):
+    """Member for an output archive: stored if its format is already compressed, else deflated"""
+    if level == 0 or name.lower().endswith(COMPRESSED_EXTENSIONS):
+        return store_member(name, data)
+    return compress_member(name, data, level)
+
+
+class DocxPackageWriter:
+    """Writes .docx packages that reuse the template's compressed parts.
+
+    The template zip is read once and every member is kept exactly as stored
+    (already compressed). When a letter is written, unchanged members are
+    copied straight into the output and only the per-row parts handed to
+    write() are compressed.
+    """
+
+    def __init__(self, template_file, compresslevel=zlib.Z_DEFAULT_COMPRESSION):
+        if hasattr(template_file, 'read'):
+            template_file.seek(0)
+            blob = template_file.read()
+        else:
+            with open(template_file, 'rb') as f:
+                blob = f.read()
+
+        self.compresslevel = compresslevel
+        self.members = read_raw_members(blob)
+
+    @property
+    def names(self):
+        return [member.name for member in self.members]
+
+    def read(self, name):
+        """Return the uncompressed bytes of a template member"""
+        for member in self.members:
+            if member.name == name:
+                if member.compress_type == zipfile.ZIP_DEFLATED:
+                    return zlib.decompress(member.data, -15)
+                if member.compress_type == zipfile.ZIP_STORED:
+                    return member.data
+                raise ValueError(f"Unsupported compression in template member {name}")
+        raise KeyError(name)
+
+    def _compressed(self, member, data):
+        return compress_member(member.name, data, self.compresslevel, member.date_time, member.flag_bits)
+
+    def write(self, filename, parts):
+        """Write a .docx to a path or binary file object.
+
+        parts maps member names (e.g. 'word/document.xml') to the new
+        uncompressed bytes for this letter; all other members are copied from
+        the template as-is.
+        """
+        members = [
+            self._compressed(member, parts[member.name]) if member.name in parts else member
+            for member in self.members
+        ]
+
+        if hasattr(filename, 'write'):
+            _write_zip(filename, members)
+        else:
+            with open(filename, 'wb') as f:
+                _write_zip(f, members)
+
+    def render(self, parts):
+        """Return the .docx bytes for one letter"""
+        buffer = io.BytesIO()
+        self.write(buffer, parts)
+        return buffer.getvalue()
+
+
+class RawZipReader:
+    """Reads members of an existing zip one at a time as raw compressed bytes"""
+
+    def __init__(self, f):
+        self._f = f
+        with zipfile.ZipFile(f) as source_zip:
+            self.infos = source_zip.infolist()
+        self._by_name = {info.filename: info for info in self.infos}
+
+    def __contains__(self, name):
+        return name in self._by_name
+
+    def member(self, name_or_info):
+        info = self._by_name[name_or_info] if isinstance(name_or_info, str) else name_or_info
+        # Skip the local header to reach the raw compressed bytes
+        self._f.seek(info.header_offset)
+        header = self._f.read(_LOCAL_HEADER.size)
+        name_length, extra_length = struct.unpack_from('<2H', header, 26)
+        self._f.seek(name_length + extra_length, io.SEEK_CUR)
+        return ZipMember(
+            info.filename,
+            info.date_time,
+            info.compress_type,
+            info.CRC,
+            info.file_size,
+            self._f.read(info.compress_size),
+            info.flag_bits & _UTF8_FLAG,
+        )
+
+
+def read_raw_members(blob):
+    """Return the members of a zip (given as bytes) with their compressed data"""
+    reader = RawZipReader(io.BytesIO(blob))
+    return [reader.member(info) for info in reader.infos]
+
+
+class RawZipWriter:
+    """Writes a zip sequentially from members that are already compressed.
+
+    Switches to ZIP64 records when the archive passes 65535 entries or 4 GB,
+    so merged batch archives of any size stay readable.
+    """
+
+    def __init__(self, f):
+        self._f = f
+        self._offset = 0
+        self._central = []
+
+    def add(self, member):
+        if len(member.data) >= _ZIP64_LIMIT or member.file_size >= _ZIP64_LIMIT:
+            raise ValueError(f"Member {member.name} is too large for a letter archive")
+
+        name = member.name.encode('utf-8')
+        flag_bits = member.flag_bits
+        if not name.isascii():
+            flag_bits |= _UTF8_FLAG
+        dos_time, dos_date = _dos_datetime(member.date_time)
+        version = 20
+
+        header = _LOCAL_HEADER.pack(
+            b'PK\x03\x04', version, flag_bits, member.compress_type, dos_time, dos_date,
+            member.crc, len(member.data), member.file_size, len(name), 0,
+        )
+        self._f.write(header)
+        self._f.write(name)
+        self._f.write(member.data)
+
+        # Offsets past 4 GB go in a ZIP64 extra field of the central record
+        offset, extra, central_version = self._offset, b'', version
+        if offset >= _ZIP64_LIMIT:
+            extra = _ZIP64_OFFSET_EXTRA.pack(0x0001, 8, offset)
+            offset, central_version = _ZIP64_LIMIT, 45
+
+        self._central.append(_CENTRAL_HEADER.pack(
+            b'PK\x01\x02', central_version, central_version, flag_bits, member.compress_type,
+            dos_time, dos_date, member.crc, len(member.data), member.file_size, len(name),
+            len(extra), 0, 0, 0, 0, offset,
+        ) + name + extra)
+        self._offset += len(header) + len(name) + len(member.data)
+
+    def __len__(self):
+        return len(self._central)
+
+    def close(self):
+        """Write the central directory; the zip is complete afterwards"""
+        central_offset = self._offset
+        central_size = 0
+        for record in self._central:
+            self._f.write(record)
+            central_size += len(record)
+
+        count = len(self._central)
+        if count >= _ZIP64_COUNT_LIMIT or central_offset >= _ZIP64_LIMIT or central_size >= _ZIP64_LIMIT:
+            zip64_end_offset = central_offset + central_size
+            self._f.write(_ZIP64_END_RECORD.pack(
+                b'PK\x06\x06', _ZIP64_END_RECORD.size - 12, 45, 45, 0, 0,
+                count, count, central_size, central_offset,
+            ))
+            self._f.write(_ZIP64_END_LOCATOR.pack(b'PK\x06\x07', 0, zip64_end_offset, 1))
+            count = min(count, _ZIP64_COUNT_LIMIT)
+            central_size = min(central_size, _ZIP64_LIMIT)
+            central_offset = min(central_offset, _ZIP64_LIMIT)
+
+        self._f.write(_END_RECORD.pack(
+            b'PK\x05\x06', 0, 0, count, count, central_size, central_offset, 0,
+        ))
+
+
+def _write_zip(f, members):
+    writer = RawZipWriter(f)
+    for member in members:
+        writer.add(member)
+    writer.close()
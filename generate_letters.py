@@ -1,74 +1,92 @@
-import pandas as pd
 from docx import Document
-from docx.shared import Pt, Inches
+from docx.shared import Pt
 from docx.enum.text import WD_ALIGN_PARAGRAPH
 from datetime import datetime
+import argparse
+import io
 import os
+import re
+import time
 import uuid
+from xml.sax.saxutils import escape, unescape
 
-def create_customer_letters(excel_file, output_folder='output_letters'):
-    """
-    Read customer data from Excel and generate personalized Word documents.
+from docx_writer import DocxPackageWriter
+from generation import RenderedLetter, failed_letter
+from incremental import inputs_hash, letter_key, load_index, row_digest, save_index
+from instrumentation import Metrics, report_metrics, timed_iter
+from merged_output import MergedVolumes, volume_name
+from parallel import DEFAULT_CHUNK_SIZE, ordered_pool_map
+from placeholders import AMOUNT_COLUMN, AMOUNT_FIELD, DATE_FIELD, NAME_COLUMN, SALUTATION_FIELD, PlaceholderIndex
+from row_sources import open_row_source
+from template_engine import split_document_xml
+from validation import ERROR_REPORT_NAME, FILENAME_ERRNOS, error_report_csv
+
+def _blank_package():
+    """The blank document's package and the head/tail of its main document part"""
+    doc = Document()
+    blank = io.BytesIO()
+    doc.save(blank)
+    head, _, tail = split_document_xml(doc.part.blob.decode('utf-8'))
+    return DocxPackageWriter(blank), doc.part.partname.lstrip('/'), head, tail
+
+def _init_worker(columns, previous, instrument=False, merged=False, letter_date_str=None):
+    """State of one run for _render_chunk, built once per worker"""
+    worker = {}
+    worker['index'] = PlaceholderIndex(columns)
+    worker['previous'] = previous
+    worker['letter_date'] = letter_date_str or datetime.now().strftime('%B %d, %Y')
+    # The date is part of every letter's inputs
+    worker['run_hash'] = inputs_hash(worker['letter_date'])
+    worker['metrics'] = Metrics() if instrument else None
+    worker['merged'] = merged
     
-    Expected Excel columns: SSA, Billing Account, CUSTOMER NAME, Accot Subtype, 
-                          Department, Address, Status(Active/Inactive), 
-                          Outstanding amount in Rs, CLOSURE DATE
-    """
+    # Every letter shares the blank document's package (styles, theme, fonts...);
+    # keep those parts compressed once and only write each letter's body
+    worker['package_writer'], worker['partname'] = _blank_package()[:2]
+    worker['skeletons'] = LetterSkeletons()
+    return worker
+
+def build_letter(customer):
+    """Build the Word document for one customer (a prepared row from PlaceholderIndex.record)"""
+    # Create a new Document
+    doc = Document()
     
-    # Create output folder if it doesn't exist
-    if not os.path.exists(output_folder):
-        os.makedirs(output_folder)
+    # Add header (sender's details - can be customized)
+    header = doc.add_paragraph()
+    header.alignment = WD_ALIGN_PARAGRAPH.LEFT
+    header.add_run("[Your Company Name]\n[Your Address]\n[City, State, Pin]\n[Email/Phone]").font.size = Pt(10)
     
-    # Read Excel file
-    try:
-        df = pd.read_excel(excel_file)
-    except FileNotFoundError:
-        print(f"Error: {excel_file} not found!")
-        return
+    # Add date
+    doc.add_paragraph(f"\nDate: {customer[DATE_FIELD]}\n")
     
-    print(f"Found {len(df)} customers. Generating letters...\n")
+    # Add recipient address
+    recipient = doc.add_paragraph()
+    recipient.alignment = WD_ALIGN_PARAGRAPH.LEFT
+    customer_name = customer.get('CUSTOMER NAME') or 'Valued Customer'
+    recipient_text = f"{customer_name}\n"
+    if customer.get('Address'):
+        recipient_text += f"{customer['Address']}\n"
+    recipient.add_run(recipient_text).font.size = Pt(11)
     
-    # Process each customer
-    for idx, customer in df.iterrows():
-        # Create a new Document
-        doc = Document()
-        
-        # Add header (sender's details - can be customized)
-        header = doc.add_paragraph()
-        header.alignment = WD_ALIGN_PARAGRAPH.LEFT
-        header.add_run("[Your Company Name]\n[Your Address]\n[City, State, Pin]\n[Email/Phone]").font.size = Pt(10)
-        
-        # Add date
-        doc.add_paragraph(f"\nDate: {datetime.now().strftime('%B %d, %Y')}\n")
-        
-        # Add recipient address
-        recipient = doc.add_paragraph()
-        recipient.alignment = WD_ALIGN_PARAGRAPH.LEFT
-        customer_name = customer.get('CUSTOMER NAME', 'Valued Customer')
-        recipient_text = f"{customer_name}\n"
-        if pd.notna(customer.get('Address')):
-            recipient_text += f"{customer['Address']}\n"
-        recipient.add_run(recipient_text).font.size = Pt(11)
-        
-        # Add salutation
-        salutation_name = str(customer_name).split()[0] if pd.notna(customer_name) else "Valued Customer"
-        doc.add_paragraph(f"\nDear {salutation_name},")
-        
-        # Add body of letter based on status
-        status = str(customer.get('Status(Active/Inactive)', 'Active')).lower().strip()
-        outstanding = customer.get('Outstanding amount in Rs', 0)
-        billing_account = customer.get('Billing Account', '')
-        department = customer.get('Department', '')
-        
-        body_text = ""
-        
-        if 'inactive' in status:
-            body_text = f"""We are writing to inform you that your account is currently inactive.
+    # Add salutation
+    salutation_name = customer[SALUTATION_FIELD]
+    doc.add_paragraph(f"\nDear {salutation_name},")
+    
+    # Add body of letter based on status
+    status = str(customer.get('Status(Active/Inactive)', 'Active')).lower().strip()
+    outstanding = customer[AMOUNT_FIELD]
+    billing_account = customer.get('Billing Account', '')
+    department = customer.get('Department', '')
+    
+    body_text = ""
+    
+    if 'inactive' in status:
+        body_text = f"""We are writing to inform you that your account is currently inactive.
 
 Account Details:
 • Billing Account: {billing_account}
 • Department: {department}
-• Outstanding Amount: ₹{outstanding:,.2f}
+• Outstanding Amount: ₹{outstanding}
 
 If your account has been inactive due to closure or completion of services, please disregard this notice. However, if you have any outstanding payments, please settle them at your earliest convenience.
 
@@ -82,14 +100,14 @@ If you have any questions regarding your account or need to reactivate your serv
 
 Thank you for your attention to this matter.
 """
-        
-        else:  # Active status
-            body_text = f"""We are reaching out regarding your account status and outstanding balance.
+    
+    else:  # Active status
+        body_text = f"""We are reaching out regarding your account status and outstanding balance.
 
 Account Details:
 • Billing Account: {billing_account}
 • Department: {department}
-• Outstanding Amount: ₹{outstanding:,.2f}
+• Outstanding Amount: ₹{outstanding}
 • Account Status: Active
 
 Please review your account and ensure all payments are up to date. If you have any outstanding balance, we request you to settle it at your earliest convenience.
@@ -104,29 +122,359 @@ If you have already made a payment or have any questions about your account, ple
 
 We value your business and look forward to a continued relationship with you.
 """
+    
+    doc.add_paragraph(body_text)
+    
+    # Add closing
+    doc.add_paragraph(
+        "Thank you for your prompt attention to this matter. We look forward to a continued relationship with you.\n\n"
+        "Sincerely,\n\n"
+        "[Your Name]\n"
+        "[Your Title]\n"
+        "[Company Name]"
+    )
+    
+    return doc
+
+# Sheet columns build_letter() reads; no others are read from the workbook
+LETTER_COLUMNS = (NAME_COLUMN, 'Address', 'Status(Active/Inactive)', 'Billing Account', 'Department',
+                  AMOUNT_COLUMN)
+
+# Customer fields build_letter() puts into the letter text
+SKELETON_FIELDS = (DATE_FIELD, 'CUSTOMER NAME', 'Address', SALUTATION_FIELD,
+                   'Billing Account', 'Department', AMOUNT_FIELD)
+
+_TEXT_ELEMENT = re.compile(r'<w:t(?: xml:space="preserve")?>([^<]*)</w:t>')
+_CONTROL_CHARS = re.compile(r'[\x00-\x1f]')
+
+def _letter_variant(customer):
+    status = str(customer.get('Status(Active/Inactive)', 'Active')).lower().strip()
+    return 'inactive' in status, bool(customer.get('Address'))
+
+def _skeleton_values(customer):
+    """The text build_letter() would use for each of SKELETON_FIELDS"""
+    return {
+        DATE_FIELD: customer[DATE_FIELD],
+        'CUSTOMER NAME': customer.get('CUSTOMER NAME') or 'Valued Customer',
+        'Address': customer.get('Address'),
+        SALUTATION_FIELD: customer[SALUTATION_FIELD],
+        'Billing Account': customer.get('Billing Account', ''),
+        'Department': customer.get('Department', ''),
+        AMOUNT_FIELD: customer[AMOUNT_FIELD],
+    }
+
+class LetterSkeletons:
+    """The built-in letter's document.xml, prebuilt once per variant.
+
+    There is a variant per status branch (active/inactive) and per whether
+    the address line is present. Each is built once with build_letter() and
+    marker values, then cut into static XML and the w:t elements that carry
+    customer fields, so a row only joins its escaped values into place.
+    Rows whose values python-docx would lay out differently (tabs, line
+    breaks) are still built with build_letter().
+    """
+    
+    def __init__(self):
+        self._marker = f"F{uuid.uuid4().hex}N"
+        self._variants = {
+            (inactive, has_address): self._compile(inactive, has_address)
+            for inactive in (False, True) for has_address in (False, True)
+        }
+    
+    def _compile(self, inactive, has_address):
+        customer = {field: f"{self._marker}{n}{self._marker}" for n, field in enumerate(SKELETON_FIELDS)}
+        customer['Status(Active/Inactive)'] = 'Inactive' if inactive else 'Active'
+        if not has_address:
+            customer['Address'] = ''
+        xml = build_letter(customer).part.blob.decode('utf-8')
         
-        doc.add_paragraph(body_text)
-        
-        # Add closing
-        doc.add_paragraph(
-            "Thank you for your prompt attention to this matter. We look forward to a continued relationship with you.\n\n"
-            "Sincerely,\n\n"
-            "[Your Name]\n"
-            "[Your Title]\n"
-            "[Company Name]"
-        )
+        static, texts = [], []
+        position = 0
+        for match in _TEXT_ELEMENT.finditer(xml):
+            if self._marker not in match.group(1):
+                continue
+            static.append(xml[position:match.start()])
+            # Odd items are field names, even items literal text
+            parts = re.split(f"{self._marker}(\\d+){self._marker}", unescape(match.group(1)))
+            parts[1::2] = [SKELETON_FIELDS[int(n)] for n in parts[1::2]]
+            texts.append(parts)
+            position = match.end()
+        static.append(xml[position:])
+        return static, texts
+    
+    def render(self, customer):
+        """document.xml (bytes) of the customer's letter"""
+        values = _skeleton_values(customer)
+        values = {field: str(value) for field, value in values.items()}
+        if any(_CONTROL_CHARS.search(value) for value in values.values()):
+            return build_letter(customer).part.blob
         
-        # Save document with customer name and unique identifier
-        customer_name = str(customer.get('CUSTOMER NAME', 'Customer')).replace(' ', '_').replace('/', '_')
-        # Add billing account number and index to ensure uniqueness
-        billing_account = str(customer.get('Billing Account', idx)).replace(' ', '_').replace('/', '_')
-        filename = os.path.join(output_folder, f"Letter_{customer_name}_{billing_account}_{idx:03d}.docx")
-        doc.save(filename)
-        print(f"✓ Generated: {filename}")
+        static, texts = self._variants[_letter_variant(customer)]
+        out = [static[0]]
+        for parts, following in zip(texts, static[1:]):
+            text = ''.join(values[part] if n % 2 else part for n, part in enumerate(parts))
+            # Same rules as python-docx: no empty w:t, keep edge whitespace
+            if text:
+                space = ' xml:space="preserve"' if len(text.strip()) < len(text) else ''
+                out.append(f'<w:t{space}>{escape(text)}</w:t>')
+            out.append(following)
+        return ''.join(out).encode('utf-8')
+
+def letter_filename(idx, customer):
+    """File name for a customer's letter, unique per row"""
+    # Save document with customer name, billing account number and index to ensure uniqueness
+    return f"Letter_{_letter_key(idx, customer)}.docx"
+
+def _letter_key(idx, customer):
+    return letter_key(idx, customer.get('CUSTOMER NAME', 'Customer'), customer.get('Billing Account', idx))
+
+def _render_chunk(worker, frame):
+    index = worker['index']
+    package_writer = worker['package_writer']
+    skeletons = worker['skeletons']
+    partname = worker['partname']
+    previous = worker['previous']
+    metrics = worker['metrics']
+    merged = worker['merged']
+    letter_date = worker['letter_date']
+    run_hash = worker['run_hash']
+    
+    # Format the whole chunk at once (NaN, amounts, dates, salutations)
+    if metrics is not None:
+        started = time.perf_counter()
+    prepared = index.prepare(frame, letter_date)
+    if metrics is not None:
+        metrics.add_time('prepare_values', time.perf_counter() - started)
+    
+    letters = []
+    for idx, values in zip(frame.index, prepared):
+        customer = index.record(values)
+        key = _letter_key(idx, customer)
+        digest = row_digest(run_hash, values)
+        # Rows unchanged since the last run keep their existing file
+        data = None
+        if previous.get(key) != digest:
+            if metrics is not None:
+                started = time.perf_counter()
+            # A row that fails is quarantined; the rest of the batch carries on
+            try:
+                document_xml = skeletons.render(customer)
+            except Exception as e:
+                letters.append(failed_letter(letter_filename(idx, customer), key, idx, e))
+                continue
+            if metrics is not None:
+                built = time.perf_counter()
+                metrics.add_time('build_document', built - started)
+            if merged:
+                # Only the body goes into the merged document
+                data = split_document_xml(document_xml.decode('utf-8'))[1]
+            else:
+                data = package_writer.render({partname: document_xml})
+            if metrics is not None:
+                metrics.add_time('package_docx', time.perf_counter() - built)
+                metrics.count('docx_bytes', len(data))
+        letters.append(RenderedLetter(letter_filename(idx, customer), data, key, digest, int(idx) + 1))
+    # Worker timings travel back with the chunk's letters
+    return letters, metrics.snapshot(reset=True) if metrics is not None else None
+
+def _report_error(letter):
+    print(f"✗ Failed: row {letter.row}: {letter.error}")
+    return {'row': letter.row, 'file': letter.filename, 'error': letter.error}
+
+def _keep_previous(letter, previous, letters_index):
+    """Report a failed letter, keeping the last run's letter for its row (if any) in the index"""
+    # A stale letter is better than none until the row renders again; its old
+    # hash makes the next incremental run retry it
+    if letter.key in previous:
+        letters_index[letter.key] = previous[letter.key]
+    return _report_error(letter)
+
+def _write_error_report(output_folder, errors):
+    """Write the quarantined rows to errors.csv (or remove an old report if none failed)"""
+    path = os.path.join(output_folder, ERROR_REPORT_NAME)
+    if errors:
+        with open(path, 'w', encoding='utf-8', newline='') as f:
+            f.write(error_report_csv(errors))
+        print(f"\n  {len(errors)} rows failed and were left out (see {path})")
+    elif os.path.exists(path):
+        os.remove(path)
+
+def _write_merged_letters(results, output_folder, total, volume_size=None, metrics=None):
+    """Stream rendered bodies into merged_letters.docx (or volumes of volume_size letters)"""
+    package, partname, head, tail = _blank_package()
+    
+    def open_volume(number):
+        filename = os.path.join(output_folder, volume_name('merged_letters', number, volume_size))
+        print(f"✓ Writing: {filename}")
+        return open(filename, 'wb')
+    
+    volumes = MergedVolumes(open_volume, package, partname, head, tail, volume_size)
+    done = 0
+    errors = []
+    for letters, snapshot in results:
+        if snapshot is not None:
+            metrics.merge(snapshot)
+            metrics.count('letters', len(letters))
+        if metrics is not None:
+            started = time.perf_counter()
+        for letter in letters:
+            if letter.error is not None:
+                errors.append(_report_error(letter))
+                continue
+            volumes.add(letter.data)
+        if metrics is not None:
+            metrics.add_time('write_output', time.perf_counter() - started)
+        done += len(letters)
+        print(f"  Progress: {done}/{total} letters")
+    volumes.close()
+    _write_error_report(output_folder, errors)
     
-    print(f"\n✓ All {len(df)} letters generated successfully in '{output_folder}' folder!")
+    print(f"\n✓ All {done - len(errors)} letters merged into {len(volumes.files)} document(s) in '{output_folder}' folder!")
+
+def create_customer_letters(excel_file, output_folder='output_letters', workers=1,
+                            chunk_size=DEFAULT_CHUNK_SIZE, incremental=False, metrics=None,
+                            merged=False, volume_size=None, query=None, letter_date_str=None):
+    """
+    Read customer data from Excel and generate personalized Word documents.
+    
+    Expected Excel columns: SSA, Billing Account, CUSTOMER NAME, Accot Subtype, 
+                          Department, Address, Status(Active/Inactive), 
+                          Outstanding amount in Rs, CLOSURE DATE
+    
+    excel_file can also be a CSV, Parquet or SQLite file (query picks a
+    database's rows). Only LETTER_COLUMNS are read from it.
+    
+    With workers > 1 the letters are rendered by a pool of processes, each
+    handed chunk_size rows at a time. Files are still written in row order.
+    
+    letter_date_str is the date printed on the letters (default: today).
+    Each run records a hash of every letter's inputs in the output folder.
+    With incremental=True only rows whose data (or the letter date) changed
+    since then are rebuilt; the other letters are left as they are. A row
+    that fails keeps its letter from the last run until one is written.
+    
+    Pass an instrumentation.Metrics as metrics to collect per-stage timings.
+    
+    With merged=True the letters go into one print-ready merged_letters.docx
+    (each customer in its own section, starting on a new page), or into
+    volumes of volume_size letters each, instead of one file per customer.
+    """
+    
+    # Create output folder if it doesn't exist
+    if not os.path.exists(output_folder):
+        os.makedirs(output_folder)
+    
+    # Open the data file; rows are streamed in chunks rather than loaded all at once,
+    # and only the columns the letter uses are read
+    try:
+        source = open_row_source(excel_file, query=query).select(LETTER_COLUMNS)
+    except FileNotFoundError:
+        print(f"Error: {excel_file} not found!")
+        return
+    total = source.count_rows()
+    
+    print(f"Found {total} customers. Generating letters...\n")
+    
+    # One date for the whole run, however long it takes
+    if letter_date_str is None:
+        letter_date_str = datetime.now().strftime('%B %d, %Y')
+    
+    # Letters from the last run that are still on disk can be kept
+    previous = {}
+    if incremental and not merged:
+        previous = {
+            key: entry for key, entry in load_index(output_folder).items()
+            if os.path.exists(os.path.join(output_folder, entry['file']))
+        }
+    
+    # Process each customer; rows go to the workers as DataFrame chunks
+    results = ordered_pool_map(
+        _render_chunk, timed_iter(source.iter_chunks(chunk_size), metrics, 'read_rows'),
+        workers=workers, initializer=_init_worker,
+        initargs=(source.columns, {key: entry['hash'] for key, entry in previous.items()},
+                  metrics is not None, merged, letter_date_str)
+    )
+    
+    if merged:
+        _write_merged_letters(results, output_folder, total, volume_size, metrics)
+        return
+    
+    done = 0
+    unchanged = 0
+    letters_index = {}
+    errors = []
+    for letters, snapshot in results:
+        if snapshot is not None:
+            metrics.merge(snapshot)
+            metrics.count('letters', len(letters))
+        for letter in letters:
+            if letter.error is not None:
+                errors.append(_keep_previous(letter, previous, letters_index))
+                continue
+            filename = os.path.join(output_folder, letter.filename)
+            if letter.data is None:
+                unchanged += 1
+                print(f"= Unchanged: {filename}")
+            else:
+                if metrics is not None:
+                    started = time.perf_counter()
+                try:
+                    with open(filename, 'wb') as f:
+                        f.write(letter.data)
+                except OSError as e:
+                    # A name the file system refuses quarantines the row; other errors stop the run
+                    if e.errno not in FILENAME_ERRNOS:
+                        raise
+                    letter = letter._replace(error=f"{type(e).__name__}: {e.strerror}")
+                    errors.append(_keep_previous(letter, previous, letters_index))
+                    continue
+                if metrics is not None:
+                    metrics.add_time('write_output', time.perf_counter() - started)
+                    metrics.count('bytes_written', len(letter.data))
+                print(f"✓ Generated: {filename}")
+            letters_index[letter.key] = {'file': letter.filename, 'hash': letter.digest}
+        done += len(letters)
+        print(f"  Progress: {done}/{total} letters")
+    
+    # Letters for rows that are gone from the sheet are removed
+    for key, entry in previous.items():
+        if key not in letters_index:
+            os.remove(os.path.join(output_folder, entry['file']))
+    save_index(output_folder, letters_index)
+    _write_error_report(output_folder, errors)
+    
+    if unchanged:
+        print(f"\n  {unchanged} unchanged letters kept from the last run")
+    print(f"\n✓ All {done - len(errors)} letters generated successfully in '{output_folder}' folder!")
 
 if __name__ == "__main__":
-    # Usage - update filename with your actual Excel file
-    excel_file = 'your_file.xlsx'  # Change this to your actual file name
-    create_customer_letters(excel_file, 'output_letters')
+    parser = argparse.ArgumentParser(description="Generate customer letters from an Excel file")
+    # Usage - pass your actual Excel file (defaults to your_file.xlsx)
+    parser.add_argument('excel_file', nargs='?', default='your_file.xlsx',
+                        help="Customer data: Excel, CSV, Parquet or SQLite (.db) file")
+    parser.add_argument('output_folder', nargs='?', default='output_letters', help="Folder for the letters")
+    parser.add_argument('--date', help="Letter date as YYYY-MM-DD (default: today)")
+    parser.add_argument('--workers', type=int, default=1, help="Number of worker processes")
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE,
+                        help="Rows sent to a worker at a time")
+    parser.add_argument('--incremental', action='store_true',
+                        help="Only rebuild letters whose row changed since the last run")
+    parser.add_argument('--merged', action='store_true',
+                        help="Write one print-ready document with each letter in its own section")
+    parser.add_argument('--volume-size', type=int,
+                        help="With --merged, start a new document every N letters")
+    parser.add_argument('--metrics', nargs='?', const='', metavar='JSON_FILE',
+                        help="Print per-stage timings (and write them as JSON to JSON_FILE)")
+    parser.add_argument('--profile', metavar='PROF_FILE', help="Profile the run with cProfile")
+    parser.add_argument('--query', help="SQL query for the rows of a SQLite file (default: its first table)")
+    args = parser.parse_args()
+    
+    metrics = None
+    if args.metrics is not None or args.profile:
+        metrics = Metrics(profile=bool(args.profile))
+    letter_date = datetime.strptime(args.date, '%Y-%m-%d') if args.date else datetime.now()
+    create_customer_letters(args.excel_file, args.output_folder, args.workers, args.chunk_size,
+                            args.incremental, metrics, args.merged, args.volume_size, args.query,
+                            letter_date.strftime('%B %d, %Y'))
+    if metrics is not None:
+        report_metrics(metrics, args.metrics, args.profile)
@@ -0,0 +1,565 @@
+import hashlib
+import io
+import os
+import tempfile
+import zipfile
+from datetime import datetime
+from pathlib import Path
+
+import pandas as pd
+import streamlit as st
+
+from archive import SPOOL_MAX_MEMORY, LetterArchive, unique_name
+from generation import generate_template_letters, template_columns
+from instrumentation import Metrics
+from jobs import JobRegistry
+from merged_output import MergedVolumes, volume_name
+from parallel import DEFAULT_CHUNK_SIZE, default_workers
+from placeholders import PlaceholderIndex
+from preview import PREVIEW_CSS, build_preview
+from routing import RoutingRule, TemplateRouter, template_folder
+from row_sources import ROW_SOURCE_EXTENSIONS, SQLITE_EXTENSIONS, open_row_source
+from template_engine import compile_template
+from validation import error_report_csv, preflight
+
+# How often a running job's progress is refreshed on the page
+PROGRESS_POLL_SECONDS = 1.0
+
+# The letter preview reads the workbook this many rows at a time
+PREVIEW_BLOCK_ROWS = 500
+
+# Streamlit holds a download in server memory while it is sent (even one
+# read from a file), so bigger ones come with a pointer to the scripts
+LARGE_DOWNLOAD_BYTES = 512 * 1024 * 1024
+
+# Uploads are cached by content hash, so reruns triggered by other widgets
+# don't re-read the workbook or re-parse the template
+def content_hash(uploaded_file):
+    return hashlib.sha256(uploaded_file.getbuffer()).hexdigest()
+
+@st.cache_resource(max_entries=4, show_spinner="Reading data file...")
+def load_workbook_source(digest, name, query, _data):
+    """Row source, row count and preview for an uploaded data file (query is for SQLite)"""
+    source = open_row_source(_data, name, query)
+    return source, source.count_rows(), source.head(10)
+
+@st.cache_resource(max_entries=8, show_spinner="Reading template...")
+def load_template(digest, _data):
+    """Compiled template (with its detected placeholders) for an uploaded .docx"""
+    return compile_template(io.BytesIO(_data))
+
+@st.cache_resource(max_entries=8, show_spinner=False)
+def load_template_preview(digest, _data):
+    """HTML preview renderer for an uploaded .docx, parsed once"""
+    return build_preview(io.BytesIO(_data))
+
+@st.cache_resource(max_entries=8, show_spinner=False)
+def load_preview_rows(digest, block, _source):
+    """One block of PREVIEW_BLOCK_ROWS rows, so flipping between nearby rows doesn't re-read the file"""
+    first = block * PREVIEW_BLOCK_ROWS + 1
+    return next(_source.iter_chunks(PREVIEW_BLOCK_ROWS, first, first + PREVIEW_BLOCK_ROWS - 1), None)
+
+@st.cache_resource
+def job_registry():
+    """Background generation jobs, shared by every session of this server"""
+    return JobRegistry()
+
+def run_generation_job(job, source, templates, start_row, end_row, letter_date_str, workers=1,
+                       merged=False, volume_size=0, previous_job=None, collect_timings=False,
+                       profile_run=False, router=None, group_by=None):
+    """Generate letters for a background job (runs on a worker thread, so no st.* calls).
+
+    templates maps template names to (bytes, CompiledTemplate). With a
+    router every row goes to the template it picks and the output is
+    grouped in one folder per template; without one there is one template.
+    With group_by there is one letter per group of rows (see
+    generation.generate_template_letters).
+    """
+    if router is None:
+        (template_bytes, _), = templates.values()
+    else:
+        template_bytes = {name: data for name, (data, _) in templates.items()}
+    # Created here so the profiler is attached to the job's thread
+    metrics = Metrics(profile=profile_run) if collect_timings or profile_run else None
+    chunks = source.iter_chunks(DEFAULT_CHUNK_SIZE, start_row, end_row)
+    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+    result = {'timestamp': timestamp, 'merged': merged, 'metrics': metrics, 'unchanged': 0, 'count': 0,
+              'errors': []}
+    archive = None
+    volumes = None
+    
+    try:
+        if merged:
+            # Bodies are streamed into spooled .docx volumes (one set per template);
+            # styles and media are written once per volume
+            volumes = {}
+            
+            def template_volumes(name):
+                if name not in volumes:
+                    compiled_template = (templates[name] if name is not None else next(iter(templates.values())))[1]
+                    volumes[name] = MergedVolumes(
+                        lambda number: tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_MEMORY, suffix='.docx'),
+                        compiled_template.writer,
+                        compiled_template.document_partname,
+                        compiled_template.document_head,
+                        compiled_template.document_tail,
+                        volume_size=volume_size,
+                        close_files=False
+                    )
+                return volumes[name]
+            
+            letters = generate_template_letters(
+                template_bytes, source.columns, chunks, letter_date_str,
+                workers=workers, progress=job.progress, metrics=metrics, merged=True, router=router,
+                group_by=group_by
+            )
+            try:
+                for letter in letters:
+                    job.check_cancelled()
+                    if letter.error is not None:
+                        result['errors'].append({'row': letter.row, 'file': letter.filename, 'error': letter.error})
+                        continue
+                    template_volumes(letter.template).add(letter.data)
+                    result['count'] += 1
+            finally:
+                letters.close()
+            files = []
+            for name, template_volume in volumes.items():
+                template_volume.close()
+                base = f"merged_letters_{timestamp}"
+                if name is not None:
+                    base = f"{template_folder(name)}/{base}"
+                files += [
+                    (volume_name(base, number, volume_size), f)
+                    for number, f in enumerate(template_volume.files, start=1)
+                ]
+            result['volumes'] = len(files)
+            
+            if len(files) == 1 and router is None:
+                result['merged_document'] = files[0][1]
+            else:
+                # Volumes are already compressed, so the ZIP just stores them
+                archive = LetterArchive(compression=zipfile.ZIP_STORED)
+                for filename, f in files:
+                    f.seek(0)
+                    archive.add(filename, f.read())
+                    f.close()
+                archive.close()
+                result['archive'] = archive
+        else:
+            # Letters go straight into the ZIP as they are rendered (no files in the CWD)
+            archive = LetterArchive()
+            
+            # Rows that hash the same as in this session's last run are copied from its ZIP
+            last_result = previous_job.result if previous_job is not None else None
+            previous = (last_result or {}).get('letters', {})
+            letters = generate_template_letters(
+                template_bytes, source.columns, chunks, letter_date_str,
+                workers=workers, progress=job.progress,
+                previous={key: digest for key, (_, digest) in previous.items()},
+                metrics=metrics, router=router, group_by=group_by
+            )
+            run_letters = {}
+            try:
+                for letter in letters:
+                    job.check_cancelled()
+                    # Rows that failed are left out of the ZIP and listed in the error report
+                    if letter.error is not None:
+                        result['errors'].append({'row': letter.row, 'file': letter.filename, 'error': letter.error})
+                        continue
+                    result['count'] += 1
+                    data = letter.data
+                    if data is None:
+                        data = last_result['archive'].read_member(previous[letter.key][0])
+                        result['unchanged'] += 1
+                    filename = letter.filename
+                    if letter.template is not None:
+                        filename = f"{template_folder(letter.template)}/{filename}"
+                    if metrics is None:
+                        name = archive.add(filename, data)
+                    else:
+                        with metrics.stage('archive_zip'):
+                            name = archive.add(filename, data)
+                    run_letters[letter.key] = (name, letter.digest)
+            finally:
+                letters.close()
+            archive.close()
+            result['archive'] = archive
+            result['letters'] = run_letters
+        
+        if metrics is not None:
+            output = result.get('merged_document') or archive.file
+            output.seek(0, os.SEEK_END)
+            metrics.count('bytes_written', output.tell())
+    except BaseException:
+        # Cancelled or failed: drop the partial output
+        if archive is not None:
+            archive.discard()
+        for template_volumes in (volumes or {}).values():
+            template_volumes.close()
+            for f in template_volumes.files:
+                f.close()
+        raise
+    finally:
+        if metrics is not None:
+            metrics.finish()
+    
+    # This session's previous result has been superseded
+    if previous_job is not None:
+        previous_job.discard()
+    return result
+
+@st.fragment(run_every=PROGRESS_POLL_SECONDS)
+def show_job_progress(job_id):
+    """Progress of a running job, refreshed on a timer instead of once per letter"""
+    job = job_registry().get(job_id)
+    if job is None:
+        return
+    if not job.active:
+        # Finished: rerun the whole page to show the result
+        st.rerun()
+    
+    snapshot = job.snapshot()
+    if snapshot['status'] == 'queued':
+        st.info("⏳ Waiting for a free worker (other batches are running)...")
+    else:
+        fraction = snapshot['done'] / snapshot['total'] if snapshot['total'] else 0
+        st.progress(
+            min(fraction, 1.0),
+            text=f"Generating letter {snapshot['done']} of {snapshot['total']}... "
+                 f"({snapshot['rate']:.0f} letters/sec)"
+        )
+    if st.button("✖ Cancel", key="cancel_job"):
+        job.cancel()
+        st.info("Cancelling...")
+
+def show_job_result(job):
+    """Outcome and downloads of a finished job (kept across reruns)"""
+    snapshot = job.snapshot()
+    if snapshot['status'] == 'cancelled':
+        st.warning(f"Generation cancelled after {snapshot['done']} of {snapshot['total']} letters.")
+        return
+    if snapshot['status'] == 'failed':
+        st.error(f"❌ Error: {snapshot['error']}")
+        return
+    result = job.result
+    if result is None:
+        st.info("This batch's files have been cleared; generate again to download them.")
+        return
+    
+    if result['merged']:
+        st.success(f"✅ Merged {result['count']} letters into {result['volumes']} print-ready document(s)!")
+    else:
+        st.success(f"✅ Generated {len(result['archive'])} letters successfully!")
+    if result['unchanged']:
+        st.caption(f"{result['unchanged']} unchanged letters were reused from the previous run")
+    if result['errors']:
+        st.warning(f"⚠️ {len(result['errors'])} rows could not be generated and were left out.")
+        st.download_button(
+            label="Download error report (CSV)",
+            data=error_report_csv(result['errors']),
+            file_name=f"letter_errors_{result['timestamp']}.csv",
+            mime="text/csv",
+            key="download_errors",
+            on_click="ignore"
+        )
+    
+    metrics = result['metrics']
+    if metrics is not None:
+        summary = metrics.summary()
+        with st.expander("⏱️ Timing details", expanded=False):
+            st.write(f"Total time: {summary['wall_seconds']:.2f}s")
+            st.dataframe(
+                [{'Stage': stage, 'Seconds': timing['seconds'], 'Calls': timing['calls']}
+                 for stage, timing in summary['stages'].items()],
+                use_container_width=True
+            )
+            st.dataframe(
+                [{'Counter': name, 'Value': n} for name, n in summary['counters'].items()],
+                use_container_width=True
+            )
+            if metrics.profiler is not None:
+                st.code(metrics.profile_text())
+            st.download_button(
+                label="Download timings (JSON)",
+                data=metrics.to_json(),
+                file_name="generation_timings.json",
+                mime="application/json",
+                key="download_timings",
+                on_click="ignore"
+            )
+    
+    timestamp = result['timestamp']
+    merged_document = result.get('merged_document')
+    archive = result.get('archive')
+    if merged_document is not None:
+        def read_merged_document():
+            merged_document.seek(0)
+            return merged_document.read()
+        
+        merged_document.seek(0, os.SEEK_END)
+        _large_download_note(merged_document.tell())
+        st.download_button(
+            label="📥 Download Merged Document (DOCX)",
+            data=read_merged_document,
+            file_name=f"merged_letters_{timestamp}.docx",
+            mime="application/vnd.openxmlformats-officedocument.wordprocessingml.document",
+            key="download_merged",
+            on_click="ignore"
+        )
+    elif archive is not None and len(archive):
+        _large_download_note(archive.size())
+        # The archive is only read when the download is requested
+        st.download_button(
+            label="📥 Download All Letters (ZIP)",
+            data=archive.read,
+            file_name=f"customer_letters_{timestamp}.zip",
+            mime="application/zip",
+            key="download_zip",
+            on_click="ignore"
+        )
+
+
+def _large_download_note(size):
+    """Warn that a download this big is held in server memory while it is sent"""
+    if size < LARGE_DOWNLOAD_BYTES:
+        return
+    st.caption(
+        f"This download is {size / 1024 ** 2:,.0f} MB and is held in the server's memory while it is sent. "
+        "For batches this large, `batch_generate.py` (or `generate_letters.py --merged --volume-size`) "
+        "writes the output straight to disk."
+    )
+
+
+def render():
+    """Draw the page (called on every rerun while it is selected)"""
+    st.markdown("Generate personalized Word documents for bulk mailing to customers")
+    
+    # Sidebar - Only date configuration
+    with st.sidebar:
+        st.subheader("📅 Letter Date")
+        letter_date = st.date_input("Select date for letters", value=datetime.now().date())
+        letter_date_str = letter_date.strftime('%B %d, %Y')
+
+    # Step 1: Upload Excel
+    st.header("📁 Step 1: Upload Excel File")
+    uploaded_file = st.file_uploader(
+        "Choose your Excel file",
+        type=[extension.lstrip('.') for extension in ROW_SOURCE_EXTENSIONS],
+        help="CSV, Parquet and SQLite database files work too"
+    )
+    
+    if not uploaded_file:
+        st.info("👆 Please upload an Excel file to get started")
+        st.stop()
+    
+    query = None
+    if Path(uploaded_file.name).suffix.lower() in SQLITE_EXTENSIONS:
+        query = st.text_area(
+            "SQL query for the customer rows",
+            placeholder="SELECT * FROM customers ORDER BY id (default: every row of the first table)"
+        ).strip() or None
+    
+    # Rows are streamed from the workbook during generation instead of loaded up front
+    workbook_digest = content_hash(uploaded_file)
+    try:
+        source, total_rows, preview = load_workbook_source(
+            workbook_digest, uploaded_file.name, query, uploaded_file.getvalue()
+        )
+    except Exception as e:
+        st.error(f"Error reading file: {str(e)}")
+        st.stop()
+    if query is not None:
+        workbook_digest = (workbook_digest, query)
+    st.success(f"✓ File loaded successfully! ({total_rows} customers found)")
+    
+    with st.expander("📊 Preview Data", expanded=False):
+        st.dataframe(preview, use_container_width=True)
+        st.info(f"Total rows: {total_rows}")
+
+    # Step 2: Choose Template Source
+    st.header("📋 Step 2: Upload Word Template")
+    
+    st.info("✓ Upload your own formatted Word document template with placeholders like {CUSTOMER_NAME}, {BILLING_ACCOUNT}, etc.")
+    
+    template_files = st.file_uploader(
+        "Choose Word template file(s)",
+        type=['docx'],
+        accept_multiple_files=True,
+        key="template_upload",
+        help="Upload several templates to send a different letter depending on a column such as the status"
+    )
+    
+    if not template_files:
+        st.warning("Please upload a Word template file (.docx)")
+        st.stop()
+    
+    # Template name -> (bytes, compiled template); each is parsed once and cached
+    templates = {}
+    template_digests = {}
+    template_names = set()
+    try:
+        for template_file in template_files:
+            name = unique_name(template_file.name, template_names)
+            template_digests[name] = content_hash(template_file)
+            templates[name] = (
+                template_file.getvalue(),
+                load_template(template_digests[name], template_file.getvalue())
+            )
+        st.success("✓ Template loaded successfully!" if len(templates) == 1
+                   else f"✓ {len(templates)} templates loaded successfully!")
+        
+        for name, (_, compiled_template) in templates.items():
+            label = f"{name}: " if len(templates) > 1 else ""
+            
+            # Extract placeholders from template
+            placeholders_found = compiled_template.placeholders
+            
+            if placeholders_found:
+                available_placeholders = sorted(list(placeholders_found))
+                st.info(f"{label}Found placeholders: {', '.join(available_placeholders)}")
+                
+                # The scan covers headers and footers too; say where those placeholders are
+                other_parts = {
+                    Path(partname).stem: found
+                    for partname, found in compiled_template.placeholder_parts.items()
+                    if partname != compiled_template.document_partname
+                }
+                if other_parts:
+                    st.caption("Also in " + "; ".join(
+                        f"{part}: {', '.join(sorted(found))}" for part, found in sorted(other_parts.items())
+                    ))
+            else:
+                st.warning(f"{label}No placeholders found in template. Use format: {{PLACEHOLDER_NAME}}")
+                
+    except Exception as e:
+        st.error(f"Error loading template: {str(e)}")
+        st.stop()
+    
+    # With several templates, rules pick each row's template in the same pass
+    router = None
+    if len(templates) > 1:
+        st.subheader("🔀 Template Routing")
+        st.caption("Each row gets the template of the first rule its column value matches (ignoring case). "
+                   "Letters are grouped in one folder per template.")
+        default_template = st.selectbox("Template for rows no rule matches", list(templates))
+        rules_frame = st.data_editor(
+            pd.DataFrame({'Column': [], 'Value': [], 'Template': []}, dtype=str),
+            num_rows="dynamic",
+            column_config={
+                'Column': st.column_config.SelectboxColumn(options=source.columns, required=True),
+                'Value': st.column_config.TextColumn(required=True),
+                'Template': st.column_config.SelectboxColumn(options=list(templates), required=True),
+            },
+            use_container_width=True,
+            key="routing_rules"
+        )
+        rules = [
+            RoutingRule(rule.Column, rule.Value, rule.Template)
+            for rule in rules_frame.itertuples(index=False)
+            if pd.notna(rule.Column) and pd.notna(rule.Value) and pd.notna(rule.Template)
+        ]
+        router = TemplateRouter(rules, default_template)
+    
+    # Check a letter for any row without generating the batch
+    with st.expander("👁️ Preview a Letter", expanded=False):
+        preview_row = st.number_input("Row to preview", min_value=1, max_value=total_rows, value=1)
+        rows = load_preview_rows(workbook_digest, (preview_row - 1) // PREVIEW_BLOCK_ROWS, source)
+        if rows is None or preview_row - 1 not in rows.index:
+            st.info(f"Row {preview_row} is empty")
+        else:
+            index = PlaceholderIndex(source.columns)
+            values = index.prepare(rows.loc[[preview_row - 1]], letter_date_str)[0]
+            name = router.route(index.record(values)) if router is not None else next(iter(templates))
+            template_preview = load_template_preview(template_digests[name], templates[name][0])
+            if router is not None:
+                st.caption(f"Template: {name}")
+            st.caption("Placeholders highlighted in yellow have no matching column and stay as they are")
+            st.html(PREVIEW_CSS + template_preview.render_html(index.replacements(values)))
+
+    col1, col2, col3 = st.columns(3)
+    
+    with col1:
+        start_row = st.number_input("Start from row", min_value=1, max_value=total_rows, value=1)
+    
+    with col2:
+        end_row = st.number_input("End at row", min_value=1, max_value=total_rows, value=total_rows)
+    
+    with col3:
+        workers = st.number_input(
+            "Parallel workers",
+            min_value=1,
+            max_value=default_workers(),
+            value=1,
+            help="Render letters in this many processes (useful for large batches)"
+        )
+    
+    output_mode = st.radio(
+        "Output",
+        ["Separate letters (ZIP)", "One merged document (print-ready)"],
+        horizontal=True,
+        help="The merged document puts every letter in one .docx, each customer in its own section starting on a new page"
+    )
+    merged_output = output_mode.startswith("One merged")
+    volume_size = 0
+    if merged_output:
+        volume_size = st.number_input(
+            "Letters per document (0 = all in one)",
+            min_value=0,
+            value=0,
+            step=1000,
+            help="Split very large print runs into volumes of this many letters"
+        )
+    
+    # Grouped letters: one document per customer listing all their accounts
+    group_by = st.multiselect(
+        "One letter per group of rows with the same",
+        source.columns,
+        help="For example CUSTOMER NAME and Address. Table rows of the template that contain {REPEAT} "
+             "are repeated for every row of the group; {ACCOUNT_COUNT} and {TOTAL_OUTSTANDING} "
+             "hold the group's totals. Leave empty for one letter per row."
+    )
+    
+    with st.expander("⏱️ Diagnostics", expanded=False):
+        collect_timings = st.checkbox(
+            "Collect timing details",
+            help="Time each generation stage and count paragraphs and bytes written"
+        )
+        profile_run = st.checkbox("Profile with cProfile", help="Slower; shows the most expensive functions")
+    
+    # Only the columns the templates (routing rules, grouping) use are read
+    placeholders = set().union(*(compiled.placeholders for _, compiled in templates.values()))
+    letter_source = source.select(template_columns(source.columns, placeholders, router, group_by))
+    
+    if st.button("🔍 Check Data", key="check_btn",
+                 help="Look for blank values, amounts and dates that can't be read and clashing "
+                      "file names in the selected rows, without generating anything"):
+        with st.spinner("Checking rows..."):
+            report = preflight(
+                letter_source.columns, letter_source.iter_chunks(DEFAULT_CHUNK_SIZE, start_row, end_row),
+                placeholders
+            )
+        if report:
+            st.warning("  \n".join(report.lines()))
+        else:
+            st.success(f"✓ Checked {report.rows} rows: no problems found")
+    
+    # Generation runs as a background job; the page only polls its progress,
+    # so other widgets stay usable and the result survives reruns
+    registry = job_registry()
+    job = registry.get(st.session_state.get('job_id'))
+    
+    if st.button("🎯 Generate Letters", key="generate_btn", disabled=job is not None and job.active):
+        job = registry.submit(
+            run_generation_job, end_row - start_row + 1,
+            letter_source, templates, start_row, end_row, letter_date_str,
+            workers=workers, merged=merged_output, volume_size=volume_size, previous_job=job,
+            collect_timings=collect_timings, profile_run=profile_run, router=router,
+            group_by=group_by or None
+        )
+        st.session_state['job_id'] = job.id
+    
+    if job is not None and job.active:
+        show_job_progress(job.id)
+    elif job is not None:
+        show_job_result(job)
@@ -0,0 +1,234 @@
+import io
+import time
+from collections import ChainMap, namedtuple
+
+from grouping import group_aggregates, grouped_chunks
+from incremental import inputs_hash, letter_key, row_digest
+from instrumentation import Metrics, timed_iter
+from parallel import DEFAULT_CHUNK_SIZE, ordered_pool_map
+from placeholders import NAME_COLUMN, PlaceholderIndex, needed_columns
+from sharding import account_shard
+from template_engine import compile_template
+
+ACCOUNT_COLUMN = 'Billing Account'
+
+# data is None when the row is unchanged since the run described by `previous`;
+# row is the 1-based data row the letter was made from; template is the name
+# of the template a router picked (None without routing). error is set, and
+# data and digest are None, when the row failed to render and was quarantined.
+RenderedLetter = namedtuple('RenderedLetter', 'filename data key digest row template error',
+                            defaults=(None, None))
+
+
+def letter_filename(customer_name):
+    """File name used for a template letter"""
+    return f"Letter_{str(customer_name).replace(' ', '_').replace('/', '_')}.docx"
+
+
+def template_columns(columns, placeholders, router=None, group_by=()):
+    """The sheet columns template letters read, for row_sources' select().
+
+    Those the placeholders use, plus the name and billing account (file
+    names, letter keys and account shards), any routing rule's column and
+    the group_by columns.
+    """
+    extra = [NAME_COLUMN, ACCOUNT_COLUMN, *group_by]
+    if router is not None:
+        extra += [rule.column for rule in router.rules]
+    return needed_columns(columns, placeholders, extra)
+
+
+def failed_letter(filename, key, idx, error):
+    """The quarantined stand-in for a row whose letter raised error"""
+    return RenderedLetter(filename, None, key, None, int(idx) + 1, error=f"{type(error).__name__}: {error}")
+
+
+def _init_template_worker(template_bytes, columns, letter_date_str, previous, instrument=False,
+                          merged=False, shard=None, router=None):
+    """State of one run for _render_template_chunk/_render_group_chunk, built once per worker"""
+    worker = {}
+    metrics = worker['metrics'] = Metrics() if instrument else None
+    # Without a router there is one template, stored under the name None
+    templates = template_bytes if router is not None else {None: template_bytes}
+    started = time.perf_counter()
+    worker['templates'] = {name: compile_template(io.BytesIO(data)) for name, data in templates.items()}
+    if metrics is not None:
+        metrics.add_time('compile_template', time.perf_counter() - started)
+    worker['index'] = PlaceholderIndex(columns)
+    worker['date'] = letter_date_str
+    worker['run_hashes'] = {name: inputs_hash(data, letter_date_str) for name, data in templates.items()}
+    worker['router'] = router
+    worker['previous'] = previous
+    worker['merged'] = merged
+    worker['shard'] = shard
+    return worker
+
+
+def _render_template_chunk(worker, frame):
+    templates = worker['templates']
+    index = worker['index']
+    name_position = index.position(NAME_COLUMN)
+    account_position = index.position(ACCOUNT_COLUMN)
+    run_hashes = worker['run_hashes']
+    router = worker['router']
+    previous = worker['previous']
+    metrics = worker['metrics']
+    merged = worker['merged']
+    shard = worker['shard']
+
+    # Format the whole chunk at once, then index the prepared strings per row
+    if metrics is not None:
+        started = time.perf_counter()
+    prepared = index.prepare(frame, worker['date'])
+    if metrics is not None:
+        metrics.add_time('prepare_values', time.perf_counter() - started)
+
+    letters = []
+    for idx, values in zip(frame.index, prepared):
+        customer_name = values[name_position] if name_position is not None else ''
+        account = values[account_position] if account_position is not None else ''
+        if shard is not None and account_shard(account or idx, shard[1]) != shard[0]:
+            continue
+        key = letter_key(idx, customer_name or 'Customer', account or idx)
+        filename = letter_filename(customer_name or 'Valued Customer')
+        # A row that fails is quarantined; the rest of the batch carries on
+        try:
+            name = router.route(index.record(values)) if router is not None else None
+            template = templates[name]
+            digest = row_digest(run_hashes[name], values)
+            if previous.get(key) == digest:
+                data = None
+            elif merged:
+                data = _render_body(template, index.replacements(values), metrics)
+            else:
+                data = template.render(index.replacements(values), metrics)
+        except Exception as e:
+            letters.append(failed_letter(filename, key, idx, e))
+            continue
+        letters.append(RenderedLetter(filename, data, key, digest, int(idx) + 1, name))
+    # Worker timings travel back with the chunk's letters, and the rows done
+    return letters, metrics.snapshot(reset=True) if metrics is not None else None, len(letters)
+
+
+def _render_group_chunk(worker, chunk):
+    frame, starts = chunk
+    templates = worker['templates']
+    index = worker['index']
+    name_position = index.position(NAME_COLUMN)
+    account_position = index.position(ACCOUNT_COLUMN)
+    run_hashes = worker['run_hashes']
+    router = worker['router']
+    previous = worker['previous']
+    metrics = worker['metrics']
+    merged = worker['merged']
+    shard = worker['shard']
+
+    if metrics is not None:
+        started = time.perf_counter()
+    prepared = index.prepare(frame, worker['date'])
+    aggregates = group_aggregates(frame, starts)
+    if metrics is not None:
+        metrics.add_time('prepare_values', time.perf_counter() - started)
+
+    # The letter of a group is keyed, named and routed by its first row;
+    # its repeated table rows are filled from every row of the group
+    letters = []
+    bounds = list(starts) + [len(frame)]
+    for number, group_values in enumerate(aggregates):
+        first, last = bounds[number], bounds[number + 1]
+        idx = frame.index[first]
+        values = prepared[first]
+        customer_name = values[name_position] if name_position is not None else ''
+        account = values[account_position] if account_position is not None else ''
+        if shard is not None and account_shard(account or idx, shard[1]) != shard[0]:
+            continue
+        key = letter_key(idx, customer_name or 'Customer', account or idx)
+        filename = letter_filename(customer_name or 'Valued Customer')
+        try:
+            name = router.route(index.record(values)) if router is not None else None
+            template = templates[name]
+            # The aggregates are hashed too, so a one-row group never matches an ungrouped letter
+            digest = row_digest(run_hashes[name], [
+                *group_values.values(), *(value for row_values in prepared[first:last] for value in row_values)
+            ])
+            if previous.get(key) == digest:
+                data = None
+            else:
+                replacements = ChainMap(group_values, index.replacements(values))
+                rows = [ChainMap(group_values, index.replacements(row_values)) for row_values in prepared[first:last]]
+                if merged:
+                    data = _render_body(template, replacements, metrics, rows)
+                else:
+                    data = template.render(replacements, metrics, rows)
+        except Exception as e:
+            letters.append(failed_letter(filename, key, idx, e))
+            continue
+        letters.append(RenderedLetter(filename, data, key, digest, int(idx) + 1, name))
+    return letters, metrics.snapshot(reset=True) if metrics is not None else None, len(frame)
+
+
+def _render_body(template, replacements, metrics, rows=None):
+    if metrics is None:
+        return template.render_body_xml(replacements, rows=rows)
+    started = time.perf_counter()
+    body = template.render_body_xml(replacements, metrics, rows)
+    metrics.add_time('substitute', time.perf_counter() - started)
+    return body
+
+
+def generate_template_letters(template_bytes, columns, chunks, letter_date_str,
+                              workers=1, progress=None, previous=None, metrics=None, merged=False,
+                              shard=None, router=None, group_by=None, group_chunk_rows=DEFAULT_CHUNK_SIZE):
+    """Render one .docx per row from a Word template.
+
+    chunks is an iterable of DataFrames with the given columns (e.g. from
+    ExcelRowSource.iter_chunks). Yields RenderedLetter(filename, data, key,
+    digest, row, template, error) in row order; with workers > 1 the chunks are spread over a
+    process pool. progress, if given, is called with the number of letters
+    done after each chunk (rows done, when grouping).
+
+    previous maps letter keys to the digests of an earlier run; rows whose
+    digest still matches are not rendered and come back with data None.
+    Rows that raise while rendering come back with error set and no data
+    (see failed_letter) instead of stopping the batch.
+    A Metrics passed as metrics collects stage timings from every worker.
+    With merged, data is the letter's body XML (for merged_output) rather
+    than a .docx. shard=(index, count) keeps only the rows whose billing
+    account hashes to that shard (see sharding.account_shard).
+
+    With a routing.TemplateRouter as router, template_bytes maps template
+    names to .docx bytes; each is compiled once per worker and every row is
+    rendered from the template the router picks for it, in the same pass.
+
+    With group_by (a list of columns), rows whose values in those columns
+    match make one letter together (see grouping.grouped_chunks), in order
+    of each group's first row. The template's REPEAT_MARKER table rows are
+    repeated once per row of the group, and the other placeholders are
+    filled from the group's first row and grouping.GROUP_PLACEHOLDERS.
+    """
+    if router is not None:
+        template_bytes = {name: bytes(data) for name, data in template_bytes.items()}
+    else:
+        template_bytes = bytes(template_bytes)
+    chunks = timed_iter(chunks, metrics, 'read_rows')
+    render_chunk = _render_template_chunk
+    if group_by:
+        chunks = grouped_chunks(chunks, list(group_by), group_chunk_rows)
+        render_chunk = _render_group_chunk
+    done = 0
+    results = ordered_pool_map(
+        render_chunk,
+        chunks,
+        workers=workers,
+        initializer=_init_template_worker,
+        initargs=(template_bytes, list(columns), letter_date_str, dict(previous or {}),
+                  metrics is not None, merged, shard, router),
+    )
+    for letters, snapshot, rows in results:
+        if snapshot is not None:
+            metrics.merge(snapshot)
+            metrics.count('letters', len(letters))
+        yield from letters
+        done += rows
+        if progress is not None:
+            progress(done)
@@ -0,0 +1,71 @@
+import numpy as np
+import pandas as pd
+
+from placeholders import AMOUNT_COLUMN
+
+# Aggregate placeholders filled for every group letter
+ACCOUNT_COUNT_KEYS = ('{ACCOUNT_COUNT}', '{account_count}')
+TOTAL_OUTSTANDING_KEYS = ('{TOTAL_OUTSTANDING}', '{total_outstanding}')
+GROUP_PLACEHOLDERS = frozenset(ACCOUNT_COUNT_KEYS + TOTAL_OUTSTANDING_KEYS)
+
+
+def group_codes(frame, group_by):
+    """Group number of every row, numbered in order of first appearance.
+
+    Key values are compared like routing rules compare them: as text,
+    ignoring case and surrounding spaces, with blanks grouped together.
+    """
+    keys = pd.DataFrame({
+        position: frame[column].astype(str).str.strip().str.casefold().where(frame[column].notna(), '')
+        for position, column in enumerate(group_by)
+    })
+    return keys.groupby(list(keys.columns), sort=False).ngroup().to_numpy()
+
+
+def grouped_chunks(chunks, group_by, chunk_rows):
+    """Regroup DataFrame chunks into (frame, starts) chunks of whole groups.
+
+    Every group's rows become consecutive (in row order within the group)
+    and no group is split between chunks; starts holds the position of each
+    group's first row in the frame. A group can take rows from anywhere in
+    the data, so all chunks are read before the first one is yielded. The
+    index still holds each row's 0-based data row.
+    """
+    frames = list(chunks)
+    if not frames:
+        return
+    frame = pd.concat(frames) if len(frames) > 1 else frames[0]
+    codes = group_codes(frame, group_by)
+    order = np.argsort(codes, kind='stable')
+    frame = frame.iloc[order]
+    starts = np.flatnonzero(np.diff(codes[order], prepend=-1))
+    bounds = np.append(starts, len(frame))
+
+    # Whole groups per chunk, about chunk_rows rows each
+    first = 0
+    while first < len(starts):
+        last = int(np.searchsorted(bounds, bounds[first] + chunk_rows, side='right')) - 1
+        last = min(max(last, first + 1), len(starts))
+        yield frame.iloc[bounds[first]:bounds[last]], starts[first:last] - bounds[first]
+        first = last
+
+
+def group_aggregates(frame, starts):
+    """Aggregate placeholder mapping for each group of a grouped chunk.
+
+    Totals add the amount column of every row in the group; text that
+    isn't a number counts as zero.
+    """
+    counts = np.diff(np.append(starts, len(frame)))
+    if AMOUNT_COLUMN in frame.columns:
+        amounts = pd.to_numeric(frame[AMOUNT_COLUMN], errors='coerce').fillna(0).to_numpy(dtype=float)
+        totals = np.add.reduceat(amounts, starts) if len(starts) else amounts[:0]
+    else:
+        totals = np.zeros(len(starts))
+
+    aggregates = []
+    for count, total in zip(counts, totals):
+        values = dict.fromkeys(ACCOUNT_COUNT_KEYS, str(count))
+        values.update(dict.fromkeys(TOTAL_OUTSTANDING_KEYS, f'{total:,.2f}'))
+        aggregates.append(values)
+    return aggregates
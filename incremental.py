@@ -0,0 +1,47 @@
+import hashlib
+import json
+import os
+
+INDEX_NAME = 'letters_index.json'
+
+
+def letter_key(idx, customer_name, billing_account):
+    """Stable key for a row's letter: the {name}_{account}_{idx} part of Letter_... file names"""
+    name = str(customer_name).replace(' ', '_').replace('/', '_')
+    account = str(billing_account).replace(' ', '_').replace('/', '_')
+    return f"{name}_{account}_{idx:03d}"
+
+
+def inputs_hash(*parts):
+    """Hash of everything shared by a run's letters (template bytes, letter date...)"""
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(part if isinstance(part, bytes) else str(part).encode('utf-8'))
+        digest.update(b'\x00')
+    return digest.hexdigest()
+
+
+def row_digest(run_hash, values):
+    """Hash of one prepared row's placeholder values under the run's inputs"""
+    digest = hashlib.sha1(run_hash.encode('ascii'))
+    for value in values:
+        digest.update(b'\x00' if value is None else value.encode('utf-8'))
+        digest.update(b'\x1f')
+    return digest.hexdigest()
+
+
+def load_index(folder):
+    """Previous run's {key: {'file', 'hash'}} index for an output folder (empty if none)"""
+    path = os.path.join(folder, INDEX_NAME)
+    if not os.path.exists(path):
+        return {}
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def save_index(folder, index):
+    path = os.path.join(folder, INDEX_NAME)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(index, f)
+    os.replace(tmp_path, path)
@@ -0,0 +1,137 @@
+import cProfile
+import io
+import json
+import pstats
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+
+class Metrics:
+    """Cumulative per-stage timers and counters for one generation run.
+
+    Code that can be instrumented takes metrics=None and only records when it
+    is given a Metrics, so a run without one pays a None check per stage.
+    Worker processes keep their own Metrics and send snapshot() back with
+    each chunk; the caller folds them in with merge(). Stage times are summed
+    over workers, so with a process pool they can exceed the wall time.
+    """
+
+    def __init__(self, profile=False):
+        self.seconds = defaultdict(float)
+        self.calls = defaultdict(int)
+        self.counters = defaultdict(int)
+        self.started = time.perf_counter()
+        self.wall_seconds = None
+        self.profiler = cProfile.Profile() if profile else None
+        if self.profiler is not None:
+            try:
+                self.profiler.enable()
+            except ValueError:
+                # Python 3.12+ allows one active profiler; another job already has it
+                self.profiler = None
+
+    def add_time(self, stage, seconds, calls=1):
+        self.seconds[stage] += seconds
+        self.calls[stage] += calls
+
+    @contextmanager
+    def stage(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(name, time.perf_counter() - started)
+
+    def count(self, name, n=1):
+        self.counters[name] += n
+
+    def snapshot(self, reset=False):
+        """Plain-dict copy of the timers and counters (picklable for worker results)"""
+        data = {'seconds': dict(self.seconds), 'calls': dict(self.calls), 'counters': dict(self.counters)}
+        if reset:
+            self.seconds.clear()
+            self.calls.clear()
+            self.counters.clear()
+        return data
+
+    def merge(self, snapshot):
+        for stage, seconds in snapshot['seconds'].items():
+            self.add_time(stage, seconds, snapshot['calls'].get(stage, 0))
+        for name, n in snapshot['counters'].items():
+            self.count(name, n)
+
+    def finish(self):
+        """Stop the clock (and the profiler, if any)"""
+        if self.wall_seconds is None:
+            self.wall_seconds = time.perf_counter() - self.started
+        if self.profiler is not None:
+            self.profiler.disable()
+
+    def summary(self):
+        wall = self.wall_seconds if self.wall_seconds is not None else time.perf_counter() - self.started
+        stages = sorted(self.seconds, key=self.seconds.get, reverse=True)
+        return {
+            'wall_seconds': round(wall, 4),
+            'stages': {
+                stage: {'seconds': round(self.seconds[stage], 4), 'calls': self.calls[stage]}
+                for stage in stages
+            },
+            'counters': dict(self.counters),
+        }
+
+    def to_json(self):
+        return json.dumps(self.summary(), indent=2)
+
+    def format_lines(self):
+        """Human-readable summary, one line per stage and counter"""
+        summary = self.summary()
+        lines = [f"Wall time: {summary['wall_seconds']:.3f}s"]
+        for stage, timing in summary['stages'].items():
+            lines.append(f"  {stage:<20} {timing['seconds']:>10.3f}s  ({timing['calls']} calls)")
+        for name, n in summary['counters'].items():
+            lines.append(f"  {name:<20} {n:>10}")
+        return lines
+
+    def profile_text(self, limit=25):
+        """Top functions by cumulative time from the cProfile hook ('' when not profiling)"""
+        if self.profiler is None:
+            return ''
+        out = io.StringIO()
+        pstats.Stats(self.profiler, stream=out).sort_stats('cumulative').print_stats(limit)
+        return out.getvalue()
+
+    def dump_profile(self, path):
+        if self.profiler is not None:
+            self.profiler.dump_stats(path)
+
+
+def timed_iter(iterable, metrics, stage):
+    """Yield from iterable, charging the time spent fetching each item to stage"""
+    if metrics is None:
+        yield from iterable
+        return
+    iterator = iter(iterable)
+    while True:
+        started = time.perf_counter()
+        try:
+            item = next(iterator)
+        except StopIteration:
+            return
+        metrics.add_time(stage, time.perf_counter() - started)
+        yield item
+
+
+def report_metrics(metrics, json_path=None, profile_path=None, log=print):
+    """Log a finished run's timing summary; write JSON and cProfile stats when paths are given"""
+    metrics.finish()
+    log("\n⏱ Timing summary")
+    for line in metrics.format_lines():
+        log(line)
+    if json_path:
+        with open(json_path, 'w', encoding='utf-8') as f:
+            f.write(metrics.to_json())
+        log(f"Timings written to {json_path}")
+    if profile_path:
+        metrics.dump_profile(profile_path)
+        log(f"Profile written to {profile_path} (view with: python -m pstats {profile_path})")
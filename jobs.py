@@ -0,0 +1,157 @@
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+# Batches allowed to run at once on a shared instance; later ones queue
+MAX_RUNNING_JOBS = 4
+
+# Finished jobs (and their archives) are dropped after this long
+JOB_TTL_SECONDS = 2 * 60 * 60
+
+
+class JobCancelled(Exception):
+    """Raised inside a job's function when the user asked to stop it"""
+
+
+def _release(result):
+    """Release whatever a job's result holds (archives, spooled files)"""
+    for value in (result or {}).values():
+        if hasattr(value, 'discard'):
+            value.discard()
+        elif hasattr(value, 'close') and hasattr(value, 'seek'):
+            value.close()
+
+
+class GenerationJob:
+    """One background letter generation run and its progress.
+
+    The job function runs on a worker thread and must not touch Streamlit;
+    it reports through progress() and checks check_cancelled() between
+    letters. Whatever it returns is kept as result until the job is
+    discarded, so downloads survive reruns of the page. Discarding a job
+    that is still running cancels it, and the result it may still return
+    is released as soon as it does.
+    """
+
+    def __init__(self, total):
+        self.id = uuid.uuid4().hex
+        self.total = total
+        self.done = 0
+        self.status = 'queued'
+        self.error = None
+        self.result = None
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        self._cancel = threading.Event()
+        self._lock = threading.Lock()
+        self._discarded = False
+
+    @property
+    def active(self):
+        return self.status in ('queued', 'running')
+
+    def progress(self, done):
+        # Called from the worker thread; the UI reads it when it polls
+        self.done = done
+
+    def cancel(self):
+        self._cancel.set()
+
+    def check_cancelled(self):
+        if self._cancel.is_set():
+            raise JobCancelled()
+
+    def snapshot(self):
+        """Consistent copy of the job's progress for the UI"""
+        started = self.started or time.time()
+        elapsed = (self.finished or time.time()) - started
+        done = self.done
+        return {
+            'status': self.status,
+            'done': done,
+            'total': self.total,
+            'elapsed': elapsed,
+            'rate': done / elapsed if elapsed > 0 and self.started else 0.0,
+            'error': self.error,
+        }
+
+    def run(self, func, *args, **kwargs):
+        self.started = time.time()
+        self.status = 'running'
+        try:
+            self.check_cancelled()
+            result = func(self, *args, **kwargs)
+            with self._lock:
+                discarded = self._discarded
+                if not discarded:
+                    self.result = result
+            if discarded:
+                # Discarded while it ran: nobody can reach the result any more
+                _release(result)
+                raise JobCancelled()
+            status = 'done'
+        except JobCancelled:
+            status = 'cancelled'
+        except Exception as e:
+            self.error = str(e)
+            status = 'failed'
+        # finished is set before the job stops looking active, so readers
+        # that see a final status (e.g. JobRegistry._expire) always have it
+        self.finished = time.time()
+        self.status = status
+
+    def discard(self):
+        """Release the result, or cancel the job and have it released once it is produced"""
+        with self._lock:
+            self._discarded = True
+            result, self.result = self.result, None
+        self.cancel()
+        _release(result)
+
+
+class JobRegistry:
+    """Process-wide table of generation jobs shared by all sessions.
+
+    Sessions only keep their job's id, so a job keeps running (and its
+    result stays available) however often the page reruns, and several
+    users can have batches in flight at the same time.
+    """
+
+    def __init__(self, max_running=MAX_RUNNING_JOBS, ttl=JOB_TTL_SECONDS):
+        self._executor = ThreadPoolExecutor(max_workers=max_running, thread_name_prefix='letters-job')
+        self._jobs = {}
+        self._lock = threading.Lock()
+        self.ttl = ttl
+
+    def submit(self, func, total, *args, **kwargs):
+        """Start func(job, *args, **kwargs) in the background and return the job"""
+        self._expire()
+        job = GenerationJob(total)
+        with self._lock:
+            self._jobs[job.id] = job
+        self._executor.submit(job.run, func, *args, **kwargs)
+        return job
+
+    def get(self, job_id):
+        if job_id is None:
+            return None
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def discard(self, job_id):
+        with self._lock:
+            job = self._jobs.pop(job_id, None)
+        if job is not None:
+            job.discard()
+
+    def _expire(self):
+        now = time.time()
+        with self._lock:
+            expired = [
+                job_id for job_id, job in self._jobs.items()
+                if not job.active and job.finished is not None and now - job.finished > self.ttl
+            ]
+        for job_id in expired:
+            self.discard(job_id)
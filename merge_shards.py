@@ -0,0 +1,172 @@
+import argparse
+import os
+import shutil
+import sys
+
+from archive import unique_name
+from batch_generate import MANIFEST_NAME
+from checkpoint import CheckpointManifest
+from docx_writer import RawZipReader, RawZipWriter
+from sharding import parse_shard
+
+
+def _is_zip(output):
+    return output.lower().endswith('.zip')
+
+
+def manifest_path(output):
+    """Where batch_generate keeps the manifest for an output folder or .zip"""
+    if _is_zip(output):
+        return f"{output}.{MANIFEST_NAME}"
+    return os.path.join(output, MANIFEST_NAME)
+
+
+def _row_list(rows, limit=10):
+    rows = sorted(rows)
+    text = ', '.join(str(row) for row in rows[:limit])
+    return text + (f" and {len(rows) - limit} more" if len(rows) > limit else '')
+
+
+def load_shards(outputs):
+    """Open the manifests of finished shard outputs, as (output, manifest) pairs"""
+    shards = []
+    for output in outputs:
+        path = manifest_path(output)
+        if not os.path.exists(path):
+            raise ValueError(f"{output} has no manifest ({path})")
+        manifest = CheckpointManifest(path)
+        if 'shard' not in (manifest.params or {}):
+            raise ValueError(f"{output} was not generated with --shard")
+        if not manifest.complete:
+            raise ValueError(f"Shard {manifest.params['shard']} ({output}) has not finished")
+        shards.append((output, manifest))
+    return shards
+
+
+def check_shards(shards):
+    """Verify the shards make up exactly one run, each row once.
+
+    Returns the run's params, its letters in row order as (entry, output)
+    pairs, its last row and its quarantined rows (error dicts, in row order).
+    Raises ValueError naming what is missing, duplicated or mismatched.
+    """
+    first_output, first = shards[0]
+    params = {key: value for key, value in first.params.items() if key != 'shard'}
+    count = parse_shard(first.params['shard'])[1]
+
+    seen = {}
+    for output, manifest in shards:
+        other = {key: value for key, value in manifest.params.items() if key != 'shard'}
+        if other != params:
+            raise ValueError(f"{output} was generated from different inputs or settings than {first_output}")
+        index, shard_count = parse_shard(manifest.params['shard'])
+        if shard_count != count:
+            raise ValueError(f"{output} is shard {index}/{shard_count}, but {first_output} is one of {count}")
+        if index in seen:
+            raise ValueError(f"Shard {index}/{count} was given twice ({seen[index]} and {output})")
+        seen[index] = output
+
+    absent = [f"{index}/{count}" for index in range(1, count + 1) if index not in seen]
+    if absent:
+        raise ValueError(f"Missing shards: {', '.join(absent)}")
+
+    letters = sorted(
+        ((entry, output) for output, manifest in shards for entry in manifest.entries),
+        key=lambda letter: letter[0]['row'],
+    )
+    errors = sorted((error for _, manifest in shards for error in manifest.errors), key=lambda error: error['row'])
+    rows = sorted([entry['row'] for entry, _ in letters] + [error['row'] for error in errors])
+    duplicated = {row for row, following in zip(rows, rows[1:]) if row == following}
+    if duplicated:
+        raise ValueError(f"Rows generated by more than one shard: {_row_list(duplicated)}")
+
+    # Every row the shards read must have exactly one letter (or have been quarantined)
+    last_row = max(manifest.last_row or 0 for _, manifest in shards)
+    missing = set(range(params['start_row'], last_row + 1)) - set(rows)
+    if missing:
+        raise ValueError(f"Rows missing from every shard: {_row_list(missing)}")
+    return params, letters, last_row, errors
+
+
+def _merge_zips(letters, output):
+    files, readers = {}, {}
+    tmp_path = f"{output}.tmp"
+    try:
+        with open(tmp_path, 'wb') as f:
+            writer = RawZipWriter(f)
+            for entry, source, name in letters:
+                if source not in readers:
+                    files[source] = open(source, 'rb')
+                    readers[source] = RawZipReader(files[source])
+                member = readers[source].member(name)
+                member.name = entry['file']
+                writer.add(member)
+            writer.close()
+    finally:
+        for f in files.values():
+            f.close()
+    os.replace(tmp_path, output)
+
+
+def _merge_folders(letters, output):
+    os.makedirs(output, exist_ok=True)
+    for entry, source, name in letters:
+        shutil.copyfile(os.path.join(source, name), os.path.join(output, entry['file']))
+
+
+def merge_shards(outputs, output, log=print):
+    """Combine finished shard outputs (all folders or all .zip files) into one.
+
+    The letters are copied without being re-rendered or recompressed, and
+    a manifest for the whole run is written next to them. Duplicate file
+    names are resolved in row order, so the result matches what a single
+    unsharded run would have produced. Returns that manifest.
+    """
+    if len({_is_zip(path) for path in outputs} | {_is_zip(output)}) != 1:
+        raise ValueError("Shards and the merged output must all be folders or all be .zip files")
+    if os.path.abspath(output) in {os.path.abspath(path) for path in outputs}:
+        raise ValueError(f"{output} is one of the shards; merge into a new output")
+
+    shards = load_shards(outputs)
+    params, letters, last_row, errors = check_shards(shards)
+    log(f"Merging {len(letters)} letters from {len(shards)} shards...")
+
+    used_names = set()
+    renamed = []
+    for entry, source in letters:
+        merged = dict(entry, file=unique_name(entry.get('name', entry['file']), used_names))
+        renamed.append((merged, source, entry['file']))
+
+    if _is_zip(output):
+        _merge_zips(renamed, output)
+    else:
+        _merge_folders(renamed, output)
+
+    path = manifest_path(output)
+    if os.path.exists(path):
+        os.remove(path)
+    params['shards'] = len(shards)
+    manifest = CheckpointManifest(path, params)
+    manifest.record([entry for entry, _, _ in renamed], last_row - params['start_row'] + 1, errors)
+    manifest.mark_complete(last_row=last_row)
+    log(f"\n✓ Merged {len(renamed)} letters into '{output}'")
+    if errors:
+        log(f"  {len(errors)} rows failed in the shards and are listed in the manifest")
+    return manifest
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Combine the outputs of batch_generate.py --shard runs into one archive"
+    )
+    parser.add_argument('shards', nargs='+', help="Shard output folders or .zip files")
+    parser.add_argument('-o', '--output', required=True, help="Merged output folder or .zip file")
+    args = parser.parse_args(argv)
+    try:
+        merge_shards(args.shards, args.output)
+    except ValueError as e:
+        sys.exit(f"❌ {e}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+import re
+import zipfile
+
+_DRAWING_ID = re.compile(r'(<wp:docPr\b[^>]*?\bid=")(\d+)')
+
+
+def _letter_break(prefix, document_tail):
+    """Body XML that ends one letter's section, so the next starts on a new page.
+
+    The section takes the template's own section properties (page size,
+    margins, headers); a template without them gets a plain page break.
+    """
+    match = re.search(rf'<{prefix}:sectPr\b(?:[^>]*/>|.*?</{prefix}:sectPr>)', document_tail, re.S)
+    if match is None:
+        return f'<{prefix}:p><{prefix}:r><{prefix}:br {prefix}:type="page"/></{prefix}:r></{prefix}:p>'
+    # Without a section type the next section starts on a new page
+    section = re.sub(rf'<{prefix}:type\b[^>]*/>', '', match.group(0))
+    return f'<{prefix}:p><{prefix}:pPr>{section}</{prefix}:pPr></{prefix}:p>'
+
+
+class MergedDocument:
+    """One .docx holding many letters, each in its own section starting on a new page.
+
+    Built from a package (a DocxPackageWriter holding the template's parts)
+    and the head/tail of its main document part. Every other part (styles,
+    numbering, media...) is written once; letter bodies are appended to the
+    main document part as a compressed stream, so only one body is in memory
+    at a time whatever the number of letters.
+    """
+
+    def __init__(self, file, package, document_partname, document_head, document_tail,
+                 compresslevel=None):
+        self._zip = zipfile.ZipFile(file, 'w', zipfile.ZIP_DEFLATED, compresslevel=compresslevel)
+        self._package = package
+        self._document_partname = document_partname
+        self._tail = document_tail
+        self._letter_break = _letter_break(re.search(r'<(\w+):body\b', document_head).group(1), document_tail)
+        self._drawing_id = 0
+        self.letters = 0
+
+        # Parts that come before the main document part keep their order
+        names = package.names
+        split = names.index(document_partname)
+        for name in names[:split]:
+            self._zip.writestr(name, package.read(name))
+        self._remaining = names[split + 1:]
+
+        self._stream = self._zip.open(document_partname, 'w', force_zip64=True)
+        self._stream.write(document_head.encode('utf-8'))
+
+    def _renumber_drawings(self, body):
+        # Pictures need document-wide unique ids or Word reports the file as damaged
+        def renumber(match):
+            self._drawing_id += 1
+            return f"{match.group(1)}{self._drawing_id}"
+        return _DRAWING_ID.sub(renumber, body)
+
+    def add(self, body_xml):
+        """Append one letter's body content (as from CompiledTemplate.render_body_xml)"""
+        if isinstance(body_xml, bytes):
+            body_xml = body_xml.decode('utf-8')
+        if 'docPr' in body_xml:
+            body_xml = self._renumber_drawings(body_xml)
+        if self.letters:
+            self._stream.write(self._letter_break.encode('utf-8'))
+        self._stream.write(body_xml.encode('utf-8'))
+        self.letters += 1
+
+    def close(self):
+        if self._stream is None:
+            return
+        self._stream.write(self._tail.encode('utf-8'))
+        self._stream.close()
+        self._stream = None
+        for name in self._remaining:
+            self._zip.writestr(name, self._package.read(name))
+        self._zip.close()
+
+
+class MergedVolumes:
+    """Splits merged output into volumes of up to volume_size letters.
+
+    open_volume(number) returns the binary file for volume number (1, 2...);
+    files are closed when their volume is finished if close_files is set.
+    With no volume_size everything goes into a single document.
+    """
+
+    def __init__(self, open_volume, package, document_partname, document_head, document_tail,
+                 volume_size=None, close_files=True):
+        self._open_volume = open_volume
+        self._document = (package, document_partname, document_head, document_tail)
+        self.volume_size = volume_size or None
+        self.close_files = close_files
+        self.files = []
+        self._current = None
+
+    def add(self, body_xml):
+        if self._current is not None and self.volume_size and self._current.letters >= self.volume_size:
+            self._finish_volume()
+        if self._current is None:
+            f = self._open_volume(len(self.files) + 1)
+            self.files.append(f)
+            self._current = MergedDocument(f, *self._document)
+        self._current.add(body_xml)
+
+    def _finish_volume(self):
+        self._current.close()
+        if self.close_files:
+            self.files[-1].close()
+        self._current = None
+
+    def close(self):
+        if self._current is not None:
+            self._finish_volume()
+
+
+def volume_name(base, number, volume_size=None):
+    """merged_letters.docx without volumes, merged_letters_001.docx... with them"""
+    if not volume_size:
+        return f"{base}.docx"
+    return f"{base}_{number:03d}.docx"
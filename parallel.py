@@ -0,0 +1,72 @@
+import multiprocessing
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
+DEFAULT_CHUNK_SIZE = 50
+
+# State built by the initializer, inside pool worker processes only
+_pool_state = {}
+
+
+def default_workers():
+    """Number of worker processes to offer by default (one per core)"""
+    return os.cpu_count() or 1
+
+
+def chunked(iterable, size):
+    """Yield lists of up to size items from iterable"""
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def _init_pool_worker(initializer, initargs):
+    _pool_state['state'] = initializer(*initargs) if initializer is not None else None
+
+
+def _call_pool_worker(func, chunk):
+    return func(_pool_state['state'], chunk)
+
+
+def ordered_pool_map(func, chunks, workers=1, initializer=None, initargs=()):
+    """Run func(state, chunk) over each chunk and yield the results in input order.
+
+    state is what initializer(*initargs) returns (None without one), built
+    once per worker process, or once for this call when running in-process;
+    several threads (e.g. background jobs) can then map at the same time
+    without seeing each other's state.
+
+    With workers > 1 the chunks are spread over a process pool. Only a small
+    window of chunks is in flight at a time, so chunks can come from a lazy
+    iterator without being materialized up front. Worker functions must be
+    importable module-level functions (the pool uses the spawn start method,
+    which is safe inside Streamlit's threaded server and on Windows).
+    """
+    if workers <= 1:
+        state = initializer(*initargs) if initializer is not None else None
+        for chunk in chunks:
+            yield func(state, chunk)
+        return
+
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=context,
+        initializer=_init_pool_worker,
+        initargs=(initializer, initargs),
+    ) as executor:
+        pending = deque()
+        chunks = iter(chunks)
+        for chunk in islice(chunks, workers * 2):
+            pending.append(executor.submit(_call_pool_worker, func, chunk))
+
+        while pending:
+            result = pending.popleft().result()
+            for chunk in islice(chunks, 1):
+                pending.append(executor.submit(_call_pool_worker, func, chunk))
+            yield result
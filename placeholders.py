@@ -0,0 +1,181 @@
+from collections.abc import Mapping
+from datetime import date
+
+import pandas as pd
+from pandas.api.types import infer_dtype, is_datetime64_any_dtype
+
+AMOUNT_COLUMN = 'Outstanding amount in Rs'
+LANDLINE_COLUMN = 'Landline'
+NAME_COLUMN = 'CUSTOMER NAME'
+
+# Derived fields appended after the sheet columns in every prepared row
+AMOUNT_FIELD = '_amount'            # amount text: formatted, or raw if not a number
+OUTSTANDING_FIELD = '_outstanding'  # formatted amount, None if not a number
+LANDLINE_FIELD = '_landline'
+DATE_FIELD = '_date'
+SALUTATION_FIELD = '_salutation'
+DERIVED_FIELDS = (AMOUNT_FIELD, OUTSTANDING_FIELD, LANDLINE_FIELD, DATE_FIELD, SALUTATION_FIELD)
+
+# Sheet column each derived field is computed from
+DERIVED_SOURCES = {
+    AMOUNT_FIELD: AMOUNT_COLUMN,
+    OUTSTANDING_FIELD: AMOUNT_COLUMN,
+    LANDLINE_FIELD: LANDLINE_COLUMN,
+    SALUTATION_FIELD: NAME_COLUMN,
+}
+
+DATE_FORMAT = '%Y-%m-%d'
+
+
+def column_aliases(column):
+    """Placeholder spellings accepted for an Excel column"""
+    return (
+        column,                    # {CUSTOMER NAME}
+        column.replace(' ', '_'),  # {CUSTOMER_NAME}
+        column.replace(' ', ''),   # {CUSTOMERNAME}
+        column.upper(),            # Uppercase
+        column.lower(),            # Lowercase
+    )
+
+
+# infer_dtype() kinds of object columns that can't hold dates
+_PLAIN_TYPES = frozenset({'empty', 'string', 'integer', 'floating', 'mixed-integer-float', 'decimal', 'boolean'})
+
+
+def _value_text(value):
+    if isinstance(value, date) and value is not pd.NaT:
+        return value.strftime(DATE_FORMAT)
+    return str(value)
+
+
+def column_text(series):
+    """Format a column as display strings: NaN -> '', dates without a time part.
+
+    Dates held as values of an object column (an Excel column mixing dates
+    and text) are formatted like those of a datetime64 column.
+    """
+    if is_datetime64_any_dtype(series):
+        text = series.dt.strftime(DATE_FORMAT)
+    elif series.dtype == object and infer_dtype(series, skipna=True) not in _PLAIN_TYPES:
+        text = series.map(_value_text)
+    else:
+        text = series.astype(str)
+    return text.where(series.notna(), '').tolist()
+
+
+class RowReplacements(Mapping):
+    """Read-only key -> value view of one prepared row, backed by the index"""
+
+    __slots__ = ('_positions', '_values')
+
+    def __init__(self, positions, values):
+        self._positions = positions
+        self._values = values
+
+    def __getitem__(self, key):
+        value = self._values[self._positions[key]]
+        if value is None:
+            raise KeyError(key)
+        return value
+
+    def __iter__(self):
+        return (key for key, position in self._positions.items() if self._values[position] is not None)
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+
+class PlaceholderIndex:
+    """Maps every accepted placeholder spelling to a position in a prepared row.
+
+    Built once per uploaded sheet. prepare() formats a whole chunk of rows
+    with vectorized pandas operations into a row-major table of strings: the
+    sheet columns in order followed by DERIVED_FIELDS. Looking up a
+    placeholder is then a single dict hit and a tuple index.
+    """
+
+    def __init__(self, columns):
+        self.columns = [str(column) for column in columns]
+        self.fields = {column: position for position, column in enumerate(self.columns)}
+        self.aliases = {}
+
+        for position, column in enumerate(self.columns):
+            for alias in column_aliases(column):
+                self.aliases[f'{{{alias}}}'] = position
+
+        derived = len(self.columns)
+        for offset, field in enumerate(DERIVED_FIELDS):
+            self.fields[field] = derived + offset
+
+        self.aliases['{Outstanding amount in Rs}'] = self.fields[AMOUNT_FIELD]
+        self.aliases['{outstanding:,.2f}'] = self.fields[OUTSTANDING_FIELD]
+        self.aliases['{outstanding}'] = self.fields[OUTSTANDING_FIELD]
+        for key in ('{Landline}', '{LANDLINE}', '{landline}'):
+            self.aliases[key] = self.fields[LANDLINE_FIELD]
+        self.aliases['{DATE}'] = self.fields[DATE_FIELD]
+        self.aliases['{date}'] = self.fields[DATE_FIELD]
+        for key in ('{SALUTATION}', '{Salutation}', '{salutation}'):
+            self.aliases[key] = self.fields[SALUTATION_FIELD]
+
+    def position(self, column):
+        """Position of a sheet column, or None if the sheet doesn't have it"""
+        return self.fields.get(column) if column in self.columns else None
+
+    def prepare(self, frame, letter_date_str):
+        """Format a DataFrame chunk (columns as in the index) into a list of value tuples"""
+        rows = len(frame)
+        columns = [column_text(frame.iloc[:, position]) for position in range(len(self.columns))]
+
+        amount_position = self.position(AMOUNT_COLUMN)
+        if amount_position is not None:
+            raw = frame.iloc[:, amount_position]
+            numeric = pd.to_numeric(raw, errors='coerce')
+            formatted = numeric.map('{:,.2f}'.format).astype(object)
+            parsed = numeric.notna()
+            amount = formatted.where(parsed, pd.Series(columns[amount_position], index=raw.index)).tolist()
+            # Blank amounts become empty text; text that isn't a number leaves {outstanding} alone
+            outstanding = formatted.where(parsed, None).where(parsed | raw.notna(), '').tolist()
+        else:
+            amount = outstanding = ['0.00'] * rows
+
+        landline_position = self.position(LANDLINE_COLUMN)
+        landline = columns[landline_position] if landline_position is not None else [''] * rows
+
+        name_position = self.position(NAME_COLUMN)
+        if name_position is not None:
+            names = frame.iloc[:, name_position]
+            # Blanks become '' first: a chunk of only blank names has no strings for .str
+            first_names = names.where(names.notna(), '').astype(str).str.split().str[0]
+            has_name = names.notna() & first_names.notna()
+            salutation = first_names.where(has_name, 'Valued Customer').tolist()
+        else:
+            salutation = ['Valued Customer'] * rows
+
+        dates = [letter_date_str] * rows
+        return list(zip(*columns, amount, outstanding, landline, dates, salutation))
+
+    def replacements(self, values):
+        """Placeholder mapping for one prepared row, usable wherever a dict was"""
+        return RowReplacements(self.aliases, values)
+
+    def record(self, values):
+        """Column/field name mapping for one prepared row (like customer.get on a Series)"""
+        return RowReplacements(self.fields, values)
+
+
+def needed_columns(columns, placeholders, extra=()):
+    """The sheet columns that placeholders (and the extra column names) read, in sheet order.
+
+    Placeholders resolve through the same aliases as PlaceholderIndex, so
+    {CUSTOMER_NAME} needs the CUSTOMER NAME column and {outstanding} needs
+    the amount column. A PlaceholderIndex built on just these columns fills
+    the placeholders exactly like one built on the whole sheet.
+    """
+    index = PlaceholderIndex(columns)
+    names = index.columns + list(DERIVED_FIELDS)
+    wanted = set(extra)
+    for placeholder in placeholders:
+        position = index.aliases.get(placeholder)
+        if position is not None:
+            wanted.add(DERIVED_SOURCES.get(names[position], names[position]))
+    return [column for column in index.columns if column in wanted]
@@ -0,0 +1,211 @@
+import html
+
+from docx import Document
+from docx.enum.text import WD_ALIGN_PARAGRAPH
+from docx.oxml.ns import qn
+from docx.text.run import Run
+
+from template_engine import (
+    PLACEHOLDER_PATTERN, iter_text_parts, paragraph_text_nodes, plan_text_nodes, render_text_node,
+)
+
+_ALIGNMENT = {
+    WD_ALIGN_PARAGRAPH.CENTER: 'center',
+    WD_ALIGN_PARAGRAPH.RIGHT: 'right',
+    WD_ALIGN_PARAGRAPH.JUSTIFY: 'justify',
+}
+
+# What the run children other than w:t show as, like run.text
+_RUN_CHARS = {qn('w:tab'): '\t', qn('w:ptab'): '\t', qn('w:cr'): '\n', qn('w:noBreakHyphen'): '-'}
+
+PREVIEW_CSS = """
+<style>
+.letter-preview { background: white; color: black; padding: 24px 32px; border: 1px solid #ddd;
+                  border-radius: 4px; font-family: Calibri, Arial, sans-serif; font-size: 11pt; }
+.letter-preview p { margin: 0 0 8px 0; min-height: 1em; }
+.letter-preview table { border-collapse: collapse; margin: 8px 0; }
+.letter-preview td { border: 1px solid #bbb; padding: 2px 6px; vertical-align: top; }
+.letter-preview .part { color: #666; border-bottom: 1px dashed #ccc; margin-bottom: 12px; }
+.letter-preview .part.footer { border-bottom: none; border-top: 1px dashed #ccc; margin: 12px 0 0 0; }
+.letter-preview mark { background: #ffd54f; }
+</style>
+"""
+
+
+def _text_html(text, marked=False):
+    text = html.escape(text).replace('\n', '<br>').replace('\t', '&emsp;')
+    return f"<mark>{text}</mark>" if marked and text else text
+
+
+def _run_text(run, node_texts):
+    """The run's text, with the w:t texts found in node_texts swapped for their new text"""
+    pieces = []
+    for child in run.element:
+        if child.tag == qn('w:t'):
+            pieces.append(node_texts.get(child, child.text or ''))
+        elif child.tag == qn('w:br'):
+            # Page and column breaks aren't shown
+            pieces.append('\n' if child.get(qn('w:type')) in (None, 'textWrapping') else '')
+        else:
+            pieces.append(_RUN_CHARS.get(child.tag, ''))
+    return ''.join(pieces)
+
+
+def _run_html(run, text_html):
+    if run.element.find('.//' + qn('w:drawing')) is not None:
+        text_html += '🖼️'
+    if run.bold:
+        text_html = f"<b>{text_html}</b>"
+    if run.italic:
+        text_html = f"<i>{text_html}</i>"
+    if run.underline:
+        text_html = f"<u>{text_html}</u>"
+    return text_html
+
+
+def _runs_html(runs, texts):
+    """The paragraph's runs (with texts) with their formatting, placeholders marked even across runs"""
+    full_text = ''.join(texts)
+    spans = [match.span() for match in PLACEHOLDER_PATTERN.finditer(full_text)]
+
+    out, start = [], 0
+    for run, text in zip(runs, texts):
+        end = start + len(text)
+        # Cut the run where a placeholder starts or ends inside it
+        cuts = sorted({start, end} | {edge for span in spans for edge in span if start < edge < end})
+        pieces = []
+        for left, right in zip(cuts, cuts[1:]):
+            marked = any(a <= left and right <= b for a, b in spans)
+            pieces.append(_text_html(full_text[left:right], marked))
+        out.append(_run_html(run, ''.join(pieces)))
+        start = end
+    return ''.join(out)
+
+
+class _PreviewParagraph:
+    """A paragraph holding placeholders, rendered per row like the letters are.
+
+    Placeholders are planned on the paragraph's w:t texts and values put
+    into the w:t elements they start in (as replace_text_in_runs does), so
+    every run keeps its formatting and tabs or breaks between the text
+    never change what is matched.
+    """
+
+    def __init__(self, runs, nodes, open_tag, close_tag, original_html):
+        self.runs = runs
+        self.plans = [
+            (node, plan) for node, plan in zip(nodes, plan_text_nodes([node.text or '' for node in nodes]))
+            if plan is not None
+        ]
+        self.open_tag = open_tag
+        self.close_tag = close_tag
+        self.original_html = original_html
+
+    def render(self, replacements):
+        node_texts = {}
+        changed = False
+        for node, plan in self.plans:
+            node_texts[node], filled = render_text_node(plan, replacements)
+            changed = changed or filled
+        if not changed:
+            return self.original_html
+        texts = [_run_text(run, node_texts) for run in self.runs]
+        return f"{self.open_tag}{_runs_html(self.runs, texts)}{self.close_tag}"
+
+
+class TemplatePreview:
+    """Lightweight HTML view of a template, rendered for one row at a time.
+
+    The template is walked once (headers, body, footers; paragraphs with
+    their runs, bold/italic/underline, and tables) into static HTML plus a
+    slot for each paragraph with a placeholder. Previewing a row only runs
+    the same substitution as the letters on those slots, so flipping between
+    rows takes milliseconds whatever the size of the template. Placeholders
+    left unresolved are highlighted.
+    """
+
+    def __init__(self, template_file):
+        if hasattr(template_file, 'seek'):
+            template_file.seek(0)
+        doc = Document(template_file)
+
+        self._pieces = ['<div class="letter-preview">']
+        parts = list(iter_text_parts(doc))
+        headers = [part for part in parts if part.content_type.endswith('header+xml')]
+        footers = [part for part in parts if part.content_type.endswith('footer+xml')]
+        for part in headers:
+            self._add_part(part, 'part header')
+        self._add_blocks(doc.element.body, doc.part)
+        for part in footers:
+            self._add_part(part, 'part footer')
+        self._pieces.append('</div>')
+
+        # Neighbouring static pieces are joined up front
+        merged = []
+        for piece in self._pieces:
+            if isinstance(piece, str) and merged and isinstance(merged[-1], str):
+                merged[-1] += piece
+            else:
+                merged.append(piece)
+        self._pieces = merged
+
+    def _add_part(self, part, css_class):
+        self._pieces.append(f'<div class="{css_class}">')
+        self._add_blocks(part.element, part)
+        self._pieces.append('</div>')
+
+    def _add_blocks(self, container, part):
+        for child in container.iterchildren():
+            if child.tag == qn('w:p'):
+                self._add_paragraph(child, part)
+            elif child.tag == qn('w:tbl'):
+                self._add_table(child, part)
+            elif child.tag == qn('w:sdt'):
+                content = child.find(qn('w:sdtContent'))
+                if content is not None:
+                    self._add_blocks(content, part)
+
+    def _add_paragraph(self, p, part):
+        style = p.style or ''
+        tag = 'p'
+        if style == 'Title':
+            tag = 'h1'
+        elif style.startswith('Heading') and style[7:].isdigit():
+            tag = f"h{min(int(style[7:]) + 1, 6)}"
+
+        align = _ALIGNMENT.get(p.alignment)
+        open_tag = f'<{tag} style="text-align: {align}">' if align else f'<{tag}>'
+        close_tag = f'</{tag}>'
+
+        runs = [Run(r, part) for r in p.xpath('./w:r | ./w:hyperlink/w:r')]
+        original_html = f"{open_tag}{_runs_html(runs, [_run_text(run, {}) for run in runs])}{close_tag}"
+        # Same w:t texts the compiled template substitutes
+        nodes = paragraph_text_nodes(p)
+        if any('{' in (node.text or '') for node in nodes):
+            self._pieces.append(_PreviewParagraph(runs, nodes, open_tag, close_tag, original_html))
+        else:
+            self._pieces.append(original_html)
+
+    def _add_table(self, tbl, part):
+        self._pieces.append('<table>')
+        for tr in tbl.findall(qn('w:tr')):
+            self._pieces.append('<tr>')
+            for tc in tr.findall(qn('w:tc')):
+                span = tc.grid_span
+                self._pieces.append(f'<td colspan="{span}">' if span > 1 else '<td>')
+                self._add_blocks(tc, part)
+                self._pieces.append('</td>')
+            self._pieces.append('</tr>')
+        self._pieces.append('</table>')
+
+    def render_html(self, replacements):
+        """HTML for the letter of one row (replacements as for the letters)"""
+        return ''.join(
+            piece if isinstance(piece, str) else piece.render(replacements)
+            for piece in self._pieces
+        )
+
+
+def build_preview(template_file):
+    """Parse a .docx template once for repeated row previews"""
+    return TemplatePreview(template_file)
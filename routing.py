@@ -0,0 +1,37 @@
+import os
+from collections import namedtuple
+
+# Rows whose column holds value (ignoring case and surrounding spaces) get template
+RoutingRule = namedtuple('RoutingRule', 'column value template')
+
+
+def template_folder(name):
+    """Archive folder for the letters of a template (its file name without extension)"""
+    return os.path.splitext(os.path.basename(name))[0]
+
+
+class TemplateRouter:
+    """Picks the template for each row from an ordered list of RoutingRules.
+
+    The first rule whose column matches decides; rows no rule matches use
+    default. Rows are given as the mapping from PlaceholderIndex.record(),
+    so the values compared are the same text the letters show.
+    """
+
+    def __init__(self, rules, default):
+        self.rules = [
+            RoutingRule(rule.column, str(rule.value).strip().casefold(), rule.template)
+            for rule in rules
+        ]
+        self.default = default
+
+    @property
+    def templates(self):
+        """Every template a row can be routed to"""
+        return {self.default} | {rule.template for rule in self.rules}
+
+    def route(self, record):
+        for rule in self.rules:
+            if str(record.get(rule.column) or '').strip().casefold() == rule.value:
+                return rule.template
+        return self.default
@@ -0,0 +1,481 @@
+import copy
+import io
+import os
+import sqlite3
+from contextlib import closing
+from itertools import islice
+from pathlib import Path
+
+import pandas as pd
+from openpyxl import load_workbook
+
+try:
+    from sheet_parser import ProjectedSheetParser
+except ImportError:
+    # openpyxl moved the private parts the projected parser is built on
+    ProjectedSheetParser = None
+
+DEFAULT_CHUNK_ROWS = 1000
+
+# File types each row source reads, by extension; anything else is read as Excel
+EXCEL_EXTENSIONS = ('.xlsx', '.xlsm', '.xls')
+CSV_EXTENSIONS = ('.csv', '.txt')
+PARQUET_EXTENSIONS = ('.parquet', '.pq')
+SQLITE_EXTENSIONS = ('.db', '.sqlite', '.sqlite3')
+ROW_SOURCE_EXTENSIONS = EXCEL_EXTENSIONS + CSV_EXTENSIONS + PARQUET_EXTENSIONS + SQLITE_EXTENSIONS
+
+
+def _normalize_header(header):
+    """Column names the way pd.read_excel names them (Unnamed: n, A.1 for duplicates)"""
+    columns = []
+    seen = {}
+    for position, name in enumerate(header):
+        name = f"Unnamed: {position}" if name is None else str(name)
+        if name in seen:
+            seen[name] += 1
+            name = f"{name}.{seen[name]}"
+        else:
+            seen[name] = 0
+        columns.append(name)
+    return columns
+
+
+def _rewind(data_file):
+    """A readable source for data_file: bytes get their own buffer, files are rewound"""
+    if isinstance(data_file, (bytes, bytearray, memoryview)):
+        return io.BytesIO(data_file)
+    if hasattr(data_file, 'seek'):
+        data_file.seek(0)
+    return data_file
+
+
+def _frames_in_range(frames, columns, chunk_rows, start_row, end_row, position=0):
+    """Cut consecutive DataFrames into chunk_rows frames for data rows start_row..end_row.
+
+    frames start at data row position + 1. Frames come out with the given
+    column names and indexed like pd.read_excel would index the whole sheet.
+    """
+    first = start_row - 1
+    pending = []
+
+    def take(rows):
+        nonlocal first, pending
+        frame = pd.concat(pending) if len(pending) > 1 else pending[0]
+        chunk = frame.iloc[:rows].copy()
+        pending = [frame.iloc[rows:]] if rows < len(frame) else []
+        chunk.columns = columns
+        chunk.index = range(first, first + len(chunk))
+        first += len(chunk)
+        return chunk
+
+    for frame in frames:
+        low = max(start_row - 1 - position, 0)
+        high = len(frame) if end_row is None else min(len(frame), end_row - position)
+        position += len(frame)
+        if high > low:
+            pending.append(frame.iloc[low:high])
+        while sum(len(part) for part in pending) >= chunk_rows:
+            yield take(chunk_rows)
+        if end_row is not None and position >= end_row:
+            break
+    if pending:
+        yield take(chunk_rows)
+
+
+class RowSource:
+    """Common interface of the row sources.
+
+    Subclasses set all_columns (every column of the data, named the way
+    pd.read_excel would name them) and implement count_rows() and
+    iter_chunks(). columns are the columns the rows come out with: all of
+    them, or only those picked with select(), which the sources then skip
+    when reading.
+    """
+
+    def select(self, columns):
+        """A view of this source that only reads the given columns (kept in source order).
+
+        With none of them in the data the first column is kept, so the rows
+        are still there to be counted.
+        """
+        wanted = set(columns)
+        view = copy.copy(self)
+        view.columns = [column for column in self.all_columns if column in wanted] or self.all_columns[:1]
+        return view
+
+    def _positions(self):
+        """Positions in all_columns of the selected columns"""
+        positions = {column: position for position, column in enumerate(self.all_columns)}
+        return [positions[column] for column in self.columns]
+
+    def iter_rows(self, start_row=1, end_row=None, chunk_rows=DEFAULT_CHUNK_ROWS):
+        """Yield row value tuples aligned with columns"""
+        for chunk in self.iter_chunks(chunk_rows, start_row, end_row):
+            yield from chunk.itertuples(index=False, name=None)
+
+    def head(self, n=10):
+        """First n rows as a DataFrame"""
+        return next(self.iter_chunks(n, 1, n), pd.DataFrame(columns=self.columns))
+
+
+class ExcelRowSource(RowSource):
+    """Streams customer rows from the first worksheet of a workbook.
+
+    .xlsx files are read in a streaming pass over the sheet XML, so rows are
+    parsed as they are consumed and memory stays flat whatever the sheet
+    size; only the cells of the selected columns are converted to values.
+    Rows come out in DataFrame chunks (or as plain tuples aligned with
+    columns) whose columns hold the cell values as they are, as object
+    dtype, so a column has the same dtype in every chunk whatever mix of
+    dates, numbers and text it holds. Legacy .xls files fall back to
+    pd.read_excel. When given the
+    workbook as bytes, every read opens its own buffer, so one source can be
+    shared between sessions.
+    """
+
+    def __init__(self, excel_file):
+        self.excel_file = excel_file
+        self._frame = None
+        self._count = None
+        if not self._is_xlsx():
+            self._frame = pd.read_excel(self._rewind())
+            self.all_columns = self.columns = [str(column) for column in self._frame.columns]
+            return
+
+        workbook, sheet = self._open()
+        try:
+            header = next(sheet.iter_rows(max_row=1, values_only=True), ())
+            self.all_columns = self.columns = _normalize_header(header)
+        finally:
+            workbook.close()
+
+    def _rewind(self):
+        return _rewind(self.excel_file)
+
+    def _is_xlsx(self):
+        source = self._rewind()
+        if hasattr(source, 'read'):
+            signature = source.read(2)
+        else:
+            with open(source, 'rb') as f:
+                signature = f.read(2)
+        return signature == b'PK'
+
+    def _open(self):
+        workbook = load_workbook(self._rewind(), read_only=True, data_only=True)
+        return workbook, workbook.worksheets[0]
+
+    def count_rows(self):
+        """Number of data rows, up to the last row with a value (counted once).
+
+        The sheet's recorded dimensions also cover rows that only have
+        formatting, so the rows are read (without converting their values)
+        and trailing blank rows are left out, like _iter_values does.
+        """
+        if self._frame is not None:
+            return len(self._frame)
+        if self._count is None:
+            self._count = self._count_data_rows()
+        return self._count
+
+    def _count_data_rows(self):
+        if not self.all_columns:
+            return 0
+        workbook, sheet = self._open()
+        try:
+            # One wanted column is enough: has_value looks at every column
+            rows = self._projected_rows(workbook, sheet, [0])
+            if rows is None:
+                rows = self._public_rows(sheet, list(range(len(self.all_columns))), 2, None)
+            last = 1
+            for number, _, has_value in rows:
+                if has_value:
+                    last = number
+            # Sheet row 1 is the header
+            return max(last - 1, 0)
+        finally:
+            workbook.close()
+
+    def _projected_rows(self, workbook, sheet, positions):
+        """(row number, values, has_value) per sheet row from ProjectedSheetParser.
+
+        None when this openpyxl doesn't have the private parts it relies on.
+        """
+        if ProjectedSheetParser is None:
+            return None
+        try:
+            options = {
+                'shared_strings': sheet._shared_strings, 'epoch': workbook.epoch,
+                'date_formats': workbook._date_formats, 'timedelta_formats': workbook._timedelta_formats,
+            }
+            xml = sheet._get_source()
+        except AttributeError:
+            return None
+        return self._parse_projected(xml, options, positions)
+
+    def _parse_projected(self, xml, options, positions):
+        wanted = {position + 1: index for index, position in enumerate(positions)}
+        with xml:
+            parser = ProjectedSheetParser(
+                xml, data_only=True, wanted=wanted, width=len(self.all_columns), **options
+            )
+            for number, cells, has_value in parser.parse():
+                values = [None] * len(positions)
+                for column, value in cells.items():
+                    values[wanted[column]] = value
+                yield number, tuple(values), has_value
+
+    def _public_rows(self, sheet, positions, first, last):
+        """(row number, values, has_value) per sheet row through the public iter_rows.
+
+        Cells from the first to the last selected column are read; a row only
+        counts as blank when all of those are empty.
+        """
+        low = min(positions)
+        offsets = [position - low for position in positions]
+        rows = sheet.iter_rows(
+            min_row=first, max_row=last, min_col=low + 1, max_col=max(positions) + 1, values_only=True
+        )
+        for number, row in enumerate(rows, first):
+            yield number, tuple(row[offset] for offset in offsets), any(value is not None for value in row)
+
+    def _iter_sheet_rows(self, workbook, sheet, first, last):
+        """(values, has_value) for sheet rows first..last, rows missing from the XML as blanks"""
+        positions = self._positions()
+        rows = self._projected_rows(workbook, sheet, positions)
+        if rows is None:
+            rows = self._public_rows(sheet, positions, first, last)
+        blank = (None,) * len(positions)
+        expected = first
+        for number, values, has_value in rows:
+            if number < first:
+                continue
+            if last is not None and number > last:
+                # Blank rows up to last when the sheet goes on past it
+                for _ in range(expected, last + 1):
+                    yield blank, False
+                break
+            for _ in range(expected, number):
+                yield blank, False
+            expected = number + 1
+            yield values, has_value
+
+    def _iter_values(self, start_row, end_row):
+        if self._frame is not None:
+            frame = self._frame.iloc[start_row - 1:end_row, self._positions()]
+            yield from frame.itertuples(index=False, name=None)
+            return
+
+        workbook, sheet = self._open()
+        try:
+            # Sheet row 1 is the header, so data row n is sheet row n + 1
+            rows = self._iter_sheet_rows(
+                workbook, sheet, start_row + 1, end_row + 1 if end_row is not None else None
+            )
+            blank_run = []
+            for values, has_value in rows:
+                # Trailing blank rows are dropped like pd.read_excel does
+                if not has_value:
+                    blank_run.append(values)
+                    continue
+                yield from blank_run
+                blank_run.clear()
+                yield values
+            # Blanks at the end of a partial range are real rows only when a
+            # row with a value follows them (count_rows ends at the last one)
+            if end_row is not None and end_row < self.count_rows():
+                yield from blank_run
+        finally:
+            workbook.close()
+
+    def iter_chunks(self, chunk_rows=DEFAULT_CHUNK_ROWS, start_row=1, end_row=None):
+        """Yield DataFrames of up to chunk_rows rows from start_row to end_row (1-based).
+
+        Each frame is indexed like pd.read_excel would index the whole sheet
+        (data row n has index n - 1).
+        """
+        values = self._iter_values(start_row, end_row)
+        first = start_row - 1
+        while True:
+            rows = list(islice(values, chunk_rows))
+            if not rows:
+                return
+            yield pd.DataFrame(rows, columns=self.columns, index=range(first, first + len(rows)), dtype=object)
+            first += len(rows)
+
+
+class CsvRowSource(RowSource):
+    """Streams customer rows from a CSV file with a header line.
+
+    Every value is read as text (blank cells as missing), so account numbers
+    keep their leading zeros; amounts are still formatted as numbers when
+    letters are prepared. Only the selected columns are parsed.
+    """
+
+    def __init__(self, csv_file):
+        self.csv_file = csv_file
+        header = pd.read_csv(_rewind(csv_file), nrows=0, encoding='utf-8-sig')
+        self.all_columns = self.columns = [str(column) for column in header.columns]
+        self._count = None
+
+    def _read(self, chunk_rows, usecols=None):
+        return pd.read_csv(
+            _rewind(self.csv_file), usecols=usecols, dtype=str, keep_default_na=False, na_values=[''],
+            encoding='utf-8-sig', chunksize=chunk_rows,
+        )
+
+    def count_rows(self):
+        """Number of data rows (counted once, reading only the first column)"""
+        if self._count is None:
+            self._count = 0
+            if self.all_columns:
+                with self._read(DEFAULT_CHUNK_ROWS * 10, usecols=[0]) as reader:
+                    self._count = sum(len(chunk) for chunk in reader)
+        return self._count
+
+    def iter_chunks(self, chunk_rows=DEFAULT_CHUNK_ROWS, start_row=1, end_row=None):
+        """Yield DataFrames of up to chunk_rows rows from start_row to end_row (1-based)"""
+        with self._read(chunk_rows, usecols=self._positions()) as reader:
+            # usecols keeps file order, which is also the order of columns
+            yield from _frames_in_range(reader, self.columns, chunk_rows, start_row, end_row)
+
+
+class ParquetRowSource(RowSource):
+    """Streams customer rows from a Parquet file (needs pyarrow).
+
+    Only the selected columns are read, and row groups before start_row are
+    skipped without being decoded.
+    """
+
+    def __init__(self, parquet_file):
+        self.parquet_file = parquet_file
+        with closing(self._open()) as parquet:
+            self._names = parquet.schema_arrow.names
+            self.all_columns = self.columns = _normalize_header(self._names)
+            self._row_groups = [
+                parquet.metadata.row_group(group).num_rows for group in range(parquet.num_row_groups)
+            ]
+
+    def _open(self):
+        try:
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise ImportError("Reading Parquet files needs pyarrow (pip install pyarrow)")
+        return pq.ParquetFile(_rewind(self.parquet_file))
+
+    def count_rows(self):
+        return sum(self._row_groups)
+
+    def iter_chunks(self, chunk_rows=DEFAULT_CHUNK_ROWS, start_row=1, end_row=None):
+        """Yield DataFrames of up to chunk_rows rows from start_row to end_row (1-based)"""
+        # Row groups that end before start_row aren't read at all
+        position = 0
+        groups = []
+        for group, rows in enumerate(self._row_groups):
+            if position + rows < start_row and not groups:
+                position += rows
+                continue
+            groups.append(group)
+        if not groups:
+            return
+
+        positions = self._positions()
+        # Columns are read by name, so with duplicate names all are read and picked by position
+        names = None
+        if len(set(self._names)) == len(self._names):
+            names = [self._names[position] for position in positions]
+        with closing(self._open()) as parquet:
+            batches = parquet.iter_batches(
+                batch_size=chunk_rows, row_groups=groups, columns=names, use_threads=False
+            )
+            frames = (batch.to_pandas() for batch in batches)
+            if names is None:
+                frames = (frame.iloc[:, positions] for frame in frames)
+            yield from _frames_in_range(frames, self.columns, chunk_rows, start_row, end_row, position)
+
+
+class SqliteRowSource(RowSource):
+    """Streams customer rows from a query on a local SQLite database.
+
+    The query defaults to every row of the database's first table; give it
+    an ORDER BY so row numbers (and resumed runs) are stable. Rows are
+    fetched from one cursor chunk_rows at a time and only the selected
+    columns are queried. Values come out as the database returns them, in
+    object columns, like ExcelRowSource's. An uploaded database given as
+    bytes is opened in memory.
+    """
+
+    def __init__(self, database, query=None):
+        self.database = database
+        with closing(self._connect()) as connection:
+            if query is None:
+                table = connection.execute(
+                    "SELECT name FROM sqlite_master WHERE type = 'table' ORDER BY rowid LIMIT 1"
+                ).fetchone()
+                if table is None:
+                    raise ValueError("The database has no tables")
+                query = f"SELECT * FROM {self._quote(table[0])}"
+            self.query = query
+            cursor = connection.execute(f"SELECT * FROM ({query}) LIMIT 0")
+            self._names = [description[0] for description in cursor.description]
+        self.all_columns = self.columns = _normalize_header(self._names)
+        self._count = None
+
+    @staticmethod
+    def _quote(name):
+        return '"' + str(name).replace('"', '""') + '"'
+
+    def _connect(self):
+        if isinstance(self.database, (bytes, bytearray, memoryview)):
+            connection = sqlite3.connect(':memory:')
+            connection.deserialize(bytes(self.database))
+            return connection
+        return sqlite3.connect(Path(self.database).resolve().as_uri() + '?mode=ro', uri=True)
+
+    def count_rows(self):
+        if self._count is None:
+            with closing(self._connect()) as connection:
+                self._count = connection.execute(f"SELECT COUNT(*) FROM ({self.query})").fetchone()[0]
+        return self._count
+
+    def _select(self):
+        """The query for the selected columns, and the positions to pick from its rows (or None)"""
+        positions = self._positions()
+        names = [self._names[position] for position in positions]
+        # Columns renamed as duplicates (A.1) can't be named in SQL, so all are fetched
+        if len(set(self._names)) == len(self._names):
+            return f"SELECT {', '.join(self._quote(name) for name in names)} FROM ({self.query})", None
+        return f"SELECT * FROM ({self.query})", positions
+
+    def iter_chunks(self, chunk_rows=DEFAULT_CHUNK_ROWS, start_row=1, end_row=None):
+        """Yield DataFrames of up to chunk_rows rows from start_row to end_row (1-based)"""
+        query, positions = self._select()
+        limit = end_row - start_row + 1 if end_row is not None else -1
+        first = start_row - 1
+        with closing(self._connect()) as connection:
+            cursor = connection.execute(f"{query} LIMIT ? OFFSET ?", (limit, first))
+            while True:
+                rows = cursor.fetchmany(chunk_rows)
+                if not rows:
+                    return
+                if positions is not None:
+                    rows = [tuple(row[position] for position in positions) for row in rows]
+                yield pd.DataFrame(rows, columns=self.columns, index=range(first, first + len(rows)), dtype=object)
+                first += len(rows)
+
+
+def open_row_source(data_file, name=None, query=None):
+    """The row source for a customer data file, picked by its extension.
+
+    name is the file name when data_file is an upload's bytes. query (SQL)
+    applies to SQLite databases. Files of other types are read as Excel.
+    """
+    path = name or (data_file if isinstance(data_file, (str, os.PathLike)) else '')
+    extension = os.path.splitext(str(path))[1].lower()
+    if extension in CSV_EXTENSIONS:
+        return CsvRowSource(data_file)
+    if extension in PARQUET_EXTENSIONS:
+        return ParquetRowSource(data_file)
+    if extension in SQLITE_EXTENSIONS:
+        return SqliteRowSource(data_file, query)
+    return ExcelRowSource(data_file)
@@ -0,0 +1,30 @@
+import hashlib
+
+SHARD_BY = ('row', 'account')
+
+
+def parse_shard(spec):
+    """'3/16' -> (3, 16); shards are numbered from 1"""
+    try:
+        index, count = (int(part) for part in spec.split('/'))
+    except ValueError:
+        raise ValueError(f"Shard must look like K/N (e.g. 3/16), not {spec!r}") from None
+    if count < 1 or not 1 <= index <= count:
+        raise ValueError(f"Shard {spec} is out of range: K must be between 1 and N")
+    return index, count
+
+
+def shard_rows(start_row, end_row, index, count):
+    """The contiguous block of rows start_row..end_row that shard index of count owns.
+
+    Returns (first, last); first > last when the shard has no rows.
+    """
+    size = -(-(end_row - start_row + 1) // count)
+    first = start_row + (index - 1) * size
+    return first, min(first + size - 1, end_row)
+
+
+def account_shard(account, count):
+    """Shard (1..count) for a billing account, the same on every machine and Python"""
+    digest = hashlib.sha1(str(account).encode('utf-8')).digest()
+    return int.from_bytes(digest[:8], 'big') % count + 1
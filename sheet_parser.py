@@ -0,0 +1,88 @@
+from openpyxl.utils import column_index_from_string
+from openpyxl.utils.datetime import from_excel, from_ISO8601
+from openpyxl.worksheet._reader import INLINE_STRING, SHEET_MAIN_NS, VALUE_TAG, WorkSheetParser, _cast_number
+
+_TEXT_TAG = f'{{{SHEET_MAIN_NS}}}t'
+_RUN_TEXT = f'{{{SHEET_MAIN_NS}}}r/{{{SHEET_MAIN_NS}}}t'
+
+
+class ProjectedSheetParser(WorkSheetParser):
+    """WorkSheetParser that only converts the cells of the wanted columns.
+
+    Values come out as parse_cell() gives them with data_only (cached
+    formula results), without building a cell dict per cell. The other
+    cells are only checked for a value when a row has nothing in the wanted
+    columns, so blank rows are still told apart from rows whose data is all
+    in columns that aren't read.
+
+    Built on openpyxl's private sheet reader, so it is only tested with the
+    openpyxl versions requirements.txt allows; row_sources falls back to the
+    public iter_rows when this module can't be imported.
+    """
+
+    def __init__(self, *args, wanted, width, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.wanted = wanted
+        self.width = width
+        self._column_numbers = {}
+
+    def _column(self, element):
+        coordinate = element.get('r')
+        if not coordinate:
+            return self.col_counter + 1
+        letters = coordinate.rstrip('0123456789')
+        number = self._column_numbers.get(letters)
+        if number is None:
+            number = self._column_numbers[letters] = column_index_from_string(letters)
+        return number
+
+    def _value(self, element):
+        data_type = element.get('t', 'n')
+        if data_type == 'inlineStr':
+            text = element.find(INLINE_STRING)
+            if text is None:
+                return None
+            plain = text.find(_TEXT_TAG)
+            snippets = [plain.text or ''] if plain is not None else []
+            snippets += [run.text or '' for run in text.iterfind(_RUN_TEXT)]
+            return ''.join(snippets)
+
+        value = element.findtext(VALUE_TAG) or None
+        if value is None:
+            return None
+        if data_type == 'n':
+            value = _cast_number(value)
+            style_id = int(element.get('s', 0))
+            if style_id in self.date_formats:
+                try:
+                    return from_excel(value, self.epoch, timedelta=style_id in self.timedelta_formats)
+                except (OverflowError, ValueError):
+                    return '#VALUE!'
+            return value
+        if data_type == 's':
+            return self.shared_strings[int(value)]
+        if data_type == 'b':
+            return bool(int(value))
+        if data_type == 'd':
+            return from_ISO8601(value)
+        return value
+
+    def parse_row(self, row):
+        number = row.get('r')
+        self.row_counter = int(float(number)) if number else self.row_counter + 1
+        self.col_counter = 0
+
+        cells = {}
+        skipped = []
+        for element in row:
+            column = self.col_counter = self._column(element)
+            if column in self.wanted:
+                cells[column] = self._value(element)
+            elif column <= self.width:
+                skipped.append(element)
+
+        has_value = any(value is not None for value in cells.values()) or any(
+            element.findtext(VALUE_TAG) or element.find(INLINE_STRING) is not None
+            for element in skipped
+        )
+        return self.row_counter, cells, has_value
@@ -0,0 +1,560 @@
+import re
+import time
+from copy import deepcopy
+from xml.sax.saxutils import escape
+
+from docx import Document
+from docx.opc.constants import RELATIONSHIP_TYPE as RT
+from docx.oxml import OxmlElement
+from docx.oxml.ns import nsmap, qn
+from docx.text.paragraph import Paragraph
+from lxml import etree
+
+from docx_writer import DocxPackageWriter
+
+PLACEHOLDER_PATTERN = re.compile(r'\{[^}]+\}')
+
+# Put in any cell of a table row to repeat that row once per row of a group
+# (see CompiledTemplate.render); the marker itself is removed from letters
+REPEAT_MARKER = '{REPEAT}'
+
+# Processing-instruction markers used to cut the serialized document into
+# static fragments and per-paragraph slots at compile time
+_SLOT_MARKER = re.compile(r'<\?docgen-[a-z]+ ?\?>')
+_REPEAT_SPLIT = re.compile(r'<\?docgen-repeat(?:end)? ?\?>')
+_TEXT_MARKER = re.compile(r'<\?docgen-text(?:end)? ?\?>')
+
+# The w:t elements that make up a paragraph's own text (not that of a text box it anchors)
+_TEXT_NODES = './w:r/w:t | ./w:hyperlink/w:r/w:t'
+
+_BODY_OPEN = re.compile(r'<(\w+):body\b[^>]*>')
+
+# Parts besides the main document whose paragraphs can hold placeholders
+_TEXT_PART_RELATIONSHIPS = (RT.HEADER, RT.FOOTER)
+
+_XML_DECLARATION = "<?xml version='1.0' encoding='UTF-8' standalone='yes'?>\n"
+
+
+def replace_text_in_paragraph(paragraph, replacements, debug=False):
+    """Replace all placeholders in a paragraph, handling split runs.
+
+    The paragraph is rebuilt as one plain run, so its run formatting is
+    lost; replace_text_in_runs keeps it.
+    """
+    # Get full paragraph text
+    full_text = paragraph.text
+
+    # Replace all placeholders in one pass over the full text
+    new_text = substitute_text(full_text, replacements, debug)
+
+    # Only proceed if text actually changed
+    if new_text == full_text:
+        return False
+
+    # Clear paragraph completely using XML manipulation
+    for run in list(paragraph.runs):
+        r = run._element
+        r.getparent().remove(r)
+
+    # Add the replaced text as a new run
+    paragraph.add_run(new_text)
+    return True
+
+
+def paragraph_text_nodes(p):
+    """The w:t elements of a w:p element that placeholders are planned on (see plan_text_nodes)"""
+    return p.xpath(_TEXT_NODES)
+
+
+def replace_text_in_runs(paragraph, replacements, debug=False):
+    """Replace all placeholders in a paragraph by editing only the w:t elements they cover.
+
+    Every run keeps its formatting (a bold "Date:" stays bold). A
+    placeholder split over several runs is filled in the run it starts in.
+    Tabs and line breaks in a value become w:tab/w:br next to the text.
+    """
+    nodes = paragraph_text_nodes(paragraph._p)
+    changed = False
+    for node, plan in zip(nodes, plan_text_nodes([node.text or '' for node in nodes])):
+        if plan is None:
+            continue
+        text, filled = render_text_node(plan, replacements, debug)
+        if not filled:
+            continue
+        changed = True
+        preserve = node.get(qn('xml:space')) == 'preserve'
+        if not _SPLIT_CHARS.search(text):
+            node.text = text
+            if not preserve and len(text.strip()) < len(text):
+                node.set(qn('xml:space'), 'preserve')
+            continue
+        for element in _run_content_elements(text):
+            node.addprevious(element)
+        node.getparent().remove(node)
+    return changed
+
+
+def plan_text_nodes(texts):
+    """Map a paragraph's placeholders onto its text pieces (w:t texts, or run texts).
+
+    Returns one plan per piece: None if no placeholder touches it, else a
+    list of literal strings and (placeholder, text, first) tuples, text
+    being the part of the placeholder inside this piece and first telling
+    whether it starts here. See render_text_node.
+    """
+    full = ''.join(texts)
+    spans = [(match.start(), match.end(), match.group(0)) for match in PLACEHOLDER_PATTERN.finditer(full)]
+    plans = []
+    start = 0
+    for text in texts:
+        end = start + len(text)
+        pieces = []
+        position = start
+        for left, right, key in spans:
+            if right <= start or left >= end:
+                continue
+            if left > position:
+                pieces.append(full[position:left])
+            pieces.append((key, full[max(left, start):min(right, end)], left >= start))
+            position = min(right, end)
+        if pieces and position < end:
+            pieces.append(full[position:end])
+        plans.append(pieces or None)
+        start = end
+    return plans
+
+
+def render_text_node(plan, replacements, debug=False):
+    """New text of a piece planned by plan_text_nodes, and whether a placeholder was filled.
+
+    A filled placeholder's value goes where it starts and its text is
+    dropped from the other pieces; unknown ones are left as they are.
+    REPEAT_MARKER always counts as filled with nothing.
+    """
+    out = []
+    filled = False
+    for piece in plan:
+        if isinstance(piece, str):
+            out.append(piece)
+            continue
+        key, text, first = piece
+        value = '' if key == REPEAT_MARKER else replacements.get(key)
+        if value is None:
+            out.append(text)
+            continue
+        filled = True
+        if first:
+            if debug and key != REPEAT_MARKER:
+                print(f"  ✓ Replaced: {key} → {value}")
+            out.append(str(value))
+    return ''.join(out), filled
+
+
+def iter_text_parts(doc):
+    """Yield the main document part, then its header and footer parts"""
+    yield doc.part
+    for rel in doc.part.rels.values():
+        if rel.reltype in _TEXT_PART_RELATIONSHIPS and not rel.is_external:
+            yield rel.target_part
+
+
+def iter_part_paragraphs(part, anchors=False):
+    """Yield every paragraph of a part in document order.
+
+    Walking the XML rather than doc.paragraphs/doc.tables also reaches
+    nested tables, text boxes and content controls, and visits merged cells
+    once. A paragraph that anchors a text box contains the box's paragraphs;
+    it is skipped unless anchors is set, since rebuilding it would drop the
+    box (editing its own text in place is safe).
+    """
+    for p in part.element.iter(qn('w:p')):
+        if not anchors and p.find('.//' + qn('w:p')) is not None:
+            continue
+        yield Paragraph(p, part)
+
+
+def iter_document_paragraphs(doc, anchors=False):
+    """Yield the paragraphs replace_text_in_document visits, each once"""
+    for part in iter_text_parts(doc):
+        yield from iter_part_paragraphs(part, anchors)
+
+
+def replace_text_in_document(doc, replacements, debug=False, in_place=True):
+    """Replace all placeholders in document with customer data.
+
+    in_place edits the text where it is and keeps the runs' formatting
+    (replace_text_in_runs); without it each changed paragraph is rebuilt
+    as one plain run (replace_text_in_paragraph).
+    """
+    replaced_count = 0
+    replace = replace_text_in_runs if in_place else replace_text_in_paragraph
+
+    for paragraph in iter_document_paragraphs(doc, anchors=in_place):
+        if replace(paragraph, replacements, debug):
+            replaced_count += 1
+
+    return replaced_count
+
+
+def substitute_text(text, replacements, debug=False):
+    """Replace every {...} token found in replacements in a single regex pass.
+
+    replacements is any mapping of placeholder -> value, e.g. a dict or the
+    per-row view from PlaceholderIndex.replacements(). Unknown tokens are
+    left as they are.
+    """
+    if '{' not in text:
+        return text
+
+    def lookup(match):
+        key = match.group(0)
+        value = replacements.get(key)
+        if value is None:
+            return key
+        if debug:
+            print(f"  ✓ Replaced: {key} → {value}")
+        return str(value)
+
+    return PLACEHOLDER_PATTERN.sub(lookup, text)
+
+
+_SPLIT_CHARS = re.compile(r'[\t\r\n]')
+
+
+def _run_content_elements(text):
+    """w:t/w:tab/w:br elements for text, as python-docx's run.text setter makes them"""
+    run = OxmlElement('w:r')
+    run.text = text
+    return list(run)
+
+
+def _text_xml(text, prefix, preserve=False):
+    """Serialize the w:t of replace_text_in_runs for its new text (preserve: it had xml:space)"""
+    if _SPLIT_CHARS.search(text):
+        return _run_content_xml(text, prefix)
+    space = ' xml:space="preserve"' if preserve or len(text.strip()) < len(text) else ''
+    return f'<{prefix}:t{space}>{escape(text)}</{prefix}:t>'
+
+
+def _run_xml(text, prefix):
+    """Serialize a run the way python-docx's paragraph.add_run(text) builds it"""
+    if not text:
+        return f'<{prefix}:r/>'
+    return f'<{prefix}:r>{_run_content_xml(text, prefix)}</{prefix}:r>'
+
+
+def _run_content_xml(text, prefix):
+    parts = []
+    buffer = []
+
+    def flush():
+        if buffer:
+            chunk = ''.join(buffer)
+            space = ' xml:space="preserve"' if len(chunk.strip()) < len(chunk) else ''
+            parts.append(f'<{prefix}:t{space}>{escape(chunk)}</{prefix}:t>')
+            buffer.clear()
+
+    for char in text:
+        if char == '\t':
+            flush()
+            parts.append(f'<{prefix}:tab/>')
+        elif char in '\r\n':
+            flush()
+            parts.append(f'<{prefix}:br/>')
+        else:
+            buffer.append(char)
+    flush()
+    return ''.join(parts)
+
+
+def split_document_xml(xml):
+    """Split a main document part into (head through <w:body>, body content, tail).
+
+    The tail is the body-level section properties plus the closing tags, so
+    bodies from several renders can be joined between one head and one tail.
+    """
+    match = _BODY_OPEN.search(xml)
+    prefix, start = match.group(1), match.end()
+    end = xml.rfind(f'<{prefix}:sectPr')
+    if end < start:
+        end = xml.rfind(f'</{prefix}:body>')
+    return xml[:start], xml[start:end], xml[end:]
+
+
+class _Segment:
+    """A stretch of a part: static fragments with one slot per placeholder paragraph"""
+
+    unit = 'paragraphs'
+
+    def __init__(self, xml, slot_texts, forced):
+        parts = _SLOT_MARKER.split(xml)
+        self.static = parts[0::4]
+        self.original = parts[1::4]
+        self.prefixes = parts[2::4]
+        self.suffixes = parts[3::4]
+        self.slot_texts = slot_texts
+        self.slots = len(slot_texts)
+        # Slots that held REPEAT_MARKER are always rewritten, so the marker goes
+        self.forced = forced
+
+    def render(self, replacements, prefix, out):
+        """Append the segment for one row to out; returns the number of rewritten paragraphs"""
+        out.append(self.static[0])
+        rewritten = 0
+        for index, text in enumerate(self.slot_texts):
+            new_text = substitute_text(text, replacements)
+            if new_text == text and not self.forced[index]:
+                out.append(self.original[index])
+            else:
+                out.append(self.prefixes[index])
+                out.append(_run_xml(new_text, prefix))
+                out.append(self.suffixes[index])
+                rewritten += 1
+            out.append(self.static[index + 1])
+        return rewritten
+
+
+class _TextSegment:
+    """A stretch of a part: static fragments with one slot per w:t a placeholder touches"""
+
+    unit = 'text_nodes'
+
+    def __init__(self, xml, plans, preserve):
+        parts = _TEXT_MARKER.split(xml)
+        self.static = parts[0::2]
+        self.original = parts[1::2]
+        self.plans = plans
+        self.slots = len(plans)
+        self.preserve = preserve
+
+    def render(self, replacements, prefix, out):
+        """Append the segment for one row to out; returns the number of rewritten text nodes"""
+        out.append(self.static[0])
+        rewritten = 0
+        for index, plan in enumerate(self.plans):
+            text, filled = render_text_node(plan, replacements)
+            if filled:
+                out.append(_text_xml(text, prefix, self.preserve[index]))
+                rewritten += 1
+            else:
+                out.append(self.original[index])
+            out.append(self.static[index + 1])
+        return rewritten
+
+
+class _CompiledPart:
+    """One XML part cut into static fragments and one slot per placeholder paragraph.
+
+    With in_place the slots are the w:t elements the placeholders cover
+    instead, edited like replace_text_in_runs does. Table rows marked with
+    REPEAT_MARKER become their own segments, which are rendered once per
+    row of a group; the rest is rendered once.
+    """
+
+    def __init__(self, root, slot_texts, repeat_rows=(), in_place=False):
+        self.prefix = next(
+            (key for key, uri in root.nsmap.items() if key and uri == nsmap['w']), 'w'
+        )
+        if in_place:
+            self._mark_text_nodes(root, slot_texts, repeat_rows)
+            return
+
+        # Wrap every paragraph that could contain a placeholder in markers:
+        # original paragraph, then a copy with its runs removed and a marker
+        # where the replacement run goes. Slots are numbered in document order.
+        texts = []
+        forced = []
+        for p in list(root.iter(qn('w:p'))):
+            if p not in slot_texts:
+                continue
+            text = slot_texts[p]
+            texts.append(text.replace(REPEAT_MARKER, ''))
+            forced.append(REPEAT_MARKER in text)
+
+            stripped = deepcopy(p)
+            for r in stripped.findall(qn('w:r')):
+                stripped.remove(r)
+            stripped.append(etree.ProcessingInstruction('docgen-run'))
+
+            p.addprevious(etree.ProcessingInstruction('docgen-start'))
+            p.addnext(etree.ProcessingInstruction('docgen-end'))
+            p.addnext(stripped)
+            p.addnext(etree.ProcessingInstruction('docgen-mid'))
+
+        for tr in repeat_rows:
+            tr.addprevious(etree.ProcessingInstruction('docgen-repeat'))
+            tr.addnext(etree.ProcessingInstruction('docgen-repeatend'))
+
+        xml = etree.tostring(root, encoding='unicode')
+
+        # Segments alternate: rendered once, repeated, rendered once...
+        self.segments = []
+        for piece in _REPEAT_SPLIT.split(xml):
+            slots = len(_SLOT_MARKER.split(piece)) // 4
+            self.segments.append(_Segment(piece, texts[:slots], forced[:slots]))
+            texts, forced = texts[slots:], forced[slots:]
+        self._split_head(root, xml)
+
+    def _mark_text_nodes(self, root, slot_texts, repeat_rows):
+        # Wrap every w:t a placeholder touches in markers; slots are numbered
+        # in document order (a text box's text comes before the rest of its
+        # anchor paragraph)
+        plans = {}
+        for p in slot_texts:
+            nodes = paragraph_text_nodes(p)
+            for node, plan in zip(nodes, plan_text_nodes([node.text or '' for node in nodes])):
+                if plan is not None:
+                    plans[node] = plan
+        ordered = [node for node in root.iter(qn('w:t')) if node in plans]
+        for node in ordered:
+            node.addprevious(etree.ProcessingInstruction('docgen-text'))
+            node.addnext(etree.ProcessingInstruction('docgen-textend'))
+
+        for tr in repeat_rows:
+            tr.addprevious(etree.ProcessingInstruction('docgen-repeat'))
+            tr.addnext(etree.ProcessingInstruction('docgen-repeatend'))
+
+        xml = etree.tostring(root, encoding='unicode')
+
+        self.segments = []
+        for piece in _REPEAT_SPLIT.split(xml):
+            slots = len(_TEXT_MARKER.split(piece)) // 2
+            nodes, ordered = ordered[:slots], ordered[slots:]
+            self.segments.append(_TextSegment(
+                piece, [plans[node] for node in nodes],
+                [node.get(qn('xml:space')) == 'preserve' for node in nodes]
+            ))
+        self._split_head(root, xml)
+
+    def _split_head(self, root, xml):
+        # The main document's head and tail are static, so a row's body is a
+        # fixed slice of its render
+        self.head = self.tail = None
+        if root.tag == qn('w:document'):
+            head, _, tail = split_document_xml(xml)
+            self.head = _XML_DECLARATION + head
+            self.tail = tail
+
+    def render_text(self, replacements, metrics=None, rows=None):
+        out = [_XML_DECLARATION]
+        rewritten = scanned = 0
+        for number, segment in enumerate(self.segments):
+            for row in (rows if number % 2 and rows is not None else (replacements,)):
+                rewritten += segment.render(row, self.prefix, out)
+                scanned += segment.slots
+        if metrics is not None:
+            unit = self.segments[0].unit
+            metrics.count(f'{unit}_scanned', scanned)
+            metrics.count(f'{unit}_rewritten', rewritten)
+        return ''.join(out)
+
+
+class CompiledTemplate:
+    """A Word template parsed once and rendered per row by joining strings.
+
+    Every paragraph that may hold a placeholder is found once, anywhere in
+    the package: body, nested tables, text boxes, headers and footers. Each
+    part with such paragraphs is split into static XML fragments and one
+    slot per paragraph. Rendering a row only substitutes the slot texts and
+    joins the fragments back together, so the cost per letter follows the
+    number of placeholder paragraphs, not the size of the document.
+
+    With in_place (the default) a slot is one w:t element a placeholder
+    covers, and the letters keep the template's run formatting, exactly as
+    replace_text_in_document(in_place=True) would; otherwise each changed
+    paragraph becomes one plain run, as with in_place=False.
+    """
+
+    def __init__(self, template_file, in_place=True):
+        if hasattr(template_file, 'seek'):
+            template_file.seek(0)
+        doc = Document(template_file)
+
+        self.document_partname = doc.part.partname.lstrip('/')
+        self.placeholders = set()
+        # Part name -> placeholders found in it (the upload-time scan report)
+        self.placeholder_parts = {}
+        # Whether any table row is marked with REPEAT_MARKER
+        self.repeats = False
+
+        self._parts = {}
+        for part in iter_text_parts(doc):
+            partname = part.partname.lstrip('/')
+            slot_texts = {}
+            repeat_rows = []
+            for paragraph in iter_part_paragraphs(part, anchors=in_place):
+                text = paragraph.text
+                if '{' in text:
+                    slot_texts[paragraph._p] = text
+                    found = set(PLACEHOLDER_PATTERN.findall(text))
+                    if REPEAT_MARKER in found:
+                        found.discard(REPEAT_MARKER)
+                        row = next(paragraph._p.iterancestors(qn('w:tr')), None)
+                        if row is not None and row not in repeat_rows:
+                            repeat_rows.append(row)
+                    self.placeholders.update(found)
+                    self.placeholder_parts.setdefault(partname, set()).update(found)
+            # A row inside another repeated row is already repeated with it
+            repeat_rows = [
+                row for row in repeat_rows
+                if not any(ancestor in repeat_rows for ancestor in row.iterancestors(qn('w:tr')))
+            ]
+            self.repeats = self.repeats or bool(repeat_rows)
+            # The main document is always compiled; other parts only if they need it
+            if slot_texts or part is doc.part:
+                self._parts[partname] = _CompiledPart(part.element, slot_texts, repeat_rows, in_place)
+
+        main = self._parts[self.document_partname]
+        self.document_head = main.head
+        self.document_tail = main.tail
+
+        # Every other part of the package is copied from the template as-is
+        self.writer = DocxPackageWriter(template_file)
+
+    def render_parts(self, replacements, metrics=None, rows=None):
+        """Return {part name: XML bytes} for every part that has slots.
+
+        rows is a list of per-row mappings for the repeated table rows of a
+        group letter; without it each repeated row is rendered once from
+        replacements.
+        """
+        return {
+            partname: part.render_text(replacements, metrics, rows).encode('utf-8')
+            for partname, part in self._parts.items()
+        }
+
+    def render_document_xml(self, replacements, metrics=None, rows=None):
+        """Return the main document part for one row as UTF-8 bytes"""
+        return self._parts[self.document_partname].render_text(replacements, metrics, rows).encode('utf-8')
+
+    def render_body_xml(self, replacements, metrics=None, rows=None):
+        """Return only the body content for one row (see document_head/document_tail).
+
+        Headers and footers are shared by every letter of a merged document,
+        so their placeholders are not filled in this mode.
+        """
+        text = self._parts[self.document_partname].render_text(replacements, metrics, rows)
+        return text[len(self.document_head):len(text) - len(self.document_tail)]
+
+    def save(self, filename, replacements, rows=None):
+        """Write the rendered .docx for one row to a path or file-like object"""
+        self.writer.write(filename, self.render_parts(replacements, rows=rows))
+
+    def render(self, replacements, metrics=None, rows=None):
+        """Return the rendered .docx for one row (or one group, see render_parts) as bytes"""
+        if metrics is None:
+            return self.writer.render(self.render_parts(replacements, rows=rows))
+
+        started = time.perf_counter()
+        parts = self.render_parts(replacements, metrics, rows)
+        substituted = time.perf_counter()
+        data = self.writer.render(parts)
+        metrics.add_time('substitute', substituted - started)
+        metrics.add_time('package_docx', time.perf_counter() - substituted)
+        metrics.count('docx_bytes', len(data))
+        return data
+
+
+def compile_template(template_file, in_place=True):
+    """Parse a .docx template once for fast per-row rendering"""
+    return CompiledTemplate(template_file, in_place)
@@ -0,0 +1,101 @@
+import csv
+import io
+import os
+import zipfile
+
+import pytest
+
+from batch_generate import run_batch
+from conftest import customer_rows
+from template_engine import CompiledTemplate
+
+DATE = 'March 01, 2026'
+
+
+class _Killed(Exception):
+    pass
+
+
+def _kill_after(checkpoints):
+    """A log that stops the run (like a kill) once the given number of checkpoints is saved"""
+    saved = []
+
+    def log(message):
+        if 'Progress' in message:
+            saved.append(message)
+            if len(saved) == checkpoints:
+                raise _Killed()
+    return log
+
+
+def _letters(output):
+    if output.endswith('.zip'):
+        with zipfile.ZipFile(output) as archive:
+            return {name: archive.read(name) for name in archive.namelist()}
+    return {
+        name: open(os.path.join(output, name), 'rb').read()
+        for name in os.listdir(output) if name.endswith('.docx')
+    }
+
+
+def _texts(letters):
+    return {name: zipfile.ZipFile(io.BytesIO(data)).read('word/document.xml') for name, data in letters.items()}
+
+
+@pytest.mark.parametrize('suffix', ['', '.zip'])
+def test_killed_run_resumes_from_its_last_checkpoint(template_file, make_data, tmp_path, suffix):
+    data = make_data(customer_rows(10))
+    output = str(tmp_path / f"letters{suffix}")
+    with pytest.raises(_Killed):
+        run_batch(data, template_file, output, DATE, checkpoint_rows=2, log=_kill_after(2))
+
+    lines = []
+    manifest = run_batch(data, template_file, output, DATE, checkpoint_rows=2, log=lines.append)
+    assert "Resuming at row 5 (4/10 rows already done)" in lines
+    assert manifest.complete and [entry['row'] for entry in manifest.entries] == list(range(1, 11))
+
+    single = run_batch(data, template_file, str(tmp_path / f"single{suffix}"), DATE, log=lambda message: None)
+    assert [entry['file'] for entry in manifest.entries] == [entry['file'] for entry in single.entries]
+    assert _texts(_letters(output)) == _texts(_letters(str(tmp_path / f"single{suffix}")))
+
+
+def _errors(path):
+    with open(path, encoding='utf-8', newline='') as f:
+        return list(csv.DictReader(f))
+
+
+def test_row_that_fails_to_render_is_quarantined(template_file, make_data, tmp_path, monkeypatch):
+    render = CompiledTemplate.render
+
+    def failing_render(self, replacements, *args, **kwargs):
+        if replacements['{CUSTOMER NAME}'] == 'Customer 3':
+            raise ValueError("broken row")
+        return render(self, replacements, *args, **kwargs)
+
+    monkeypatch.setattr(CompiledTemplate, 'render', failing_render)
+    output = str(tmp_path / 'letters.zip')
+    manifest = run_batch(make_data(customer_rows(5)), template_file, output, DATE,
+                         checkpoint_rows=2, log=lambda message: None)
+
+    assert [entry['row'] for entry in manifest.entries] == [1, 2, 4, 5]
+    assert [error['row'] for error in manifest.errors] == [3]
+    assert _errors(f"{output}.errors.csv") == [
+        {'row': '3', 'file': 'Letter_Customer_3.docx', 'error': 'ValueError: broken row'}
+    ]
+    assert 'Letter_Customer_3.docx' not in _letters(output)
+
+
+def test_row_whose_file_cant_be_written_is_quarantined(template_file, make_data, tmp_path):
+    rows = customer_rows(5)
+    rows[1]['CUSTOMER NAME'] = 'X' * 300
+    output = str(tmp_path / 'letters')
+    lines = []
+    manifest = run_batch(make_data(rows), template_file, output, DATE, checkpoint_rows=2,
+                         check=True, log=lines.append)
+
+    assert "  CUSTOMER NAME: 1 names too long for a file name (rows 2)" in lines
+    assert manifest.complete and [entry['row'] for entry in manifest.entries] == [1, 3, 4, 5]
+    assert [(error['row'], error['error']) for error in _errors(os.path.join(output, 'errors.csv'))] == [
+        ('2', 'OSError: File name too long')
+    ]
+    assert len(_letters(output)) == 4
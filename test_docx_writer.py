@@ -0,0 +1,46 @@
+import io
+import zipfile
+
+from docx_writer import RawZipReader, RawZipWriter, archive_member, read_raw_members
+
+
+def test_raw_zip_writer_round_trip():
+    members = [archive_member('letter.docx', b'PK stored'), archive_member('notes/é.txt', b'text ' * 100)]
+    out = io.BytesIO()
+    writer = RawZipWriter(out)
+    for member in members:
+        writer.add(member)
+    writer.close()
+
+    with zipfile.ZipFile(out) as archive:
+        assert archive.testzip() is None
+        assert archive.read('letter.docx') == b'PK stored'
+        assert archive.read('notes/é.txt') == b'text ' * 100
+        assert archive.getinfo('letter.docx').compress_type == zipfile.ZIP_STORED
+    assert [member.data for member in read_raw_members(out.getvalue())] == [member.data for member in members]
+
+
+def test_raw_zip_writer_switches_to_zip64_past_65535_entries():
+    count = 0x10000 + 10
+    out = io.BytesIO()
+    writer = RawZipWriter(out)
+    for number in range(count):
+        writer.add(archive_member(f"Letter_{number}.docx", str(number).encode()))
+    writer.close()
+
+    data = out.getvalue()
+    assert b'PK\x06\x06' in data[-200:]
+    with zipfile.ZipFile(io.BytesIO(data)) as archive:
+        names = archive.namelist()
+        assert len(names) == count
+        assert archive.read(names[-1]) == str(count - 1).encode()
+
+    # Members copy into another archive without being recompressed
+    reader = RawZipReader(io.BytesIO(data))
+    member = reader.member(f"Letter_{count - 1}.docx")
+    copy = io.BytesIO()
+    writer = RawZipWriter(copy)
+    writer.add(member)
+    writer.close()
+    with zipfile.ZipFile(copy) as archive:
+        assert archive.read(f"Letter_{count - 1}.docx") == str(count - 1).encode()
@@ -0,0 +1,96 @@
+import json
+import os
+
+import pandas as pd
+import pytest
+
+import generate_letters
+from conftest import customer_rows
+from generate_letters import LETTER_COLUMNS, LetterSkeletons, build_letter, create_customer_letters
+from incremental import INDEX_NAME
+from placeholders import PlaceholderIndex
+
+
+def _index(folder):
+    with open(os.path.join(folder, INDEX_NAME), encoding='utf-8') as f:
+        return json.load(f)
+
+
+def _mtimes(folder):
+    return {name: os.stat(os.path.join(folder, name)).st_mtime_ns for name in os.listdir(folder)
+            if name.endswith('.docx')}
+
+
+
+def _records(rows):
+    frame = pd.DataFrame(rows, columns=list(LETTER_COLUMNS), dtype=object)
+    index = PlaceholderIndex(frame.columns)
+    return [index.record(values) for values in index.prepare(frame, 'March 01, 2026')]
+
+
+@pytest.mark.parametrize('row', [
+    {'CUSTOMER NAME': 'Ann & Lee <Ltd>', 'Address': '1 Main Street', 'Status(Active/Inactive)': 'Active',
+     'Billing Account': 'BA00001', 'Outstanding amount in Rs': 1234.5},
+    {'CUSTOMER NAME': '  Ben  ', 'Address': None, 'Status(Active/Inactive)': ' INACTIVE',
+     'Billing Account': 42, 'Department': 'Billing', 'Outstanding amount in Rs': 'n/a'},
+    {'CUSTOMER NAME': None, 'Address': '2 Side Road', 'Status(Active/Inactive)': 'Inactive',
+     'Outstanding amount in Rs': None},
+    {'CUSTOMER NAME': 'Tab\tName', 'Address': 'Line one\nLine two', 'Status(Active/Inactive)': 'Active',
+     'Billing Account': 'BA00002', 'Outstanding amount in Rs': 10},
+], ids=['active', 'inactive-no-address', 'blank-name', 'tabs-and-breaks'])
+def test_skeleton_matches_build_letter(row):
+    customer, = _records([row])
+    assert LetterSkeletons().render(customer) == build_letter(customer).part.blob
+
+
+def test_incremental_run_reuses_letters_for_the_same_date(make_data, tmp_path):
+    data = make_data(customer_rows(4))
+    output = str(tmp_path / 'letters')
+    create_customer_letters(data, output, incremental=True, letter_date_str='March 01, 2026')
+    first = _mtimes(output)
+
+    create_customer_letters(data, output, incremental=True, letter_date_str='March 01, 2026')
+    assert _mtimes(output) == first
+
+    # Another date changes every letter
+    hashes = _index(output)
+    create_customer_letters(data, output, incremental=True, letter_date_str='March 02, 2026')
+    assert all(entry['hash'] != hashes[key]['hash'] for key, entry in _index(output).items())
+
+
+def test_failed_row_keeps_its_previous_letter(make_data, tmp_path, monkeypatch):
+    output = str(tmp_path / 'letters')
+    create_customer_letters(make_data(customer_rows(3)), output, incremental=True,
+                            letter_date_str='March 01, 2026')
+    before = _index(output)
+
+    render = LetterSkeletons.render
+
+    def failing_render(self, customer):
+        if customer['CUSTOMER NAME'] == 'Customer 2':
+            raise ValueError("broken row")
+        return render(self, customer)
+
+    monkeypatch.setattr(generate_letters.LetterSkeletons, 'render', failing_render)
+    rows = customer_rows(3)
+    rows[1]['Address'] = 'Moved'
+    create_customer_letters(make_data(rows), output, incremental=True, letter_date_str='March 01, 2026')
+
+    # The old letter stays (and is retried next time); the row is in errors.csv
+    key = next(key for key, entry in before.items() if 'Customer_2' in entry['file'])
+    assert os.path.exists(os.path.join(output, before[key]['file']))
+    assert _index(output)[key] == before[key]
+    with open(os.path.join(output, 'errors.csv'), encoding='utf-8') as f:
+        assert 'ValueError: broken row' in f.read()
+
+
+def test_row_whose_file_cant_be_written_is_quarantined(make_data, tmp_path):
+    rows = customer_rows(3)
+    rows[0]['CUSTOMER NAME'] = 'X' * 300
+    output = str(tmp_path / 'letters')
+    create_customer_letters(make_data(rows), output, letter_date_str='March 01, 2026')
+
+    assert len(_mtimes(output)) == 2
+    with open(os.path.join(output, 'errors.csv'), encoding='utf-8') as f:
+        assert 'OSError: File name too long' in f.read()
+    assert len(_index(output)) == 2
@@ -0,0 +1,85 @@
+import io
+
+import pandas as pd
+import pytest
+from docx import Document
+
+from generation import generate_template_letters
+
+DATE = 'March 01, 2026'
+
+
+def _rows():
+    # Two customers whose accounts are interleaved; one name is written differently once
+    return pd.DataFrame({
+        'CUSTOMER NAME': ['Asha Rao', 'Ben Lee', 'Asha Rao', ' ben lee', 'Asha Rao'],
+        'Billing Account': ['BA001', 'BA002', 'BA003', 'BA004', 'BA005'],
+        'Outstanding amount in Rs': [100, 200.5, 300, 'n/a', 50],
+    }, dtype=object)
+
+
+def _fill_repeat_table(table):
+    """A heading row, then the row repeated for every account of the group"""
+    table.cell(0, 0).text = 'Account'
+    table.cell(0, 1).text = 'Amount'
+    table.cell(1, 0).text = '{REPEAT}{Billing Account}'
+    table.cell(1, 1).text = '{Outstanding amount in Rs}'
+    return table
+
+
+@pytest.fixture
+def grouped_template():
+    """Repeated rows in a body table, in a table nested in a cell and in a header table"""
+    doc = Document()
+    doc.add_paragraph('Dear {CUSTOMER NAME}, {ACCOUNT_COUNT} accounts owe Rs. {TOTAL_OUTSTANDING}.')
+    _fill_repeat_table(doc.add_table(rows=2, cols=2))
+    outer = doc.add_table(rows=1, cols=1)
+    _fill_repeat_table(outer.cell(0, 0).add_table(rows=2, cols=2))
+    section = doc.sections[0]
+    _fill_repeat_table(section.header.add_table(rows=2, cols=2, width=section.page_width))
+    data = io.BytesIO()
+    doc.save(data)
+    return data.getvalue()
+
+
+def _letters(template_bytes, frame, **kwargs):
+    return list(generate_template_letters(template_bytes, frame.columns, [frame], DATE,
+                                          group_by=['CUSTOMER NAME'], **kwargs))
+
+
+def _table_rows(table):
+    return [[cell.text for cell in row.cells] for row in table.rows]
+
+
+def test_one_letter_per_account_holder(grouped_template):
+    letters = _letters(grouped_template, _rows())
+    assert [(letter.filename, letter.row) for letter in letters] == [
+        ('Letter_Asha_Rao.docx', 1), ('Letter_Ben_Lee.docx', 2)
+    ]
+    texts = [Document(io.BytesIO(letter.data)).paragraphs[0].text for letter in letters]
+    assert texts == [
+        'Dear Asha Rao, 3 accounts owe Rs. 450.00.',
+        'Dear Ben Lee, 2 accounts owe Rs. 200.50.',
+    ]
+
+
+def test_marked_rows_repeat_once_per_row_of_the_group(grouped_template):
+    letters = _letters(grouped_template, _rows())
+    expected = [
+        [['Account', 'Amount'], ['BA001', '100.00'], ['BA003', '300.00'], ['BA005', '50.00']],
+        [['Account', 'Amount'], ['BA002', '200.50'], ['BA004', 'n/a']],
+    ]
+    for letter, rows in zip(letters, expected):
+        doc = Document(io.BytesIO(letter.data))
+        body, outer = doc.tables
+        assert _table_rows(body) == rows
+        assert _table_rows(outer.cell(0, 0).tables[0]) == rows
+        assert _table_rows(doc.sections[0].header.tables[0]) == rows
+
+
+def test_group_letters_come_out_in_order_of_first_row(grouped_template):
+    frame = _rows().iloc[[1, 0, 2, 3, 4]]
+    frame.index = range(5)
+    letters = _letters(grouped_template, frame, group_chunk_rows=1)
+    assert [letter.filename for letter in letters] == ['Letter_Ben_Lee.docx', 'Letter_Asha_Rao.docx']
+    assert [letter.row for letter in letters] == [1, 2]
@@ -0,0 +1,119 @@
+import io
+import threading
+import time
+
+import pandas as pd
+from docx import Document
+
+from generation import generate_template_letters
+from jobs import GenerationJob, JobRegistry
+
+
+class _Output:
+    def __init__(self):
+        self.discarded = False
+
+    def discard(self):
+        self.discarded = True
+
+
+def _wait(job, timeout=5):
+    deadline = time.time() + timeout
+    while job.active and time.time() < deadline:
+        time.sleep(0.01)
+    assert not job.active
+
+
+def test_discarding_a_running_job_releases_its_result():
+    registry = JobRegistry()
+    started, release = threading.Event(), threading.Event()
+    output = _Output()
+
+    def generate(job):
+        started.set()
+        release.wait(5)
+        return {'archive': output}
+
+    job = registry.submit(generate, 1)
+    started.wait(5)
+    registry.discard(job.id)
+    assert registry.get(job.id) is None
+    release.set()
+    _wait(job)
+
+    assert output.discarded
+    assert job.result is None and job.status == 'cancelled'
+
+
+def test_discarding_a_finished_job_releases_its_result():
+    registry = JobRegistry()
+    output = _Output()
+    job = registry.submit(lambda job: {'archive': output}, 1)
+    _wait(job)
+    assert job.status == 'done' and job.result == {'archive': output}
+
+    registry.discard(job.id)
+    assert output.discarded and job.result is None
+
+
+def test_cancelled_job_stops_at_its_next_check():
+    job = GenerationJob(3)
+    done = []
+
+    def generate(job):
+        for letter in range(3):
+            job.check_cancelled()
+            done.append(letter)
+            job.cancel()
+
+    job.run(generate)
+    assert job.status == 'cancelled' and done == [0]
+
+
+def _template(text):
+    doc = Document()
+    doc.add_paragraph(text)
+    data = io.BytesIO()
+    doc.save(data)
+    return data.getvalue()
+
+
+def test_concurrent_jobs_render_with_their_own_templates():
+    registry = JobRegistry()
+    frame = pd.DataFrame({'CUSTOMER NAME': ['C1', 'C2']})
+    second_started = threading.Event()
+
+    def chunks(wait):
+        # The first job's second chunk comes once the second job has set up its run
+        yield frame.iloc[:1]
+        if wait:
+            second_started.wait(5)
+        yield frame.iloc[1:]
+
+    def generate(job, text, wait):
+        letters = generate_template_letters(_template(text), frame.columns, chunks(wait), 'March 01, 2026')
+        texts = []
+        for letter in letters:
+            if not wait:
+                second_started.set()
+            texts.append(Document(io.BytesIO(letter.data)).paragraphs[0].text)
+        return {'texts': texts}
+
+    first = registry.submit(generate, 2, 'JOB ONE {CUSTOMER NAME}', True)
+    second = registry.submit(generate, 2, 'JOB TWO {CUSTOMER NAME}', False)
+    _wait(first)
+    _wait(second)
+    assert first.result['texts'] == ['JOB ONE C1', 'JOB ONE C2']
+    assert second.result['texts'] == ['JOB TWO C1', 'JOB TWO C2']
+
+
+def test_expire_skips_a_job_whose_finish_time_is_not_set_yet():
+    registry = JobRegistry(ttl=0)
+    job = GenerationJob(1)
+    job.status = 'done'
+    registry._jobs[job.id] = job
+    registry._expire()
+    assert registry.get(job.id) is job
+    job.finished = time.time() - 1
+    registry._expire()
+    assert registry.get(job.id) is None
@@ -0,0 +1,63 @@
+import pytest
+
+from batch_generate import run_batch
+from checkpoint import CheckpointManifest
+from conftest import customer_rows
+from merge_shards import manifest_path, merge_shards
+
+
+def _quiet(*args):
+    pass
+
+
+def _run_shards(data, template_file, tmp_path, count, suffix=''):
+    outputs = []
+    for index in range(1, count + 1):
+        output = str(tmp_path / f"shard{index}{suffix}")
+        run_batch(data, template_file, output, 'March 01, 2026', checkpoint_rows=2,
+                  shard=f"{index}/{count}", log=_quiet)
+        outputs.append(output)
+    return outputs
+
+
+@pytest.mark.parametrize('suffix', ['', '.zip'])
+def test_merge_matches_unsharded_run(template_file, make_data, tmp_path, suffix):
+    data = make_data(customer_rows(10))
+    outputs = _run_shards(data, template_file, tmp_path, 3, suffix)
+
+    merged = merge_shards(outputs, str(tmp_path / f"merged{suffix}"), log=_quiet)
+    single = run_batch(data, template_file, str(tmp_path / f"single{suffix}"), 'March 01, 2026', log=_quiet)
+    assert [entry['file'] for entry in merged.entries] == [entry['file'] for entry in single.entries]
+    assert [entry['row'] for entry in merged.entries] == list(range(1, 11))
+    assert merged.last_row == 10
+
+
+def test_merge_with_more_shards_than_rows(template_file, make_data, tmp_path):
+    data = make_data(customer_rows(10))
+    outputs = _run_shards(data, template_file, tmp_path, 7)
+
+    # 2 rows per shard: shard 6 gets none and shard 7 starts past the end
+    for output in outputs[5:]:
+        manifest = CheckpointManifest(manifest_path(output))
+        assert manifest.complete and manifest.entries == [] and manifest.last_row is None
+
+    merged = merge_shards(outputs, str(tmp_path / 'merged'), log=_quiet)
+    assert [entry['row'] for entry in merged.entries] == list(range(1, 11))
+    assert merged.last_row == 10
+
+
+def test_merge_reports_missing_shard(template_file, make_data, tmp_path):
+    data = make_data(customer_rows(4))
+    outputs = _run_shards(data, template_file, tmp_path, 2)
+
+    with pytest.raises(ValueError, match="Missing shards: 2/2"):
+        merge_shards(outputs[:1], str(tmp_path / 'merged'), log=_quiet)
+
+
+def test_shards_of_a_sheet_with_formatted_rows_below_the_data(template_file, formatted_sheet, tmp_path):
+    outputs = _run_shards(formatted_sheet, template_file, tmp_path, 4)
+
+    rows = [[entry['row'] for entry in CheckpointManifest(manifest_path(output)).entries] for output in outputs]
+    assert rows == [[1, 2], [3, 4], [5], []]
+    merged = merge_shards(outputs, str(tmp_path / 'merged'), log=_quiet)
+    assert [entry['row'] for entry in merged.entries] == list(range(1, 6))
@@ -0,0 +1,75 @@
+import base64
+import io
+import os
+import re
+import zipfile
+
+import pandas as pd
+from docx import Document
+
+from conftest import customer_rows
+from generate_letters import create_customer_letters
+from generation import generate_template_letters
+from merged_output import MergedVolumes
+from template_engine import compile_template
+
+# A 1x1 white PNG
+PIXEL = base64.b64decode(
+    'iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAIAAACQd1PeAAAADElEQVR4nGP4//8/AAX+Av4N70a4AAAAAElFTkSuQmCC'
+)
+
+
+def _picture_template():
+    doc = Document()
+    doc.add_paragraph("Dear {CUSTOMER NAME},")
+    doc.add_picture(io.BytesIO(PIXEL))
+    doc.add_picture(io.BytesIO(PIXEL))
+    data = io.BytesIO()
+    doc.save(data)
+    return data.getvalue()
+
+
+def _merge(template_bytes, rows, volume_size=None):
+    template = compile_template(io.BytesIO(template_bytes))
+    volumes = MergedVolumes(
+        lambda number: io.BytesIO(), template.writer, template.document_partname,
+        template.document_head, template.document_tail, volume_size=volume_size, close_files=False
+    )
+    frame = pd.DataFrame(rows)
+    for letter in generate_template_letters(template_bytes, frame.columns, [frame], 'March 01, 2026', merged=True):
+        volumes.add(letter.data)
+    volumes.close()
+    return [f.getvalue() for f in volumes.files]
+
+
+def _names(doc):
+    return [p.text for p in doc.paragraphs if p.text.startswith('Dear ')]
+
+
+def test_merged_document_has_a_section_per_letter():
+    volume, = _merge(_picture_template(), customer_rows(3))
+    doc = Document(io.BytesIO(volume))
+    assert len(doc.sections) == 3
+    assert _names(doc) == ['Dear Customer 1,', 'Dear Customer 2,', 'Dear Customer 3,']
+    assert {section.page_width for section in doc.sections} == {doc.sections[0].page_width}
+
+
+def test_merged_pictures_have_unique_drawing_ids():
+    volume, = _merge(_picture_template(), customer_rows(3))
+    xml = zipfile.ZipFile(io.BytesIO(volume)).read('word/document.xml').decode('utf-8')
+    ids = re.findall(r'<wp:docPr\b[^>]*?\bid="(\d+)"', xml)
+    assert len(ids) == 6 and len(set(ids)) == 6
+    assert len(Document(io.BytesIO(volume)).inline_shapes) == 6
+
+
+def test_volumes_split_at_the_requested_size(make_data, tmp_path):
+    output = str(tmp_path / 'letters')
+    create_customer_letters(make_data(customer_rows(5)), output, merged=True, volume_size=2,
+                            letter_date_str='March 01, 2026')
+
+    names = sorted(name for name in os.listdir(output) if name.endswith('.docx'))
+    assert names == ['merged_letters_001.docx', 'merged_letters_002.docx', 'merged_letters_003.docx']
+    docs = [Document(os.path.join(output, name)) for name in names]
+    assert [len(doc.sections) for doc in docs] == [2, 2, 1]
+    recipients = [p.text.split('\n')[0] for doc in docs for p in doc.paragraphs if p.text.startswith('Customer ')]
+    assert recipients == [f"Customer {number}" for number in range(1, 6)]
@@ -0,0 +1,17 @@
+import pandas as pd
+
+from placeholders import PlaceholderIndex
+
+
+def test_chunk_with_only_blank_names_gets_the_default_salutation():
+    frame = pd.DataFrame({'CUSTOMER NAME': [None, float('nan')]}, dtype=object)
+    index = PlaceholderIndex(frame.columns)
+    prepared = index.prepare(frame, 'March 01, 2026')
+    assert [index.replacements(values)['{SALUTATION}'] for values in prepared] == ['Valued Customer'] * 2
+
+
+def test_salutation_is_the_first_word_of_the_name():
+    frame = pd.DataFrame({'CUSTOMER NAME': ['Asha  Rao', None]}, dtype=object)
+    index = PlaceholderIndex(frame.columns)
+    prepared = index.prepare(frame, 'March 01, 2026')
+    assert [index.replacements(values)['{SALUTATION}'] for values in prepared] == ['Asha', 'Valued Customer']
@@ -0,0 +1,32 @@
+import io
+
+from docx import Document
+
+from preview import build_preview
+
+
+def _template(build):
+    doc = Document()
+    build(doc)
+    data = io.BytesIO()
+    doc.save(data)
+    data.seek(0)
+    return data
+
+
+def test_placeholder_split_by_a_tab_is_filled_like_the_letters():
+    def build(doc):
+        paragraph = doc.add_paragraph("Dear {CUSTOMER")
+        run = paragraph.add_run()
+        run.add_tab()
+        run.add_text(" NAME}, owes {Amount}")
+        paragraph.runs[1].bold = True
+
+    html = build_preview(_template(build)).render_html({'{CUSTOMER NAME}': 'Ann <Lee>', '{Amount}': '5'})
+    # The value goes where the placeholder starts; the tab stays in the bold run
+    assert '<p>Dear Ann &lt;Lee&gt;<b>&emsp;, owes 5</b></p>' in html
+
+
+def test_unfilled_placeholder_is_marked():
+    html = build_preview(_template(lambda doc: doc.add_paragraph("Hi {Unknown} there"))).render_html({})
+    assert '<p>Hi <mark>{Unknown}</mark> there</p>' in html
@@ -1,6 +1,12 @@
+import os
+import runpy
 from docx import Document
 from copy import deepcopy
 
+# The sample template isn't checked in; create_template.py makes it
+if not os.path.exists('sample_template.docx'):
+    runpy.run_path('create_template.py')
+
 # Load template and sample data
 template_doc = Document('sample_template.docx')
 print(f"Template has {len(template_doc.paragraphs)} paragraphs")
@@ -0,0 +1,83 @@
+import io
+
+import pandas as pd
+import pytest
+from docx import Document
+
+from generation import generate_template_letters, template_columns
+from routing import RoutingRule, TemplateRouter
+
+DATE = 'March 01, 2026'
+
+
+def _template(text):
+    doc = Document()
+    doc.add_paragraph(text)
+    data = io.BytesIO()
+    doc.save(data)
+    return data.getvalue()
+
+
+TEMPLATES = {
+    'active.docx': _template('ACTIVE {CUSTOMER NAME}'),
+    'inactive.docx': _template('INACTIVE {CUSTOMER NAME}'),
+    'standard.docx': _template('STANDARD {CUSTOMER NAME}'),
+}
+
+
+def _router():
+    return TemplateRouter([
+        RoutingRule('Status(Active/Inactive)', 'Active', 'active.docx'),
+        RoutingRule('Status(Active/Inactive)', 'Inactive', 'inactive.docx'),
+    ], 'standard.docx')
+
+
+def _frame(count):
+    statuses = ['Active', ' INACTIVE ', None, 'closed']
+    return pd.DataFrame({
+        'CUSTOMER NAME': [f"Customer {number}" for number in range(1, count + 1)],
+        'Status(Active/Inactive)': [statuses[number % 4] for number in range(count)],
+    }, dtype=object)
+
+
+def _chunks(frame, rows):
+    return [frame.iloc[first:first + rows] for first in range(0, len(frame), rows)]
+
+
+def _expected(frame):
+    names = {'active': 'active.docx', 'inactive': 'inactive.docx'}
+    return [
+        (names.get(str(status or '').strip().lower(), 'standard.docx'), name)
+        for name, status in zip(frame['CUSTOMER NAME'], frame['Status(Active/Inactive)'])
+    ]
+
+
+def _rendered(letters):
+    return [(letter.template, Document(io.BytesIO(letter.data)).paragraphs[0].text) for letter in letters]
+
+
+def test_rows_get_the_template_their_column_value_picks():
+    router = _router()
+    assert router.route({'Status(Active/Inactive)': ' active'}) == 'active.docx'
+    assert router.route({'Status(Active/Inactive)': 'Inactive'}) == 'inactive.docx'
+    assert router.route({'Status(Active/Inactive)': 'closed'}) == 'standard.docx'
+    assert router.route({}) == 'standard.docx'
+    assert router.templates == set(TEMPLATES)
+
+
+@pytest.mark.parametrize('workers', [1, 2])
+def test_routed_letters_are_rendered_from_their_templates(workers):
+    frame = _frame(8)
+    letters = generate_template_letters(TEMPLATES, frame.columns, _chunks(frame, 3), DATE,
+                                        workers=workers, router=_router())
+    rendered = _rendered(letters)
+    expected = _expected(frame)
+    assert [template for template, _ in rendered] == [template for template, _ in expected]
+    assert [text for _, text in rendered] == [
+        f"{template.split('.')[0].upper()} {name}" for template, name in expected
+    ]
+
+
+def test_routing_column_is_read_even_when_no_template_uses_it():
+    columns = ['CUSTOMER NAME', 'Notes', 'Status(Active/Inactive)']
+    assert template_columns(columns, {'{CUSTOMER NAME}'}, _router()) == ['CUSTOMER NAME', 'Status(Active/Inactive)']
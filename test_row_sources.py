@@ -0,0 +1,206 @@
+import datetime
+import os
+import sqlite3
+import zipfile
+from contextlib import closing
+
+import pandas as pd
+import pytest
+from openpyxl import Workbook, load_workbook
+
+import row_sources
+from conftest import customer_rows
+from placeholders import column_text
+from row_sources import open_row_source
+
+
+@pytest.fixture
+def sheet_file(tmp_path):
+    """A sheet with a date column that turns to text part way, a gap and unread columns"""
+    workbook = Workbook()
+    sheet = workbook.active
+    sheet.append(['CUSTOMER NAME', 'Notes', 'CLOSURE DATE', 'Billing Account'])
+    for number in range(1, 7):
+        closure = datetime.datetime(2026, 3, number) if number != 5 else 'pending'
+        sheet.append([f"Customer {number}", 'x' * number, closure, 1000 + number])
+    sheet.cell(row=9, column=2, value='note only')
+    sheet.append(['Customer 8', None, None, None])
+    path = tmp_path / 'data.xlsx'
+    workbook.save(path)
+    return str(path)
+
+
+def _read(path, chunk_rows):
+    source = open_row_source(path).select(['CUSTOMER NAME', 'CLOSURE DATE', 'Billing Account'])
+    return list(source.iter_chunks(chunk_rows))
+
+
+def test_columns_keep_one_dtype_across_chunks(sheet_file):
+    chunks = _read(sheet_file, 2)
+    assert {str(chunk['CLOSURE DATE'].dtype) for chunk in chunks} == {'object'}
+    dates = [text for chunk in chunks for text in column_text(chunk['CLOSURE DATE'])]
+    assert dates[:5] == ['2026-03-01', '2026-03-02', '2026-03-03', '2026-03-04', 'pending']
+    accounts = [text for chunk in chunks for text in column_text(chunk['Billing Account'])]
+    assert accounts[:3] == ['1001', '1002', '1003'] and accounts[-1] == ''
+
+
+def test_public_iter_rows_fallback_reads_the_same_rows(sheet_file, monkeypatch):
+    projected = pd.concat(_read(sheet_file, 3))
+    monkeypatch.setattr(row_sources, 'ProjectedSheetParser', None)
+    public = pd.concat(_read(sheet_file, 3))
+    pd.testing.assert_frame_equal(projected, public)
+    assert list(projected.index) == list(range(9))
+    assert projected['CUSTOMER NAME'].tolist()[-3:] == [None, None, 'Customer 8']
+
+
+@pytest.mark.parametrize('projected', [True, False])
+def test_rows_with_only_formatting_are_not_counted(formatted_sheet, monkeypatch, projected):
+    if not projected:
+        monkeypatch.setattr(row_sources, 'ProjectedSheetParser', None)
+    source = open_row_source(formatted_sheet)
+    assert source.count_rows() == 5
+    assert source.select(['CUSTOMER NAME']).count_rows() == 5
+
+
+def test_count_stops_at_the_last_row_with_a_value(sheet_file):
+    assert open_row_source(sheet_file).count_rows() == 9
+
+
+def test_range_past_the_data_has_no_trailing_blank_rows(formatted_sheet):
+    source = open_row_source(formatted_sheet)
+    chunks = list(source.iter_chunks(2, 3, 150))
+    assert [list(chunk.index) for chunk in chunks] == [[2, 3], [4]]
+
+
+def _patch_members(path, changes):
+    """Rewrite the members of a saved workbook: changes maps names to functions of their text"""
+    with zipfile.ZipFile(path) as archive:
+        members = {name: archive.read(name) for name in archive.namelist()}
+    for name, change in changes.items():
+        members[name] = change(members.get(name, b'').decode('utf-8')).encode('utf-8')
+    with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as archive:
+        for name, data in members.items():
+            archive.writestr(name, data)
+
+
+SHARED_STRINGS = (
+    '<sst xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" count="2" uniqueCount="2">'
+    '<si><t>Shared text</t></si><si><r><t>Rich </t></r><r><rPr><b/></rPr><t>shared</t></r></si></sst>'
+)
+
+# Cells as Excel writes them that openpyxl doesn't: shared strings, cached formula
+# results, rich inline text and cells without a reference, and a row after a gap
+EXTRA_ROWS = (
+    '<row r="3"><c r="A3" t="s"><v>0</v></c><c r="B3"><f>B2+1</f><v>43</v></c>'
+    '<c r="C3" t="str"><f>A2&amp;"!"</f><v>Asha!</v></c><c r="D3" s="1"><f>D2+1</f><v>46083.5</v></c>'
+    '<c r="E3" t="e"><f>1/0</f><v>#DIV/0!</v></c><c r="F3" t="b"><f>TRUE()</f><v>0</v></c>'
+    '<c r="G3" t="s"><v>1</v></c><c r="H3" t="inlineStr"><is><r><t>in</t></r><r><t>line</t></r></is></c></row>'
+    '<row r="5"><c t="inlineStr"><is><t>no ref</t></is></c><c><v>-0.5</v></c><c r="H5" t="e"><v>#REF!</v></c></row>'
+)
+
+
+@pytest.fixture
+def typed_sheet(tmp_path):
+    """A sheet with every kind of cell: text, numbers, dates, booleans, formulas and errors"""
+    workbook = Workbook()
+    sheet = workbook.active
+    sheet.append(['Text', 'Int', 'Float', 'When', 'Day', 'Flag', 'Formula', 'Error'])
+    sheet.append(['Asha', 42, 1234.5, datetime.datetime(2026, 3, 1, 9, 30), datetime.date(2026, 3, 2),
+                  True, '=B2*2', '#N/A'])
+    path = tmp_path / 'typed.xlsx'
+    workbook.save(path)
+    _patch_members(path, {
+        'xl/worksheets/sheet1.xml': lambda xml: xml.replace('<v></v>', '<v>84</v>').replace(
+            '</sheetData>', EXTRA_ROWS + '</sheetData>').replace('A1:H2', 'A1:H5'),
+        'xl/sharedStrings.xml': lambda xml: SHARED_STRINGS,
+        '[Content_Types].xml': lambda xml: xml.replace('</Types>', (
+            '<Override PartName="/xl/sharedStrings.xml" ContentType="application/'
+            'vnd.openxmlformats-officedocument.spreadsheetml.sharedStrings+xml"/></Types>')),
+        'xl/_rels/workbook.xml.rels': lambda xml: xml.replace('</Relationships>', (
+            '<Relationship Id="rIdShared" Target="sharedStrings.xml" Type="http://schemas.openxmlformats.org/'
+            'officeDocument/2006/relationships/sharedStrings"/></Relationships>')),
+    })
+    return str(path)
+
+
+def _openpyxl_rows(path):
+    workbook = load_workbook(path, read_only=True, data_only=True)
+    try:
+        return list(workbook.worksheets[0].iter_rows(min_row=2, values_only=True))
+    finally:
+        workbook.close()
+
+
+def test_projected_parser_reads_cells_like_openpyxl(typed_sheet):
+    expected = _openpyxl_rows(typed_sheet)
+    assert expected[1] == (
+        'Shared text', 43, 'Asha!', datetime.datetime(2026, 3, 2, 12, 0), '#DIV/0!', False, 'Rich shared', 'inline'
+    )
+    source = open_row_source(typed_sheet)
+    assert list(source.iter_rows()) == [tuple(row) for row in expected]
+
+    picked = source.select(['Formula', 'Int', 'When'])
+    assert list(picked.iter_rows()) == [(row[1], row[3], row[6]) for row in expected]
+
+
+def test_public_fallback_reads_typed_cells_like_the_projected_parser(typed_sheet, monkeypatch):
+    projected = list(open_row_source(typed_sheet).select(['Text', 'Day', 'Error']).iter_rows())
+    monkeypatch.setattr(row_sources, 'ProjectedSheetParser', None)
+    assert list(open_row_source(typed_sheet).select(['Text', 'Day', 'Error']).iter_rows()) == projected
+
+
+def _write_source(frame, path):
+    if path.suffix == '.csv':
+        frame.to_csv(path, index=False)
+    elif path.suffix == '.parquet':
+        # Row groups of 3, so ranges start part way into a group
+        frame.to_parquet(path, index=False, row_group_size=3)
+    elif path.suffix == '.db':
+        with closing(sqlite3.connect(path)) as connection:
+            frame.to_sql('customers', connection, index=False)
+            connection.commit()
+    else:
+        frame.to_excel(path, index=False)
+
+
+@pytest.fixture(params=['.csv', '.parquet', '.db', '.xlsx'])
+def customer_source(request, tmp_path):
+    """Path of 10 customer rows in each of the supported file types"""
+    frame = pd.DataFrame(customer_rows(10))
+    path = tmp_path / f"customers{request.param}"
+    _write_source(frame, path)
+    return str(path)
+
+
+def test_sources_read_the_selected_columns_of_a_row_range(customer_source):
+    source = open_row_source(customer_source)
+    assert source.count_rows() == 10
+    assert source.columns == list(customer_rows(1)[0])
+
+    picked = source.select(['Billing Account', 'Missing', 'CUSTOMER NAME'])
+    assert picked.columns == ['CUSTOMER NAME', 'Billing Account']
+    chunks = list(picked.iter_chunks(2, 4, 8))
+    assert [list(chunk.index) for chunk in chunks] == [[3, 4], [5, 6], [7]]
+    assert [list(chunk.columns) for chunk in chunks] == [['CUSTOMER NAME', 'Billing Account']] * 3
+    assert list(picked.iter_rows(4, 8)) == [
+        (f"Customer {number}", f"BA{number:05d}") for number in range(4, 9)
+    ]
+    assert list(picked.iter_rows(9)) == [('Customer 9', 'BA00009'), ('Customer 10', 'BA00010')]
+
+
+def test_uploaded_bytes_are_read_like_the_file(customer_source):
+    with open(customer_source, 'rb') as f:
+        data = f.read()
+    source = open_row_source(data, name=os.path.basename(customer_source))
+    assert list(source.iter_rows(3, 5)) == list(open_row_source(customer_source).iter_rows(3, 5))
+
+
+def test_sqlite_query_picks_and_orders_the_rows(tmp_path):
+    path = tmp_path / 'customers.db'
+    _write_source(pd.DataFrame(customer_rows(10)), path)
+    source = open_row_source(
+        str(path), query="SELECT * FROM customers WHERE \"Billing Account\" > 'BA00005' ORDER BY 1 DESC"
+    )
+    assert source.count_rows() == 5
+    names = [row[0] for row in source.select(['CUSTOMER NAME']).iter_rows(2, 3)]
+    assert names == ['Customer 8', 'Customer 7']
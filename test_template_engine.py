@@ -0,0 +1,64 @@
+import io
+import zipfile
+
+import pytest
+from docx import Document
+
+from template_engine import compile_template, replace_text_in_document
+
+REPLACEMENTS = {
+    '{DATE}': 'March 01, 2026',
+    '{CUSTOMER NAME}': 'Ann & Lee <Ltd>',
+    '{Billing Account}': 'BA00001',
+    '{Outstanding amount in Rs}': '1,234.50',
+    '{Address}': '1 Main Street\nSpringfield',
+}
+
+
+def _members(data):
+    with zipfile.ZipFile(io.BytesIO(data)) as archive:
+        return {name: archive.read(name) for name in archive.namelist()}
+
+
+@pytest.mark.parametrize('in_place', [True, False])
+def test_compiled_template_matches_document_replacement(template_file, in_place):
+    doc = Document(template_file)
+    assert replace_text_in_document(doc, REPLACEMENTS, in_place=in_place)
+    expected = io.BytesIO()
+    doc.save(expected)
+
+    rendered = io.BytesIO()
+    compile_template(template_file, in_place=in_place).save(rendered, REPLACEMENTS)
+    assert _members(rendered.getvalue()) == _members(expected.getvalue())
+
+
+
+@pytest.mark.parametrize('in_place', [True, False])
+def test_placeholder_split_over_differently_formatted_runs(tmp_path, in_place):
+    doc = Document()
+    paragraph = doc.add_paragraph('Account: ')
+    paragraph.add_run('{').bold = True
+    paragraph.add_run('Billing').italic = True
+    paragraph.add_run(' Account')
+    paragraph.add_run('} for {CUSTOMER NAME} and {Billing ')
+    paragraph.add_run('Account}.').underline = True
+    path = str(tmp_path / 'split.docx')
+    doc.save(path)
+
+    expected = Document(path)
+    assert replace_text_in_document(expected, REPLACEMENTS, in_place=in_place)
+    expected_data = io.BytesIO()
+    expected.save(expected_data)
+    rendered = compile_template(path, in_place=in_place).render(REPLACEMENTS)
+    assert _members(rendered) == _members(expected_data.getvalue())
+    assert Document(io.BytesIO(rendered)).paragraphs[0].text == (
+        'Account: BA00001 for Ann & Lee <Ltd> and BA00001.'
+    )
+
+
+@pytest.mark.parametrize('in_place', [True, False])
+def test_unknown_placeholders_are_left_alone(template_file, in_place):
+    rendered = compile_template(template_file, in_place=in_place).render({'{DATE}': 'Today'})
+    text = '\n'.join(paragraph.text for paragraph in Document(io.BytesIO(rendered)).paragraphs)
+    assert 'Date: Today' in text
+    assert 'Dear {CUSTOMER NAME},' in text
@@ -0,0 +1,154 @@
+import csv
+import errno
+import io
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+from pandas.api.types import is_datetime64_any_dtype, is_string_dtype
+
+from grouping import GROUP_PLACEHOLDERS
+from placeholders import AMOUNT_COLUMN, NAME_COLUMN, PlaceholderIndex
+from template_engine import REPEAT_MARKER
+
+# What each pre-flight check reports, by check name
+CHECKS = {
+    'blank': "blank values",
+    'not_a_number': "amounts that aren't numbers (printed as they are)",
+    'not_a_date': "dates that can't be read (printed as they are)",
+    'unsafe_filename': "names with characters Windows doesn't allow in file names",
+    'long_filename': "names too long for a file name",
+    'duplicate_filename': "rows sharing a letter file name (later ones get a _2, _3... suffix)",
+}
+
+# First rows listed for each issue
+SAMPLE_ROWS = 5
+
+# Characters Windows refuses in file names (/ is already replaced by letter_filename)
+_UNSAFE_FILENAME = r'[<>:"\\|?*\x00-\x1f]'
+
+# Longest file name most file systems accept, in bytes
+MAX_FILENAME_BYTES = 255
+
+# Write errors caused by a letter's file name rather than the disk; those
+# rows are quarantined, any other write error stops the run
+FILENAME_ERRNOS = frozenset({errno.ENAMETOOLONG, errno.EINVAL, errno.EILSEQ})
+
+# check, column, number of rows and the first SAMPLE_ROWS 1-based data rows
+PreflightIssue = namedtuple('PreflightIssue', 'check column count rows')
+
+# Quarantine report written for rows that failed to render or write, and its columns
+ERROR_REPORT_NAME = 'errors.csv'
+ERROR_REPORT_FIELDS = ('row', 'file', 'error')
+
+
+class PreflightReport:
+    """Problems found in the data before any letter is rendered.
+
+    missing_placeholders are template placeholders with no matching column
+    (they are left in the letters as they are). issues lists the rows that
+    failed each check, per column.
+    """
+
+    def __init__(self, missing_placeholders):
+        self.missing_placeholders = missing_placeholders
+        self.rows = 0
+        self.issues = []
+
+    def __bool__(self):
+        return bool(self.missing_placeholders or self.issues)
+
+    def lines(self):
+        """The report as printable lines"""
+        lines = [f"Checked {self.rows} rows"]
+        if self.missing_placeholders:
+            lines.append(f"  No column for: {', '.join(self.missing_placeholders)}")
+        for issue in self.issues:
+            rows = ', '.join(str(row) for row in issue.rows)
+            more = ', ...' if issue.count > len(issue.rows) else ''
+            lines.append(f"  {issue.column}: {issue.count} {CHECKS[issue.check]} (rows {rows}{more})")
+        if not self:
+            lines.append("  No problems found")
+        return lines
+
+
+def _blank(series):
+    if series.dtype != object and not is_string_dtype(series.dtype):
+        return series.isna()
+    return series.isna() | series.astype(str).str.strip().eq('')
+
+
+def _unreadable_dates(series):
+    # Each distinct value is parsed once; a date column repeats the same few values
+    codes, values = pd.factorize(series)
+    parsed = pd.to_datetime(pd.Series(values, dtype=object), errors='coerce', format='mixed')
+    return pd.Series(parsed.isna().to_numpy()[codes], index=series.index) | (codes < 0)
+
+
+def preflight(columns, chunks, placeholders):
+    """Check DataFrame chunks against a template's placeholders before generating.
+
+    Every check is a vectorized operation on a whole chunk, so the cost is
+    a few pandas passes per column rather than a render per row. The
+    columns checked are the ones in the chunks; pass the projected source
+    (generation.template_columns) to check just what the letters use.
+    """
+    index = PlaceholderIndex(columns)
+    report = PreflightReport(sorted(
+        placeholder for placeholder in placeholders
+        if placeholder not in index.aliases and placeholder not in GROUP_PLACEHOLDERS
+        and placeholder != REPEAT_MARKER
+    ))
+    date_columns = [column for column in index.columns if 'date' in column.casefold()]
+    found = {}
+    names = []
+
+    def flag(check, column, mask, frame):
+        rows = frame.index[np.asarray(mask, dtype=bool)]
+        if len(rows):
+            count, sample = found.setdefault((check, column), [0, []])
+            found[(check, column)][0] = count + len(rows)
+            sample.extend(int(row) + 1 for row in rows[:SAMPLE_ROWS - len(sample)])
+
+    for frame in chunks:
+        frame = frame.set_axis(index.columns, axis=1)
+        report.rows += len(frame)
+        blanks = {column: _blank(frame[column]) for column in index.columns}
+        for column, blank in blanks.items():
+            flag('blank', column, blank, frame)
+
+        if AMOUNT_COLUMN in blanks:
+            numeric = pd.to_numeric(frame[AMOUNT_COLUMN], errors='coerce')
+            flag('not_a_number', AMOUNT_COLUMN, numeric.isna() & ~blanks[AMOUNT_COLUMN], frame)
+
+        for column in date_columns:
+            if not is_datetime64_any_dtype(frame[column]):
+                flag('not_a_date', column, _unreadable_dates(frame[column]) & ~blanks[column], frame)
+
+        if NAME_COLUMN in blanks:
+            name = frame[NAME_COLUMN].astype(str).where(~blanks[NAME_COLUMN], 'Valued Customer')
+            flag('unsafe_filename', NAME_COLUMN, name.str.contains(_UNSAFE_FILENAME), frame)
+            length = name.str.encode('utf-8').str.len() + len('Letter_.docx')
+            flag('long_filename', NAME_COLUMN, length > MAX_FILENAME_BYTES, frame)
+            names.append(name.str.replace(' ', '_').str.replace('/', '_').str.casefold())
+
+    # File names are compared across the whole range at the end (case-insensitively,
+    # as Windows does when the ZIP is extracted)
+    if names:
+        name = pd.concat(names)
+        flag('duplicate_filename', NAME_COLUMN, name.duplicated(keep=False), name)
+
+    report.issues = [
+        PreflightIssue(check, column, count, sample)
+        for (check, column), (count, sample) in found.items()
+    ]
+    return report
+
+
+def error_report_csv(errors):
+    """CSV text of quarantined rows ({'row', 'file', 'error'} dicts)"""
+    out = io.StringIO()
+    writer = csv.DictWriter(out, ERROR_REPORT_FIELDS, extrasaction='ignore')
+    writer.writeheader()
+    writer.writerows(errors)
+    return out.getvalue()